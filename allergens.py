@@ -0,0 +1,362 @@
+"""
+Limeat - Classification des allergènes des ingrédients, des repas et du texte libre
+
+Chaque allergène correspond à un bit ; un profil, un ingrédient ou un repas se
+résume à un masque entier. Les lignes de ingredients_db.csv et meals.csv sont
+classées une fois (python allergens.py enregistre les masques, rechargés tant
+que les CSV et les termes ne changent pas) ; le texte libre des suggestions
+est analysé par un automate d'Aho-Corasick sur les synonymes des allergènes.
+Filtrer une liste de candidats revient alors à un ET bit à bit vectorisé.
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from nutrition import DATA_DIR, frame_cache
+
+try:
+    import ahocorasick  # pyahocorasick : automate en C, mêmes correspondances
+except ImportError:
+    ahocorasick = None
+
+ARTIFACTS_DIR = Path(os.getenv("LIMEAT_ARTIFACTS_DIR", "var/artifacts"))
+# À incrémenter à chaque modification des termes : invalide les masques enregistrés
+TERMS_VERSION = 1
+
+# Allergènes proposés à l'utilisateur, avec des exemples (page de configuration)
+ALLERGEN_EXAMPLES = {
+    "gluten": ["blé", "orge", "seigle", "avoine"],
+    "lactose": ["lait", "fromage", "yaourt", "crème"],
+    "fruits_a_coque": ["amande", "noix", "noisette", "cajou", "pistache"],
+    "arachides": ["cacahuète", "huile d'arachide"],
+    "soja": ["sauce soja", "tofu", "edamame"],
+    "oeufs": ["oeuf", "mayonnaise", "meringue"],
+    "poisson": ["tous types de poissons"],
+    "crustaces": ["crevette", "crabe", "homard"],
+    "celeri": ["céleri", "céleri-rave"],
+    "moutarde": ["moutarde", "sauce moutarde"],
+    "sesame": ["graines de sésame", "huile de sésame"],
+    "sulfites": ["vin", "fruits secs"],
+}
+ALLERGENS = list(ALLERGEN_EXAMPLES)
+ALLERGEN_BITS = {name: 1 << i for i, name in enumerate(ALLERGENS)}
+MASK_DTYPE = np.uint16
+
+# Synonymes (français et anglais) en plus des exemples ; les pluriels en -s / -x sont ajoutés
+ALLERGEN_TERMS = {
+    "gluten": ["froment", "épeautre", "kamut", "farine", "pain", "pâtes", "semoule", "couscous", "boulgour",
+               "biscuit", "gâteau", "brioche", "croissant", "viennoiserie", "chapelure", "pané", "panure",
+               "gaufre", "gaufrette", "cookie", "seitan", "nouille", "spaghetti", "macaroni", "tagliatelle",
+               "ravioli", "muesli", "bière", "wheat", "barley", "rye", "oat", "spelt", "flour", "bread", "pasta",
+               "semolina", "bulgur", "noodle", "cake", "pastry", "cracker", "beer"],
+    "lactose": ["beurre", "yoghourt", "yogourt", "fromage blanc", "petit suisse", "emmental", "comté", "gruyère",
+                "mozzarella", "parmesan", "camembert", "brie", "roquefort", "feta", "ricotta", "mascarpone",
+                "raclette", "reblochon", "lactosérum", "milk", "cheese", "yogurt", "yoghurt", "cream", "butter",
+                "whey", "lactose"],
+    "fruits_a_coque": ["pécan", "macadamia", "praliné", "noix du brésil", "almond", "walnut", "hazelnut",
+                       "cashew", "pistachio", "pecan", "brazil nut", "nut"],
+    "arachides": ["cacahouète", "peanut", "groundnut"],
+    "soja": ["soja", "tempeh", "miso", "tamari", "soy", "soya"],
+    "oeufs": ["omelette", "aïoli", "béarnaise", "hollandaise", "macaron", "egg", "omelet", "meringue"],
+    "poisson": ["poisson", "thon", "saumon", "cabillaud", "colin", "merlu", "sardine", "maquereau", "truite",
+                "sole", "dorade", "daurade", "hareng", "lieu noir", "églefin", "haddock", "lotte", "merlan",
+                "espadon", "tilapia", "surimi", "nuoc mam", "nuoc man", "fish", "tuna", "salmon", "cod",
+                "mackerel", "trout", "herring", "anchovy", "hake", "pollock", "whiting", "swordfish"],
+    "crustaces": ["langouste", "langoustine", "écrevisse", "gambas", "scampi", "crustacé", "shrimp", "prawn",
+                  "crab", "lobster", "crayfish", "crustacean"],
+    "celeri": ["celery", "celeriac"],
+    "moutarde": ["mustard"],
+    "sesame": ["sésame", "tahini", "tahin", "houmous", "hummus", "gomasio"],
+    "sulfites": ["vinaigre", "vinaigrette", "abricot sec", "raisin sec", "figue sèche", "pruneau", "champagne", "wine",
+                 "vinegar", "dried apricot", "dried fruit", "sulfite", "sulphite"],
+}
+
+# Plats et expressions dont les allergènes ne se lisent pas dans les mots : le terme le plus long
+# l'emporte ("lait de coco" n'est pas du lait, "beurre de cacahuète" relève des arachides)
+COMPOSITE_TERMS = {
+    "quiche": ["gluten", "oeufs", "lactose"], "pizza": ["gluten", "lactose"], "lasagne": ["gluten", "lactose"],
+    "crêpe": ["gluten", "oeufs", "lactose"], "croque monsieur": ["gluten", "lactose"],
+    "cordon bleu": ["gluten", "oeufs", "lactose"], "béchamel": ["gluten", "lactose"], "gratin": ["lactose"],
+    "tarte": ["gluten"], "tartelette": ["gluten"], "sandwich": ["gluten"], "hamburger": ["gluten"],
+    "lait de coco": [], "lait d amande": ["fruits_a_coque"], "lait de soja": ["soja"], "lait d avoine": ["gluten"],
+    "lait de riz": [], "lait végétal": [], "crème de marrons": [], "crème de soja": ["soja"],
+    "yaourt au soja": ["soja"], "yaourt de soja": ["soja"], "dessert au soja": ["soja"],
+    "beurre de cacahuète": ["arachides"], "beurre d arachide": ["arachides"], "beurre de cacao": [],
+    "noix de coco": [], "noix de muscade": [], "noix de saint jacques": [], "noix de veau": [],
+    "blé noir": [], "coconut milk": [], "almond milk": ["fruits_a_coque"], "soy milk": ["soja"],
+    "oat milk": ["gluten"], "rice milk": [], "peanut butter": ["arachides"], "cocoa butter": [],
+}
+
+# Mentions qui retirent un allergène de la ligne entière
+NEGATION_TERMS = {
+    "sans gluten": ["gluten"], "gluten free": ["gluten"], "sans lactose": ["lactose"], "lactose free": ["lactose"],
+    "dairy free": ["lactose"], "sans oeuf": ["oeufs"], "egg free": ["oeufs"],
+}
+
+# Sous-groupes de ingredients_db.csv et meals.csv dont tous les aliments contiennent l'allergène
+SUBGROUP_ALLERGENS = {
+    "laits": ["lactose"], "produits laitiers frais et assimilés": ["lactose"], "fromages et assimilés": ["lactose"],
+    "crèmes et spécialités à base de crème": ["lactose"], "beurres": ["lactose"], "œufs": ["oeufs"],
+    "poissons cuits": ["poisson"], "poissons crus": ["poisson"], "huiles de poissons": ["poisson"],
+    "produits à base de poissons et produits de la mer": ["poisson"],
+    "mollusques et crustacés cuits": ["crustaces"], "mollusques et crustacés crus": ["crustaces"],
+    "pains et assimilés": ["gluten"], "viennoiseries": ["gluten"], "biscuits sucrés": ["gluten"],
+    "biscuits apéritifs": ["gluten"], "gâteaux et pâtisseries": ["gluten"],
+    "pizzas, tartes et crêpes salées": ["gluten"], "sandwichs": ["gluten"],
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Minuscules sans accents ni ponctuation, mots séparés et entourés d'une espace"""
+    text = str(text).lower().replace("œ", "oe").replace("æ", "ae")
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return " " + " ".join(_WORD.findall(text)) + " "
+
+
+def mask_of(allergens: Iterable[str]) -> int:
+    """Masque d'une liste d'allergènes (ex. les allergies d'un profil) ; KeyError si l'un est inconnu"""
+    mask = 0
+    for allergen in allergens:
+        mask |= ALLERGEN_BITS[allergen]
+    return mask
+
+
+def allergens_of(mask: int) -> List[str]:
+    return [name for name, bit in ALLERGEN_BITS.items() if mask & bit]
+
+
+def _variants(term: str) -> List[str]:
+    """Le terme normalisé et son pluriel"""
+    term = normalize(term).strip()
+    if not term:
+        return []
+    plural = term + ("x" if term.endswith(("eau", "eu")) else "s")
+    return [term] if term.endswith(("s", "x")) else [term, plural]
+
+
+class AllergenMatcher:
+    """Automate d'Aho-Corasick sur les termes d'allergènes, limité aux mots entiers"""
+
+    def __init__(self, terms: Dict[str, List[str]] = None, composites: Dict[str, List[str]] = None,
+                 negations: Dict[str, List[str]] = None):
+        # terme normalisé -> (masque ajouté, masque retiré)
+        patterns: Dict[str, Tuple[int, int]] = {}
+        for allergen, words in (ALLERGEN_TERMS if terms is None else terms).items():
+            for word in list(words) + ALLERGEN_EXAMPLES.get(allergen, []):
+                for variant in _variants(word):
+                    set_mask, clear_mask = patterns.get(variant, (0, 0))
+                    patterns[variant] = (set_mask | ALLERGEN_BITS[allergen], clear_mask)
+        for word, allergens in (COMPOSITE_TERMS if composites is None else composites).items():
+            for variant in _variants(word):
+                patterns[variant] = (mask_of(allergens), 0)
+        for word, allergens in (NEGATION_TERMS if negations is None else negations).items():
+            for variant in _variants(word):
+                patterns[variant] = (0, mask_of(allergens))
+        self.patterns = patterns
+        self._build({f" {term} ": value for term, value in patterns.items()})
+
+    def _build(self, padded: Dict[str, Tuple[int, int]]):
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for key, value in padded.items():
+                self._automaton.add_word(key, (len(key), value))
+            self._automaton.make_automaton()
+            return
+        # Trie : transitions, lien d'échec et sorties (longueur, valeurs) de chaque état
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[List[Tuple[int, Tuple[int, int]]]] = [[]]
+        for key, value in padded.items():
+            state = 0
+            for char in key:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(key), value))
+        self._fail = [0] * len(self._goto)
+        # Parcours en largeur : le lien d'échec d'un état pointe vers un état moins profond
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0) if state else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _matches(self, text: str):
+        """(début, fin, (masque ajouté, masque retiré)) de chaque terme trouvé, espaces exclues"""
+        if ahocorasick is not None:
+            for end, (length, value) in self._automaton.iter(text):
+                yield end - length + 2, end, value
+            return
+        state = 0
+        for i, char in enumerate(text):
+            while char not in self._goto[state] and state:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._out[state]:
+                yield i - length + 2, i, value
+
+    def find(self, text: str) -> List[Tuple[str, int, int]]:
+        """Termes retenus (le plus long l'emporte en cas de chevauchement) : (terme, masque ajouté, masque retiré)"""
+        text = normalize(text)
+        matches = sorted(self._matches(text), key=lambda m: (m[0], m[0] - m[1]))
+        kept, last_end = [], -1
+        for start, end, (set_mask, clear_mask) in matches:
+            if start >= last_end:
+                kept.append((text[start:end], set_mask, clear_mask))
+                last_end = end
+        return kept
+
+    def mask(self, text: str) -> int:
+        """Masque des allergènes d'un texte libre"""
+        set_mask = clear_mask = 0
+        for _, added, removed in self.find(text):
+            set_mask |= added
+            clear_mask |= removed
+        return set_mask & ~clear_mask
+
+    def masks(self, texts: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.mask(text) for text in texts), dtype=MASK_DTYPE)
+
+
+@lru_cache(maxsize=None)
+def get_matcher() -> AllergenMatcher:
+    return AllergenMatcher()
+
+
+def safe_mask(masks: np.ndarray, allergies: Iterable[str]) -> np.ndarray:
+    """Booléens des candidats compatibles avec le profil : (masques & profil) == 0"""
+    return (np.asarray(masks, dtype=MASK_DTYPE) & MASK_DTYPE(mask_of(allergies))) == 0
+
+
+def filter_safe(items: Sequence, allergies: Iterable[str], text: Callable = str) -> List:
+    """Éléments dont le texte (`text(item)`) ne contient aucun allergène du profil"""
+    allergies = list(allergies)
+    if not allergies or not items:
+        return list(items)
+    keep = safe_mask(get_matcher().masks(text(item) for item in items), allergies)
+    return [item for item, ok in zip(items, keep) if ok]
+
+
+# Masques précalculés des bases
+class AllergenIndex:
+    """Masque d'allergènes de chaque ligne d'une base, dans l'ordre des lignes"""
+
+    def __init__(self, ids: np.ndarray, masks: np.ndarray):
+        self.ids = np.asarray(ids)
+        self.masks = np.asarray(masks, dtype=MASK_DTYPE)
+        self._index = pd.Index(self.ids)
+
+    def masks_for(self, ids: Sequence) -> np.ndarray:
+        """Masques des identifiants donnés ; KeyError si l'un est inconnu"""
+        rows = self._index.get_indexer(ids)
+        if (rows < 0).any():
+            raise KeyError(f"Unknown ids: {list(np.asarray(ids)[rows < 0])}")
+        return self.masks[rows]
+
+    def safe(self, allergies: Iterable[str]) -> np.ndarray:
+        """Booléens des lignes compatibles avec le profil"""
+        return safe_mask(self.masks, allergies)
+
+
+def classify_rows(texts: Sequence[Sequence[str]], subgroups: Sequence[str]) -> np.ndarray:
+    """Masque de chaque ligne : termes trouvés dans ses textes, plus les allergènes de son sous-groupe"""
+    matcher = get_matcher()
+    masks = np.zeros(len(subgroups), dtype=MASK_DTYPE)
+    for row, (row_texts, subgroup) in enumerate(zip(texts, subgroups)):
+        set_mask = clear_mask = 0
+        for text in row_texts:
+            if isinstance(text, str):
+                for _, added, removed in matcher.find(text):
+                    set_mask |= added
+                    clear_mask |= removed
+        if isinstance(subgroup, str):
+            set_mask |= mask_of(SUBGROUP_ALLERGENS.get(subgroup, []))
+        masks[row] = set_mask & ~clear_mask
+    return masks
+
+
+def build_ingredient_index(ingredients_db: pd.DataFrame) -> AllergenIndex:
+    texts = list(zip(ingredients_db["FoodName"], ingredients_db["EnglishFoodName"]))
+    return AllergenIndex(ingredients_db["FoodID"].to_numpy(),
+                         classify_rows(texts, ingredients_db["FoodSubGroup"].tolist()))
+
+
+def build_meal_index(meals_db: pd.DataFrame) -> AllergenIndex:
+    texts = [(name,) for name in meals_db["alim_nom_fr"]]
+    return AllergenIndex(meals_db["alim_code"].to_numpy(), classify_rows(texts, meals_db["alim_ssgrp_nom_fr"].tolist()))
+
+
+# Fichier source, colonne d'identifiant et fonction de classement de chaque base
+BUILDERS = {
+    "ingredients": ("ingredients_db.csv", "FoodID", build_ingredient_index),
+    "meals": ("meals.csv", "alim_code", build_meal_index),
+}
+
+
+def _artifact_key(csv_path: Path) -> str:
+    digest = hashlib.sha256(csv_path.read_bytes())
+    digest.update(f"terms-v{TERMS_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def save_index(kind: str, data_dir: Path = DATA_DIR, out_dir: Path = ARTIFACTS_DIR) -> Path:
+    """Classe toutes les lignes d'une base ("ingredients" ou "meals") et enregistre ses masques"""
+    from nutrition import load_ingredients_db, load_meals_db
+
+    loaders = {"ingredients": load_ingredients_db, "meals": load_meals_db}
+    csv_name, _, build = BUILDERS[kind]
+    index = build(loaders[kind](data_dir))
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"allergens_{kind}.npz"
+    np.savez(path, ids=index.ids, masks=index.masks, key=_artifact_key(Path(data_dir) / csv_name))
+    return path
+
+
+def save_indexes(data_dir: Path = DATA_DIR, out_dir: Path = ARTIFACTS_DIR) -> Dict[str, Path]:
+    """Classe toutes les lignes des deux bases et enregistre leurs masques (un .npz par base)"""
+    return {kind: save_index(kind, data_dir, out_dir) for kind in BUILDERS}
+
+
+def load_index(kind: str, data_dir: Path = DATA_DIR, out_dir: Path = ARTIFACTS_DIR) -> Optional[AllergenIndex]:
+    """Masques enregistrés par save_indexes, ou None s'ils manquent ou ne correspondent plus au CSV"""
+    path = Path(out_dir) / f"allergens_{kind}.npz"
+    if not path.exists():
+        return None
+    with np.load(path) as saved:
+        if str(saved["key"]) != _artifact_key(Path(data_dir) / BUILDERS[kind][0]):
+            return None
+        return AllergenIndex(saved["ids"], saved["masks"])
+
+
+@frame_cache
+def get_allergen_index(database: pd.DataFrame, kind: str = "ingredients") -> AllergenIndex:
+    """Index d'une base chargée : masques enregistrés s'ils sont à jour, sinon classés au premier appel"""
+    _, id_column, build = BUILDERS[kind]
+    index = load_index(kind)
+    # Masques enregistrés utilisables seulement pour une base lue telle quelle depuis le CSV
+    if index is None or not np.array_equal(index.ids, database[id_column].to_numpy()):
+        index = build(database)
+    return index
+
+
+if __name__ == "__main__":
+    for kind, path in save_indexes().items():
+        index = load_index(kind)
+        counts = {name: int((index.masks & bit != 0).sum()) for name, bit in ALLERGEN_BITS.items()}
+        print(f"{path}: {len(index.ids)} rows, {counts}")
@@ -3,26 +3,35 @@ Limeat - Application complète d'analyse nutritionnelle
 avec gestion des allergies et recommandations de repas
 """
 import streamlit as st
+import copy
 import os
 from dotenv import load_dotenv
 import pandas as pd
-import base64
-import json
-from pathlib import Path
-import anthropic
-from PIL import Image
+from allergens import ALLERGEN_EXAMPLES, filter_safe
+from bilingual_search import get_bilingual_index
+from build_pipeline import stale_artifacts
+from daily_tracker import BREAKFAST_PRESETS, IntakeTracker
+from llm_client import get_llm_client, use_fake_backend
+from meal import Meal
+from meal_vision import analyze_meal
+from nutrition import get_nutrient_table, get_ingredients_db, get_meals_db
+from scoring import NutritionalScorer
+from storage import DEFAULT_PROFILE, get_store, image_sha256
+from substitutions import get_substitutions
+from tracing import current_trace, span, traced
 import plotly.graph_objects as go
 import uuid
-import numpy as np
-from typing import List, Dict, Tuple
+from datetime import date, timedelta
 
 
 # Configuration
 load_dotenv()
 API_KEY = os.getenv("ANTHROPIC_API_KEY")
+# Panneau de débogage : décomposition du temps de chaque requête par étape
+DEBUG_PANEL = os.getenv("LIMEAT_DEBUG", "0") == "1"
 
 # Vérification de la clé API
-if not API_KEY:
+if not API_KEY and not use_fake_backend():
     st.error("🚨 Clé API Anthropic manquante ! Vérifiez votre fichier .env.")
     st.stop()
 
@@ -78,20 +87,7 @@ def show_config_page():
 
 def load_common_allergens():
     """Liste des allergènes courants"""
-    return {
-        "gluten": ["blé", "orge", "seigle", "avoine"],
-        "lactose": ["lait", "fromage", "yaourt", "crème"],
-        "fruits_a_coque": ["amande", "noix", "noisette", "cajou", "pistache"],
-        "arachides": ["cacahuète", "huile d'arachide"],
-        "soja": ["sauce soja", "tofu", "edamame"],
-        "oeufs": ["oeuf", "mayonnaise", "meringue"],
-        "poisson": ["tous types de poissons"],
-        "crustaces": ["crevette", "crabe", "homard"],
-        "celeri": ["céleri", "céleri-rave"],
-        "moutarde": ["moutarde", "sauce moutarde"],
-        "sesame": ["graines de sésame", "huile de sésame"],
-        "sulfites": ["vin", "fruits secs"],
-    }
+    return ALLERGEN_EXAMPLES
 
 def init_session_state():
     """Initialise les variables de session"""
@@ -101,33 +97,13 @@ def init_session_state():
         st.session_state.allergies = []
     if 'breakfast' not in st.session_state:
         st.session_state.breakfast = None
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = "invite"
+    if 'profile' not in st.session_state:
+        st.session_state.profile = dict(DEFAULT_PROFILE, **(get_store().get_profile(st.session_state.user_id) or {}))
     if 'selected_substitutions' not in st.session_state:
         st.session_state.selected_substitutions = {}
 
-def load_substitutions(ingredients_db: pd.DataFrame):
-    """Crée un dictionnaire de substitutions basé sur la base de données"""
-    substitutions = {}
-    groups = ingredients_db.groupby('FoodGroupID')
-    
-    for _, row in ingredients_db.iterrows():
-        group_id = row['FoodGroupID']
-        current_food = row['FoodName']
-        
-        alternatives = groups.get_group(group_id)
-        alternatives = alternatives[alternatives['FoodName'] != current_food]
-        alternatives['nutritional_similarity'] = (
-            (alternatives['203'] - row['203']).abs() +  # Protéines
-            (alternatives['204'] - row['204']).abs() +  # Lipides
-            (alternatives['205'] - row['205']).abs()    # Glucides
-        )
-        alternatives = alternatives.sort_values('nutritional_similarity')
-        alternatives = alternatives['FoodName'].head(3).tolist()
-        
-        if alternatives:
-            substitutions[current_food.lower()] = alternatives
-            
-    return substitutions
-
 def calculate_daily_needs(user_profile):
     """Calcule les besoins journaliers"""
     base_calories = user_profile.get("weight", 70) * 24
@@ -139,165 +115,35 @@ def calculate_daily_needs(user_profile):
         "lipides": (base_calories * 0.30) / 9
     }
 
-def get_remaining_needs(daily_needs, breakfast_details, lunch_details):
-    """Calcule les besoins restants pour le dîner"""
-    consumed = {
-        "calories": breakfast_details.get("calories", 0) + lunch_details.get("calories", 0),
-        "proteines": breakfast_details.get("proteines", 0) + lunch_details.get("proteines", 0),
-        "glucides": breakfast_details.get("glucides", 0) + lunch_details.get("glucides", 0),
-        "lipides": breakfast_details.get("lipides", 0) + lunch_details.get("lipides", 0)
-    }
-    
-    return {k: daily_needs[k] - consumed[k] for k in daily_needs.keys()}
-
 #Analyse de repas
 class MealAnalyzer:
+    @traced("MealAnalyzer.__init__")
     def __init__(self):
         """Initialise l'analyseur avec les bases de données"""
         try:
-            self.client = anthropic.Anthropic(api_key=API_KEY)
-            data_dir = Path("datathon_Schoolab-main/data")
-            self.ingredients_db = pd.read_csv(data_dir / "ingredients_db.csv", sep=';')
-            self.meals_db = pd.read_csv(data_dir / "meals.csv", sep=';')
-            self.substitutions = load_substitutions(self.ingredients_db)
+            self.client = get_llm_client("anthropic")
+            self.ingredients_db = get_ingredients_db()
+            self.meals_db = get_meals_db()
+            self.substitutions = get_substitutions(self.ingredients_db)
+            self.raw_analysis = None
             st.success("✅ Analyseur initialisé avec succès")
         except Exception as e:
             st.error(f"❌ Erreur d'initialisation : {str(e)}")
             raise e
-    import numpy as np
-from typing import List, Dict, Tuple
-
-class Ingredient:
-    def __init__(self, id: int, gQuantity: float, groupId: int = None):
-        self.id = id
-        self.gQuantity = gQuantity
-        self.groupId = groupId
-
-class NutritionalScorer:
-    def __init__(self, ingredients_db: pd.DataFrame, user_profile: Dict):
-        """Initialise le calculateur nutritionnel avec la base d'ingrédients et le profil utilisateur"""
-        self.ingredients_db = ingredients_db
-        self.user_profile = user_profile
-
-        self.nut_dict = {
-            '203': "Protéines", '204': "Lipides", '205': "Glucides", 
-            '208': "Energie", '291': "Fibres", '601': "Cholesterol", 
-            '255': "Eau", '269': "Sucres", '810': "Amidon"
-        }
-
-    def analyze_meal_nutritional_score(self, ingredients: List[Dict]) -> Dict:
-        """Analyse le score nutritionnel du repas"""
-        meal_ingredients = [Ingredient(id=ing['id'], gQuantity=ing.get('quantite', 100)) for ing in ingredients]
-        nutrients = self.get_nutrients_from_meal(meal_ingredients)
-        meal_nut_score, meal_energy_sub_score, meal_macro_sub_score = self._compute_meal_score(meal_ingredients, nutrients)
-
-        return {
-            'nutritional_score': meal_nut_score,
-            'energy_subscore': meal_energy_sub_score,
-            'macro_subscore': meal_macro_sub_score,
-            'nutrient_details': {self.nut_dict.get(k, k): v for k, v in nutrients.items()}
-        }
-
-    def _compute_meal_score(self, current_meal: List[Ingredient], summed_nutrients_info: Dict) -> Tuple[float, float, float]:
-        """Calcule le score nutritionnel global d'un repas"""
-        for ingredient in current_meal:
-            ingredient.groupId = self.ingredients_db.loc[self.ingredients_db['FoodID'] == ingredient.id, 'FoodGroupID'].values[0]
-
-        meal_energy_sub_score = self.compute_daily_energy_sub_score(summed_nutrients_info)
-        meal_macro_sub_score = self.compute_daily_macro_sub_score(current_meal, summed_nutrients_info)
-
-        meal_nut_sum = (1/3) * meal_energy_sub_score + (2/3) * meal_macro_sub_score
-        meal_nut_score = self.sigmoid_piecewise(meal_nut_sum, k1=5, k2=7.5, x0=0.5)
-
-        return meal_nut_score, meal_energy_sub_score, meal_macro_sub_score
-
-class ExtendedMealAnalyzer(MealAnalyzer):
-    def __init__(self):
-        super().__init__()
-
-        default_user_profile = {
-            "age": 35,
-            "weight": 70,
-            "size": 170,
-            "activityLevel": 1.4
-        }
-
-        self.nutritional_scorer = NutritionalScorer(self.ingredients_db, default_user_profile)
-
-    def analyze_meal_image(self, image_data):
-        """Ajoute une analyse nutritionnelle avancée et recommandations de repas"""
-        result = super().analyze_meal_image(image_data)
-        if result and 'ingredients' in result:
-            nutritional_analysis = self.nutritional_scorer.analyze_meal_nutritional_score([
-                {
-                    'id': self.ingredients_db[self.ingredients_db['FoodName'].str.lower() == ing['nom'].lower()]['FoodID'].values[0],
-                    'quantite': ing['quantite']
-                } for ing in result['ingredients']
-            ])
-            result['nutritional_score'] = {
-                'total_score': nutritional_analysis['nutritional_score'],
-                'energy_subscore': nutritional_analysis['energy_subscore'],
-                'macro_subscore': nutritional_analysis['macro_subscore']
-            }
-
-        return result
-    
 
+    @traced()
     def analyze_meal_image(self, image_data):
         """Analyse une image de repas"""
         try:
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-
-            prompt = """Analyse cette image de repas et retourne uniquement du JSON au format suivant :
-            {
-                "ingredients": [{"nom": "ingredient", "quantite": nombre_grammes}],
-                "valeurs_nutritionnelles": {
-                    "calories": nombre,
-                    "proteines": nombre_g,
-                    "glucides": nombre_g,
-                    "lipides": nombre_g,
-                    "fibres": nombre_g
-                },
-                "analyse": {
-                    "points_forts": ["point1", "point2"],
-                    "points_faibles": ["point1", "point2"],
-                    "description": "explication détaillée"
-                },
-                "suggestions": {
-                    "ajouts": [{"ingredient": "nom", "raison": "explication"}],
-                    "remplacements": [{"remplacer": "ingredient", "par": "alternative", "raison": "explication"}]
-                },
-                "repas_soir": [
-                    {"nom": "nom du plat", "description": "description", "raison": "complémentarité avec le repas de midi"}
-                ]
-            }"""
-
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }]
-            )
-
-            response_text = response.content[0].text.strip()
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            result = json.loads(response_text)
+            # Photo déjà analysée pour cet utilisateur : analyse relue, sans appel au modèle de vision
+            analysis = get_store().find_analysis(st.session_state.user_id, image_sha256(image_data))
+            if analysis is None:
+                # Appel au modèle de vision (coalescé), réponse validée par le schéma
+                analysis = analyze_meal(image_data, self.client)
+            # Réponse brute, enregistrée telle quelle dans l'historique : le filtrage des allergies
+            # et les besoins du jour sont recalculés sur une copie à chaque analyse
+            self.raw_analysis = analysis
+            result = copy.deepcopy(analysis)
             
             # Vérifier les allergies
             if st.session_state.allergies:
@@ -312,52 +158,105 @@ class ExtendedMealAnalyzer(MealAnalyzer):
             st.error(f"🚨 Erreur d'analyse : {str(e)}")
             return None
 
+    @traced()
     def filter_allergenic_suggestions(self, result):
-        """Filtre les suggestions selon les allergies"""
+        """Filtre les suggestions selon les allergies (allergènes reconnus dans le nom des ingrédients)"""
         allergies = st.session_state.allergies
         filtered_result = result.copy()
+        filtered_result['suggestions'] = dict(result['suggestions'])
         
         # Filtrer les suggestions d'ajouts
-        filtered_result['suggestions']['ajouts'] = [
-            sugg for sugg in result['suggestions']['ajouts']
-            if not any(allergen in sugg['ingredient'].lower() 
-                      for allergen in allergies)
-        ]
+        filtered_result['suggestions']['ajouts'] = filter_safe(
+            result['suggestions']['ajouts'], allergies, text=lambda sugg: sugg['ingredient']
+        )
         
         # Filtrer les suggestions de remplacements
-        filtered_result['suggestions']['remplacements'] = [
-            sugg for sugg in result['suggestions']['remplacements']
-            if not any(allergen in sugg['par'].lower() 
-                      for allergen in allergies)
-        ]
+        filtered_result['suggestions']['remplacements'] = filter_safe(
+            result['suggestions']['remplacements'], allergies, text=lambda sugg: sugg['par']
+        )
         
         return filtered_result
 
+    @traced()
     def enrich_with_daily_needs(self, result):
         """Enrichit le résultat avec les calculs de besoins journaliers"""
-        # Récupérer le petit-déjeuner
-        breakfast_details = {
-            "continental": {"calories": 400, "proteines": 8, "glucides": 65, "lipides": 12},
-            "complet": {"calories": 600, "proteines": 20, "glucides": 45, "lipides": 25},
-            "healthy": {"calories": 350, "proteines": 15, "glucides": 50, "lipides": 8},
-            "vegan": {"calories": 380, "proteines": 12, "glucides": 60, "lipides": 10}
-        }.get(st.session_state.breakfast, {"calories": 0, "proteines": 0, "glucides": 0, "lipides": 0})
+        # Journal de l'utilisateur, rechargé depuis l'historique de la semaine à l'ouverture de la session
+        user_id = st.session_state.user_id
+        if 'intake' not in st.session_state:
+            st.session_state.intake = IntakeTracker(get_nutrient_table(self.ingredients_db))
+            get_store().fill_tracker(st.session_state.intake, user_id, date.today() - timedelta(days=6), date.today())
+        # Petit-déjeuner et déjeuner remplacent les valeurs précédentes du jour
+        breakfast = BREAKFAST_PRESETS.get(st.session_state.breakfast, {})
+        ledger = st.session_state.intake.day()
+        ledger.set_nutrients("petit-dejeuner", breakfast)
+        ledger.set_nutrients("dejeuner", result['valeurs_nutritionnelles'])
+        get_store().add_meal(user_id, "petit-dejeuner", breakfast)
 
         # Calculer les besoins restants
-        user_profile = {"weight": 70, "activity_level": 1.4}  # À personnaliser selon l'utilisateur
+        profile = st.session_state.profile
+        user_profile = {"weight": profile["weight"], "activity_level": profile["activityLevel"]}
         daily_needs = calculate_daily_needs(user_profile)
-        remaining_needs = get_remaining_needs(
-            daily_needs,
-            breakfast_details,
-            result['valeurs_nutritionnelles']
-        )
-        
-        result['besoins_restants'] = remaining_needs
+        result['besoins_restants'] = ledger.remaining_needs(daily_needs)
+        return result
+
+class ExtendedMealAnalyzer(MealAnalyzer):
+    def __init__(self):
+        super().__init__()
+        self.nutritional_scorer = NutritionalScorer(self.ingredients_db, st.session_state.profile)
+
+    @traced()
+    def analyze_meal_image(self, image_data):
+        """Ajoute une analyse nutritionnelle avancée et recommandations de repas"""
+        result = super().analyze_meal_image(image_data)
+        if result and 'ingredients' in result:
+            unknown = []
+            with span("resolve_food_ids", ingredients=len(result['ingredients'])):
+                # Noms absents de la base (variantes, pluriels, anglais) : index bilingue local ;
+                # les noms qu'il ne reconnaît pas non plus sont écartés du score
+                meal = Meal.from_vision(result, self.ingredients_db,
+                                        resolve=lambda name: get_bilingual_index(self.ingredients_db).resolve(name),
+                                        unknown=unknown)
+            if unknown:
+                st.warning(f"⚠️ Ingrédients non reconnus, ignorés dans le score : {', '.join(unknown)}")
+            score = None
+            if len(meal):
+                nutritional_analysis = self.nutritional_scorer.analyze_meal_nutritional_score(meal)
+                score = nutritional_analysis['nutritional_score']
+                result['nutritional_score'] = {
+                    'total_score': nutritional_analysis['nutritional_score'],
+                    'energy_subscore': nutritional_analysis['energy_subscore'],
+                    'macro_subscore': nutritional_analysis['macro_subscore']
+                }
+
+            # Historique : le déjeuner analysé remplace celui déjà enregistré pour aujourd'hui
+            get_store().add_meal(
+                st.session_state.user_id, "dejeuner", result['valeurs_nutritionnelles'],
+                score=score, image_hash=image_sha256(image_data),
+                ingredients=[{'id': item.id, 'quantite': item.gQuantity} for item in meal],
+                analysis=self.raw_analysis
+            )
+
         return result
 
 def show_config_page():
     """Affiche la page de configuration"""
     st.title("🔧 Configuration de votre profil")
+
+    # Identifiant : profil et historique des repas sont conservés d'une visite à l'autre
+    user_id = st.text_input("👤 Identifiant", value=st.session_state.user_id).strip() or "invite"
+    if user_id != st.session_state.user_id:
+        st.session_state.user_id = user_id
+        st.session_state.profile = dict(DEFAULT_PROFILE, **(get_store().get_profile(user_id) or {}))
+        st.session_state.pop('intake', None)
+    profile = st.session_state.profile
+
+    # Section morphologie
+    st.header("🧍 Morphologie et activité")
+    profile["age"] = st.number_input("Âge", min_value=10, max_value=110, value=int(profile["age"]))
+    profile["weight"] = st.number_input("Poids (kg)", min_value=30.0, max_value=250.0, value=float(profile["weight"]))
+    profile["size"] = st.number_input("Taille (cm)", min_value=120.0, max_value=230.0, value=float(profile["size"]))
+    profile["activityLevel"] = st.slider("Niveau d'activité", min_value=1.2, max_value=2.0,
+                                         value=float(profile["activityLevel"]), step=0.1)
     
     # Section allergies
     st.header("🚫 Allergies et intolérances")
@@ -367,6 +266,7 @@ def show_config_page():
     for allergen, examples in allergens.items():
         if st.checkbox(
             f"{allergen.replace('_', ' ').title()}", 
+            value=allergen in profile["allergies"],
             help=f"Exemples: {', '.join(examples)}"
         ):
             selected_allergies.append(allergen)
@@ -386,15 +286,19 @@ def show_config_page():
     breakfast = st.selectbox(
         "Qu'avez-vous mangé ce matin ?",
         options=list(breakfast_options.keys()),
+        index=list(breakfast_options).index(profile["breakfast"]) if profile["breakfast"] in breakfast_options else 0,
         format_func=lambda x: breakfast_options[x]
     )
     
     st.session_state.breakfast = breakfast
     
     if st.button("Continuer vers l'analyse de repas ➡️"):
+        profile.update(allergies=selected_allergies, breakfast=breakfast)
+        get_store().save_profile(user_id, profile)
         st.session_state.page = 'analysis'
         st.rerun()
 
+@traced()
 def display_results(result, analyzer):
     """Affiche les résultats de l'analyse"""
     try:
@@ -419,26 +323,27 @@ def display_results(result, analyzer):
                 )
 
         # Graphique des macronutriments
-        fig = go.Figure(data=[
-            go.Bar(
-                x=['Protéines', 'Glucides', 'Lipides'],
-                y=[
-                    result['valeurs_nutritionnelles']['proteines'],
-                    result['valeurs_nutritionnelles']['glucides'],
-                    result['valeurs_nutritionnelles']['lipides']
-                ],
-                text=[f"{val:.1f}g" for val in [
-                    result['valeurs_nutritionnelles']['proteines'],
-                    result['valeurs_nutritionnelles']['glucides'],
-                    result['valeurs_nutritionnelles']['lipides']
-                ]],
-                textposition='auto',
-            )
-        ])
+        with span("plotly_chart"):
+            fig = go.Figure(data=[
+                go.Bar(
+                    x=['Protéines', 'Glucides', 'Lipides'],
+                    y=[
+                        result['valeurs_nutritionnelles']['proteines'],
+                        result['valeurs_nutritionnelles']['glucides'],
+                        result['valeurs_nutritionnelles']['lipides']
+                    ],
+                    text=[f"{val:.1f}g" for val in [
+                        result['valeurs_nutritionnelles']['proteines'],
+                        result['valeurs_nutritionnelles']['glucides'],
+                        result['valeurs_nutritionnelles']['lipides']
+                    ]],
+                    textposition='auto',
+                )
+            ])
         
-        fig.update_layout(title="Répartition des Macronutriments", yaxis_title="Grammes")
-        unique_key = f"macronutrients_chart_{uuid.uuid4().hex[:8]}"
-        st.plotly_chart(fig, use_container_width=True, key=unique_key)
+            fig.update_layout(title="Répartition des Macronutriments", yaxis_title="Grammes")
+            unique_key = f"macronutrients_chart_{uuid.uuid4().hex[:8]}"
+            st.plotly_chart(fig, use_container_width=True, key=unique_key)
 
         # Analyse détaillée
         with st.expander("📝 Analyse détaillée", expanded=True):
@@ -465,6 +370,16 @@ def display_results(result, analyzer):
         st.error(f"❌ Erreur d'affichage : {str(e)}")
         st.write("DEBUG - Structure des résultats:", result)
 
+def show_trace_panel(traces):
+    """Affiche dans la sidebar le temps passé dans chaque étape des dernières requêtes"""
+    with st.sidebar:
+        st.subheader("⏱️ Débogage : étapes")
+        for i, trace in enumerate(traces):
+            with st.expander(f"{trace.root.name} — {trace.duration_ms:.0f} ms", expanded=i == 0):
+                st.dataframe(pd.DataFrame(trace.breakdown()), hide_index=True)
+                if trace.profile:
+                    st.caption(f"Profil : {trace.profile}")
+
 def main():
     st.set_page_config(
         page_title="Limeat - Analyse Nutritionnelle",
@@ -474,6 +389,11 @@ def main():
     
     # Initialiser l'état de session
     init_session_state()
+
+    # Artefacts dérivés des données périmés : l'application les recalcule en mémoire, plus lentement
+    stale = stale_artifacts()
+    if stale:
+        st.sidebar.caption(f"⚠️ Artefacts à reconstruire (python build_pipeline.py) : {', '.join(stale)}")
     
     if st.session_state.page == 'config':
         show_config_page()
@@ -510,7 +430,7 @@ def main():
             if uploaded_file:
                 st.image(uploaded_file, caption="📷 Votre repas", use_column_width=True)
         
-        with col2:
+        with col2, span("analysis_page"):
             if uploaded_file and st.button("🔍 Analyser le repas"):
                 analyzer = ExtendedMealAnalyzer()
                 result = analyzer.analyze_meal_image(uploaded_file.getvalue())
@@ -520,6 +440,11 @@ def main():
             
             if 'analysis_result' in st.session_state and 'current_analyzer' in st.session_state:
                 display_results(st.session_state.analysis_result, st.session_state.current_analyzer)
+            trace = current_trace()
+
+        if DEBUG_PANEL:
+            st.session_state.traces = ([trace] + st.session_state.get('traces', []))[:5]
+            show_trace_panel(st.session_state.traces)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
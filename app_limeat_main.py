@@ -6,10 +6,13 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 import pandas as pd
-import base64
-import json
-from pathlib import Path
-import anthropic
+from allergens import ALLERGEN_EXAMPLES, filter_safe
+from build_pipeline import stale_artifacts
+from llm_client import get_llm_client, use_fake_backend
+from meal_vision import analyze_meal
+from nutrition import get_ingredients_db, get_meals_db
+from storage import DEFAULT_PROFILE, get_store
+from substitutions import get_substitutions
 from PIL import Image
 import plotly.graph_objects as go
 import uuid
@@ -19,7 +22,7 @@ load_dotenv()
 API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
 # Vérification de la clé API
-if not API_KEY:
+if not API_KEY and not use_fake_backend():
     st.error("🚨 Clé API Anthropic manquante ! Vérifiez votre fichier .env.")
     st.stop()
 
@@ -75,20 +78,7 @@ def show_config_page():
 
 def load_common_allergens():
     """Liste des allergènes courants"""
-    return {
-        "gluten": ["blé", "orge", "seigle", "avoine"],
-        "lactose": ["lait", "fromage", "yaourt", "crème"],
-        "fruits_a_coque": ["amande", "noix", "noisette", "cajou", "pistache"],
-        "arachides": ["cacahuète", "huile d'arachide"],
-        "soja": ["sauce soja", "tofu", "edamame"],
-        "oeufs": ["oeuf", "mayonnaise", "meringue"],
-        "poisson": ["tous types de poissons"],
-        "crustaces": ["crevette", "crabe", "homard"],
-        "celeri": ["céleri", "céleri-rave"],
-        "moutarde": ["moutarde", "sauce moutarde"],
-        "sesame": ["graines de sésame", "huile de sésame"],
-        "sulfites": ["vin", "fruits secs"],
-    }
+    return ALLERGEN_EXAMPLES
 
 def init_session_state():
     """Initialise les variables de session"""
@@ -98,6 +88,10 @@ def init_session_state():
         st.session_state.allergies = []
     if 'breakfast' not in st.session_state:
         st.session_state.breakfast = None
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = "invite"
+    if 'profile' not in st.session_state:
+        st.session_state.profile = dict(DEFAULT_PROFILE, **(get_store().get_profile(st.session_state.user_id) or {}))
     if 'selected_substitutions' not in st.session_state:
         st.session_state.selected_substitutions = {}
 
@@ -110,11 +104,10 @@ class MealAnalyzer:
     def __init__(self):
         """Initialise l'analyseur avec les bases de données"""
         try:
-            self.client = anthropic.Anthropic(api_key=API_KEY)
-            data_dir = Path("datathon_Schoolab-main/data")
-            self.ingredients_db = pd.read_csv(data_dir / "ingredients_db.csv", sep=';')
-            self.meals_db = pd.read_csv(data_dir / "meals.csv", sep=';')
-            self.substitutions = load_substitutions(self.ingredients_db)
+            self.client = get_llm_client("anthropic")
+            self.ingredients_db = get_ingredients_db()
+            self.meals_db = get_meals_db()
+            self.substitutions = get_substitutions(self.ingredients_db)
             st.success("✅ Analyseur initialisé avec succès")
         except Exception as e:
             st.error(f"❌ Erreur d'initialisation : {str(e)}")
@@ -123,58 +116,8 @@ class MealAnalyzer:
     def analyze_meal_image(self, image_data):
         """Analyse une image de repas"""
         try:
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-
-            prompt = """Analyse cette image de repas et retourne uniquement du JSON au format suivant :
-            {
-                "ingredients": [{"nom": "ingredient", "quantite": nombre_grammes}],
-                "valeurs_nutritionnelles": {
-                    "calories": nombre,
-                    "proteines": nombre_g,
-                    "glucides": nombre_g,
-                    "lipides": nombre_g,
-                    "fibres": nombre_g
-                },
-                "analyse": {
-                    "points_forts": ["point1", "point2"],
-                    "points_faibles": ["point1", "point2"],
-                    "description": "explication détaillée"
-                },
-                "suggestions": {
-                    "ajouts": [{"ingredient": "nom", "raison": "explication"}],
-                    "remplacements": [{"remplacer": "ingredient", "par": "alternative", "raison": "explication"}]
-                },
-                "repas_soir": [
-                    {"nom": "nom du plat", "description": "description", "raison": "complémentarité avec le repas de midi"}
-                ]
-            }"""
-
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }]
-            )
-
-            response_text = response.content[0].text.strip()
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            result = json.loads(response_text)
+            # Appel au modèle de vision (coalescé), réponse validée par le schéma
+            result = analyze_meal(image_data, self.client)
             
             # Vérifier les allergies
             if st.session_state.allergies:
@@ -198,30 +141,6 @@ class MealAnalyzer:
             return None
 
 
-def load_substitutions(ingredients_db: pd.DataFrame):
-    """Crée un dictionnaire de substitutions basé sur la base de données"""
-    substitutions = {}
-    groups = ingredients_db.groupby('FoodGroupID')
-    
-    for _, row in ingredients_db.iterrows():
-        group_id = row['FoodGroupID']
-        current_food = row['FoodName']
-        
-        alternatives = groups.get_group(group_id)
-        alternatives = alternatives[alternatives['FoodName'] != current_food]
-        alternatives['nutritional_similarity'] = (
-            (alternatives['203'] - row['203']).abs() +  # Protéines
-            (alternatives['204'] - row['204']).abs() +  # Lipides
-            (alternatives['205'] - row['205']).abs()    # Glucides
-        )
-        alternatives = alternatives.sort_values('nutritional_similarity')
-        alternatives = alternatives['FoodName'].head(3).tolist()
-        
-        if alternatives:
-            substitutions[current_food.lower()] = alternatives
-            
-    return substitutions
-
 def calculate_daily_needs(user_profile):
     """Calcule les besoins journaliers"""
     base_calories = user_profile.get("weight", 70) * 24
@@ -249,11 +168,10 @@ class MealAnalyzer:
     def __init__(self):
         """Initialise l'analyseur avec les bases de données"""
         try:
-            self.client = anthropic.Anthropic(api_key=API_KEY)
-            data_dir = Path("datathon_Schoolab-main/data")
-            self.ingredients_db = pd.read_csv(data_dir / "ingredients_db.csv", sep=';')
-            self.meals_db = pd.read_csv(data_dir / "meals.csv", sep=';')
-            self.substitutions = load_substitutions(self.ingredients_db)
+            self.client = get_llm_client("anthropic")
+            self.ingredients_db = get_ingredients_db()
+            self.meals_db = get_meals_db()
+            self.substitutions = get_substitutions(self.ingredients_db)
             st.success("✅ Analyseur initialisé avec succès")
         except Exception as e:
             st.error(f"❌ Erreur d'initialisation : {str(e)}")
@@ -262,58 +180,8 @@ class MealAnalyzer:
     def analyze_meal_image(self, image_data):
         """Analyse une image de repas"""
         try:
-            base64_image = base64.b64encode(image_data).decode('utf-8')
-
-            prompt = """Analyse cette image de repas et retourne uniquement du JSON au format suivant :
-            {
-                "ingredients": [{"nom": "ingredient", "quantite": nombre_grammes}],
-                "valeurs_nutritionnelles": {
-                    "calories": nombre,
-                    "proteines": nombre_g,
-                    "glucides": nombre_g,
-                    "lipides": nombre_g,
-                    "fibres": nombre_g
-                },
-                "analyse": {
-                    "points_forts": ["point1", "point2"],
-                    "points_faibles": ["point1", "point2"],
-                    "description": "explication détaillée"
-                },
-                "suggestions": {
-                    "ajouts": [{"ingredient": "nom", "raison": "explication"}],
-                    "remplacements": [{"remplacer": "ingredient", "par": "alternative", "raison": "explication"}]
-                },
-                "repas_soir": [
-                    {"nom": "nom du plat", "description": "description", "raison": "complémentarité avec le repas de midi"}
-                ]
-            }"""
-
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }]
-            )
-
-            response_text = response.content[0].text.strip()
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start >= 0 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
-            
-            result = json.loads(response_text)
+            # Appel au modèle de vision (coalescé), réponse validée par le schéma
+            result = analyze_meal(image_data, self.client)
             
             # Vérifier les allergies
             if st.session_state.allergies:
@@ -329,23 +197,20 @@ class MealAnalyzer:
             return None
 
     def filter_allergenic_suggestions(self, result):
-        """Filtre les suggestions selon les allergies"""
+        """Filtre les suggestions selon les allergies (allergènes reconnus dans le nom des ingrédients)"""
         allergies = st.session_state.allergies
         filtered_result = result.copy()
+        filtered_result['suggestions'] = dict(result['suggestions'])
         
         # Filtrer les suggestions d'ajouts
-        filtered_result['suggestions']['ajouts'] = [
-            sugg for sugg in result['suggestions']['ajouts']
-            if not any(allergen in sugg['ingredient'].lower() 
-                      for allergen in allergies)
-        ]
+        filtered_result['suggestions']['ajouts'] = filter_safe(
+            result['suggestions']['ajouts'], allergies, text=lambda sugg: sugg['ingredient']
+        )
         
         # Filtrer les suggestions de remplacements
-        filtered_result['suggestions']['remplacements'] = [
-            sugg for sugg in result['suggestions']['remplacements']
-            if not any(allergen in sugg['par'].lower() 
-                      for allergen in allergies)
-        ]
+        filtered_result['suggestions']['remplacements'] = filter_safe(
+            result['suggestions']['remplacements'], allergies, text=lambda sugg: sugg['par']
+        )
         
         return filtered_result
 
@@ -360,7 +225,8 @@ class MealAnalyzer:
         }.get(st.session_state.breakfast, {"calories": 0, "proteines": 0, "glucides": 0, "lipides": 0})
 
         # Calculer les besoins restants
-        user_profile = {"weight": 70, "activity_level": 1.4}  # À personnaliser selon l'utilisateur
+        profile = st.session_state.profile
+        user_profile = {"weight": profile["weight"], "activity_level": profile["activityLevel"]}
         daily_needs = calculate_daily_needs(user_profile)
         remaining_needs = get_remaining_needs(
             daily_needs,
@@ -374,6 +240,21 @@ class MealAnalyzer:
 def show_config_page():
     """Affiche la page de configuration"""
     st.title("🔧 Configuration de votre profil")
+
+    # Identifiant : le profil est conservé d'une visite à l'autre
+    user_id = st.text_input("👤 Identifiant", value=st.session_state.user_id).strip() or "invite"
+    if user_id != st.session_state.user_id:
+        st.session_state.user_id = user_id
+        st.session_state.profile = dict(DEFAULT_PROFILE, **(get_store().get_profile(user_id) or {}))
+    profile = st.session_state.profile
+
+    # Section morphologie
+    st.header("🧍 Morphologie et activité")
+    profile["age"] = st.number_input("Âge", min_value=10, max_value=110, value=int(profile["age"]))
+    profile["weight"] = st.number_input("Poids (kg)", min_value=30.0, max_value=250.0, value=float(profile["weight"]))
+    profile["size"] = st.number_input("Taille (cm)", min_value=120.0, max_value=230.0, value=float(profile["size"]))
+    profile["activityLevel"] = st.slider("Niveau d'activité", min_value=1.2, max_value=2.0,
+                                         value=float(profile["activityLevel"]), step=0.1)
     
     # Section allergies
     st.header("🚫 Allergies et intolérances")
@@ -383,6 +264,7 @@ def show_config_page():
     for allergen, examples in allergens.items():
         if st.checkbox(
             f"{allergen.replace('_', ' ').title()}", 
+            value=allergen in profile["allergies"],
             help=f"Exemples: {', '.join(examples)}"
         ):
             selected_allergies.append(allergen)
@@ -402,12 +284,15 @@ def show_config_page():
     breakfast = st.selectbox(
         "Qu'avez-vous mangé ce matin ?",
         options=list(breakfast_options.keys()),
+        index=list(breakfast_options).index(profile["breakfast"]) if profile["breakfast"] in breakfast_options else 0,
         format_func=lambda x: breakfast_options[x]
     )
     
     st.session_state.breakfast = breakfast
     
     if st.button("Continuer vers l'analyse de repas ➡️"):
+        profile.update(allergies=selected_allergies, breakfast=breakfast)
+        get_store().save_profile(user_id, profile)
         st.session_state.page = 'analysis'
         st.rerun()
 
@@ -508,6 +393,11 @@ def main():
     
     # Initialiser l'état de session
     init_session_state()
+
+    # Artefacts dérivés des données périmés : l'application les recalcule en mémoire, plus lentement
+    stale = stale_artifacts()
+    if stale:
+        st.sidebar.caption(f"⚠️ Artefacts à reconstruire (python build_pipeline.py) : {', '.join(stale)}")
     
     if st.session_state.page == 'config':
         show_config_page()
@@ -0,0 +1,272 @@
+"""
+Limeat - Micro-benchmarks des chemins chauds : chargement CSV, substitutions,
+scores nutritionnels, recherche d'ingrédients et parsing des réponses LLM
+
+Graines fixes, embeddings hachés et backend LLM hors-ligne par défaut : les
+résultats ne dépendent ni du réseau ni d'une clé API. Mesure par benchmark :
+temps mur (min / médiane / moyenne), pic d'allocations Python (tracemalloc)
+et pic de RSS du processus.
+
+Usage :
+    python benchmarks/bench_hot_paths.py --save benchmarks/baselines/hot_paths.json
+    python benchmarks/bench_hot_paths.py --compare benchmarks/baselines/hot_paths.json
+    python benchmarks/bench_hot_paths.py --filter scoring --repeat 100
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import food_search  # noqa: E402
+from bilingual_search import BilingualFoodIndex  # noqa: E402
+from cooccurrence import english_name  # noqa: E402
+from dish_lsh import DishIndex  # noqa: E402
+from fuzzy_index import TrigramIndex  # noqa: E402
+import scoring_kernels  # noqa: E402
+from fixtures import USER_MEALS, user_meal, user_meals, userProfile  # noqa: E402
+from llm_client import FakeBackend, set_llm_backend  # noqa: E402
+import local_suggestions  # noqa: E402
+from main import get_ai_suggestions  # noqa: E402
+from meal import Meal, MealLog  # noqa: E402
+from meal_vision import analyze_meal  # noqa: E402
+from nutrition import load_ingredients_db, load_meals_db  # noqa: E402
+from scoring import NutritionalScorer, compute_daily_score, compute_meal_score  # noqa: E402
+from substitutions import load_substitutions  # noqa: E402
+from telemetry import PromptTelemetry  # noqa: E402
+
+SEED = 0
+
+SEARCH_QUERIES = ["apple", "rice", "chicken breast", "olive oil", "tomato", "ground beef",
+                  "spaghetti", "carrot", "plain yogurt", "red kidney beans"]
+# Noms à la façon du modèle de vision : exacts, variantes, fautes de frappe
+VISION_NAMES = ["Avocat, cru", "AVOCATS CRUS", "Tomatte crue", "Huille d'olive", "Brocolis cuits",
+                "Pain complet", "Riz blanc cuit", "Poulet rôti", "Pome de terre", "Oeuf dur"]
+
+_FAKE_RESPONSES = {
+    "gpt-4": json.dumps({"dish_name": "Chili con carne", "add_calories": ["riz", "avocat"],
+                         "remove_calories": ["fromage"], "add_health": ["poivron"],
+                         "remove_health": ["crème"]}),
+    "claude-3-opus-20240229": json.dumps({
+        "ingredients": [{"nom": "Riz blanc, cuit, non salé", "quantite": 150},
+                        {"nom": "Haricot rouge, cuit", "quantite": 130}],
+        "valeurs_nutritionnelles": {"calories": 450, "proteines": 20, "glucides": 60, "lipides": 12, "fibres": 6},
+        "suggestions": {"ajouts": [{"ingredient": "poivron", "raison": "fibres"}],
+                        "remplacements": [{"remplacer": "crème", "par": "yaourt", "raison": "lipides"}]}}),
+}
+
+Benchmark = Tuple[str, Callable[[], object], int]
+
+
+def _fake_responder(messages, model):
+    text = _FAKE_RESPONSES[model]
+    # Réponse pré-remplie (mode texte) : le modèle ne renvoie que la suite
+    prefill = messages[-1]["content"] if messages[-1]["role"] == "assistant" else ""
+    return text[len(prefill):]
+
+
+def peak_rss_mib() -> Optional[float]:
+    """Pic de RSS du processus depuis son démarrage (None hors Unix)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _clear_search_caches():
+    food_search.result_cache.clear()
+    food_search.embedding_cache.clear()
+
+
+def _synthetic_recipes(ingredients_db: pd.DataFrame, n: int = 20_000) -> pd.DataFrame:
+    """Recettes tirées au hasard parmi les noms anglais de la base (recipesDataset n'est pas fourni)"""
+    rng = np.random.default_rng(SEED)
+    names = sorted({english_name(name) for name in ingredients_db["EnglishFoodName"].dropna()})
+    return pd.DataFrame({"name": [f"recipe {i % 2000}" for i in range(n)],
+                         "ingredient_names": [list(rng.choice(names, int(rng.integers(4, 12)), replace=False))
+                                              for _ in range(n)]})
+
+
+def _llm_suggestions(ingredients):
+    """get_ai_suggestions par le seul modèle (mode "llm"), pour mesurer le chemin d'origine"""
+    mode, local_suggestions.SUGGESTIONS_MODE = local_suggestions.SUGGESTIONS_MODE, "llm"
+    try:
+        return get_ai_suggestions(ingredients)
+    finally:
+        local_suggestions.SUGGESTIONS_MODE = mode
+
+
+def build_benchmarks() -> List[Benchmark]:
+    """(nom, fonction sans argument, répétitions par défaut)"""
+    ingredients_db = load_ingredients_db()
+    scorer = NutritionalScorer(ingredients_db, userProfile)
+    scorer_inputs = [[{"id": food_id, "quantite": grams} for food_id, grams in meal] for meal in USER_MEALS.values()]
+    names = list(USER_MEALS)
+    daily_pairs = list(zip(names, names[1:] + names[:1]))
+    index, _ = food_search.init_model(ingredients_db)
+    bilingual = BilingualFoodIndex(ingredients_db)
+    bilingual.search("poulet rôti")
+    trigram_index = TrigramIndex(bilingual.texts)
+    meals = [Meal.from_ingredients(meal, ingredients_db) for meal in user_meals()]
+    meal_log = MealLog.from_meals(meals * 1000)
+    rng = np.random.default_rng(SEED)
+    profiles = [dict(userProfile, age=int(rng.integers(18, 80)), weight=float(rng.uniform(45, 110)))
+                for _ in range(100)]
+
+    telemetry = PromptTelemetry(enabled=False)
+    for provider in ("openai", "anthropic"):
+        set_llm_backend(provider, FakeBackend(responder=_fake_responder, seed=SEED), telemetry=telemetry)
+    suggester = local_suggestions.get_local_suggester()
+    recipes = _synthetic_recipes(ingredients_db)
+    dish_index = DishIndex.build([recipes])
+    dish_queries = [names[:max(3, len(names) - 2)] for names in recipes["ingredient_names"][:100]]
+    image_data = np.random.default_rng(SEED).integers(0, 256, 64 * 1024, dtype=np.uint8).tobytes()
+
+    return [
+        ("csv/load_ingredients_db", load_ingredients_db, 20),
+        ("csv/load_meals_db", load_meals_db, 20),
+        ("substitutions/load_substitutions", lambda: load_substitutions(ingredients_db), 3),
+        ("scorer/analyze_meal_nutritional_score",
+         lambda: [scorer.analyze_meal_nutritional_score(meal) for meal in scorer_inputs], 50),
+        ("scoring/compute_meal_score",
+         lambda: [compute_meal_score(meal, ingredients_db, userProfile) for meal in user_meals()], 50),
+        ("scoring/compute_daily_score",
+         lambda: [compute_daily_score(user_meal(a), user_meal(b), ingredients_db, userProfile)
+                  for a, b in daily_pairs], 50),
+        ("meal/from_records", lambda: [Meal.from_records(meal, ingredients_db) for meal in scorer_inputs], 200),
+        ("meal/compute_meal_score",
+         lambda: [compute_meal_score(meal, ingredients_db, userProfile) for meal in meals], 50),
+        ("meal/meal_log_nutrients_6000", meal_log.nutrients, 50),
+        ("kernels/score_meal_log_100x6000", lambda: scoring_kernels.score_meal_log(meal_log, profiles), 10),
+        ("search/init_model", lambda: food_search.init_model(ingredients_db), 3),
+        # Caches vidés avant chaque exécution : coût d'une recherche nouvelle
+        ("search/search_matching_food",
+         lambda: [_clear_search_caches()] + [food_search.search_matching_food(q, ingredients_db, index)
+                                             for q in SEARCH_QUERIES], 5),
+        ("search/search_top_n_matching_food",
+         lambda: [_clear_search_caches()] + [food_search.search_top_n_matching_food(q, ingredients_db, index, 5)
+                                             for q in SEARCH_QUERIES], 5),
+        ("search/search_matching_food_cached",
+         lambda: [food_search.search_matching_food(q, ingredients_db, index) for q in SEARCH_QUERIES], 200),
+        ("search/bilingual_resolve", lambda: [bilingual.resolve(name) for name in VISION_NAMES], 50),
+        ("search/trigram_search", lambda: [trigram_index.search(text) for text in bilingual.texts[:100]], 50),
+        ("llm/analyze_meal", lambda: analyze_meal(image_data), 200),
+        ("llm/get_ai_suggestions", lambda: _llm_suggestions(["boeuf haché", "haricots rouges", "riz"]), 200),
+        ("dish/lsh_query_100", lambda: [dish_index.query(names) for names in dish_queries], 50),
+        ("suggestions/local", lambda: suggester.suggest(["boeuf haché", "haricots rouges", "riz"]), 50),
+    ]
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict:
+    """Temps sur `repeat` exécutions après un échauffement, puis une exécution sous tracemalloc"""
+    fn()
+    gc.collect()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    # Exécution séparée : tracemalloc ralentit fortement le code mesuré
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "runs": repeat,
+        "min_s": min(times),
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "alloc_peak_kib": peak / 1024,
+        "alloc_retained_kib": retained / 1024,
+        "peak_rss_mib": peak_rss_mib(),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Affiche l'écart à la référence ; renvoie les benchmarks dont la médiane régresse au-delà du seuil"""
+    regressions = []
+    print(f"\n{'benchmark':<40}{'base ms':>10}{'now ms':>10}{'ratio':>8}{'alloc ratio':>13}")
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40}{'-':>10}{row['median_s'] * 1e3:>10.2f}{'new':>8}")
+            continue
+        ratio = row["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        alloc_ratio = (row["alloc_peak_kib"] / base["alloc_peak_kib"]) if base["alloc_peak_kib"] else float("nan")
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<40}{base['median_s'] * 1e3:>10.2f}{row['median_s'] * 1e3:>10.2f}{ratio:>8.2f}"
+              f"{alloc_ratio:>13.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="ne lance que les benchmarks dont le nom contient ce texte")
+    parser.add_argument("--repeat", type=int, help="répétitions par benchmark (défaut : propre à chacun)")
+    parser.add_argument("--save", help="enregistre les résultats (JSON) comme nouvelle référence")
+    parser.add_argument("--compare", help="référence JSON à comparer ; code de sortie 1 en cas de régression")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="régression tolérée sur la médiane (0.15 = +15%%)")
+    parser.add_argument("--real-embeddings", action="store_true",
+                        help="utilise le modèle sentence-transformers au lieu des embeddings hachés")
+    args = parser.parse_args()
+
+    random.seed(SEED)
+    np.random.seed(SEED)
+    if not args.real_embeddings:
+        food_search.EMBEDDINGS_BACKEND = "fake"
+
+    results = {}
+    print(f"{'benchmark':<40}{'runs':>6}{'min ms':>10}{'median ms':>11}{'alloc KiB':>11}{'RSS MiB':>9}")
+    for name, fn, repeat in build_benchmarks():
+        if args.filter not in name:
+            continue
+        row = results[name] = measure(fn, args.repeat or repeat)
+        rss = row["peak_rss_mib"]
+        print(f"{name:<40}{row['runs']:>6}{row['min_s'] * 1e3:>10.2f}{row['median_s'] * 1e3:>11.2f}"
+              f"{row['alloc_peak_kib']:>11.0f}{rss if rss is not None else float('nan'):>9.0f}")
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "seed": SEED,
+            "embeddings": food_search.EMBEDDINGS_BACKEND,
+        },
+        "results": results,
+    }
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nBaseline saved to {path}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["results"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Limeat - Repas et profil de référence de datathon.ipynb, partagés par les benchmarks
+"""
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from nutrition import Ingredient  # noqa: E402
+
+userProfile = {"age": 35, "weight": 70, "size": 170, "activityLevel": 1.4}
+
+# (FoodID, grammes) de chaque repas
+USER_MEALS: Dict[str, List[Tuple[int, float]]] = {
+    "chili_con_carne": [(9104, 150), (20035, 80), (11042, 1), (20524, 130), (11001, 3), (11000, 2),
+                        (6259, 125), (20068, 20)],
+    "quiche_lorraine": [(23426, 50), (28504, 50), (19431, 47), (22000, 45), (19041, 50), (11048, 1)],
+    "couscous": [(30155, 120), (17270, 5), (11112, 1), (11001, 3), (20047, 150), (20009, 125), (20020, 180),
+                 (20532, 70), (36006, 100), (20068, 70), (20033, 50)],
+    "spaghetti_bolognaise": [(9811, 300), (20260, 100), (11000, 3), (6255, 80), (20034, 30)],
+    "bourguignon_legumes": [(20008, 60), (20010, 70), (20003, 40), (4048, 100), (20035, 30)],
+    "burger_poulet_frites": [(7259, 80), (36036, 130), (25604, 20), (20276, 30), (12726, 30), (11054, 20),
+                             (20116, 30), (20009, 30), (4032, 100)],
+}
+
+
+def user_meal(name: str) -> List[Ingredient]:
+    """Nouvelle liste d'Ingredient (le calcul des scores renseigne groupId en place)"""
+    return [Ingredient(food_id, grams) for food_id, grams in USER_MEALS[name]]
+
+
+def user_meals() -> List[List[Ingredient]]:
+    return [user_meal(name) for name in USER_MEALS]
@@ -0,0 +1,268 @@
+"""
+Limeat - Serveur HTTP local imitant les API Anthropic (Messages) et OpenAI
+(Chat Completions), streaming SSE et appels d'outil compris
+
+Latence, débit de tokens et taux d'erreurs configurables ; les réponses sont
+construites à partir des repas de référence (benchmarks/fixtures.py). Les SDK
+officiels s'y connectent via ANTHROPIC_BASE_URL et OPENAI_BASE_URL.
+
+Usage :
+    python benchmarks/llm_stub.py --port 8089 --latency 0.8 --failure-rate 0.05
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 OPENAI_BASE_URL=http://127.0.0.1:8089/v1 streamlit run app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fixtures import USER_MEALS, user_meal  # noqa: E402
+from nutrition import get_nutrients_from_meal, load_ingredients_db  # noqa: E402
+
+# Nombre de caractères par token, pour des comptes d'usage plausibles
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_CHARS = 24
+
+
+def build_payloads(ingredients_db=None) -> Dict[str, List[Dict]]:
+    """Réponses structurées par repas de référence : analyse de la photo et suggestions"""
+    ingredients_db = load_ingredients_db() if ingredients_db is None else ingredients_db
+    names = ingredients_db.set_index("FoodID")["FoodName"]
+    analyses, suggestions = [], []
+    for dish, meal in USER_MEALS.items():
+        nutrients = get_nutrients_from_meal(user_meal(dish), ingredients_db)
+        foods = [names[food_id] for food_id, _ in meal]
+        analyses.append({
+            "ingredients": [{"nom": names[food_id], "quantite": grams} for food_id, grams in meal],
+            "valeurs_nutritionnelles": {
+                "calories": round(nutrients["208"], 1),
+                "proteines": round(nutrients["203"], 1),
+                "glucides": round(nutrients["205"], 1),
+                "lipides": round(nutrients["204"], 1),
+                "fibres": round(nutrients["291"], 1),
+            },
+            "analyse": {"points_forts": ["source de protéines"], "points_faibles": ["peu de légumes"],
+                        "description": dish.replace("_", " ")},
+            "suggestions": {
+                "ajouts": [{"ingredient": "brocoli", "raison": "fibres et vitamines"}],
+                "remplacements": [{"remplacer": foods[0], "par": foods[-1], "raison": "équilibre"}],
+            },
+        })
+        suggestions.append({"dish_name": dish.replace("_", " ").capitalize(), "add_calories": foods[:2],
+                            "remove_calories": foods[-1:], "add_health": ["brocoli"], "remove_health": foods[1:2]})
+    return {"anthropic": analyses, "openai": suggestions}
+
+
+class StubState:
+    """Réglages et compteurs partagés par les threads du serveur"""
+
+    def __init__(self, latency_s: float = 0.5, per_token_s: float = 0.0, failure_rate: float = 0.0,
+                 failure_status: int = 529, seed: Optional[int] = None):
+        self.latency_s = latency_s
+        self.per_token_s = per_token_s
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.payloads = build_payloads()
+        self.requests = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.failure_rate
+            self.failures += fail
+            return fail
+
+    def pick(self, provider: str, body: Dict) -> Dict:
+        """Réponse déterministe : même requête, même repas de référence"""
+        digest = hashlib.sha256(json.dumps(body["messages"], sort_keys=True).encode("utf-8")).digest()
+        payloads = self.payloads[provider]
+        return payloads[digest[0] % len(payloads)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/messages"):
+            provider = "anthropic"
+        elif self.path.endswith("/chat/completions"):
+            provider = "openai"
+        else:
+            return self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        time.sleep(self.state.latency_s)
+        if self.state.should_fail():
+            return self._send_json(self.state.failure_status, {
+                "type": "error", "error": {"type": "overloaded_error", "message": "stub failure"}})
+
+        text = json.dumps(self.state.pick(provider, body), ensure_ascii=False)
+        tool = _tool_name(provider, body)
+        prefill = _prefill(body) if tool is None else ""
+        text = text[len(prefill):]
+        input_tokens = len(json.dumps(body["messages"])) // CHARS_PER_TOKEN
+        if provider == "anthropic":
+            self._anthropic(body, text, tool, input_tokens)
+        else:
+            self._openai(body, text, tool, input_tokens)
+
+    # Réponses Anthropic
+    def _anthropic(self, body: Dict, text: str, tool: Optional[str], input_tokens: int):
+        output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        block = ({"type": "tool_use", "id": "toolu_stub", "name": tool, "input": {}} if tool
+                 else {"type": "text", "text": ""})
+        if not body.get("stream"):
+            time.sleep(self.state.per_token_s * output_tokens)
+            if tool:
+                block["input"] = json.loads(text)
+            else:
+                block["text"] = text
+            return self._send_json(200, {
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"],
+                "content": [block], "stop_reason": "tool_use" if tool else "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}})
+
+        self._start_stream()
+        self._sse({"type": "message_start", "message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"], "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1}}},
+            event="message_start")
+        self._sse({"type": "content_block_start", "index": 0, "content_block": block}, event="content_block_start")
+        for piece in self._pieces(text):
+            delta = ({"type": "input_json_delta", "partial_json": piece} if tool
+                     else {"type": "text_delta", "text": piece})
+            self._sse({"type": "content_block_delta", "index": 0, "delta": delta}, event="content_block_delta")
+        self._sse({"type": "content_block_stop", "index": 0}, event="content_block_stop")
+        self._sse({"type": "message_delta", "delta": {"stop_reason": "tool_use" if tool else "end_turn",
+                                                      "stop_sequence": None},
+                   "usage": {"output_tokens": output_tokens}}, event="message_delta")
+        self._sse({"type": "message_stop"}, event="message_stop")
+        self._end_stream()
+
+    # Réponses OpenAI
+    def _openai(self, body: Dict, text: str, tool: Optional[str], input_tokens: int):
+        output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        usage = {"prompt_tokens": input_tokens, "completion_tokens": output_tokens,
+                 "total_tokens": input_tokens + output_tokens}
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body["model"]}
+        if not body.get("stream"):
+            time.sleep(self.state.per_token_s * output_tokens)
+            message = {"role": "assistant", "content": None if tool else text}
+            if tool:
+                message["tool_calls"] = [{"id": "call_stub", "type": "function",
+                                          "function": {"name": tool, "arguments": text}}]
+            return self._send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": message, "finish_reason": "tool_calls" if tool else "stop"}]))
+
+        chunk = dict(base, object="chat.completion.chunk")
+        self._start_stream()
+        for i, piece in enumerate(self._pieces(text)):
+            if tool:
+                call = {"index": 0, "function": {"arguments": piece}}
+                if i == 0:
+                    call.update(id="call_stub", type="function", function={"name": tool, "arguments": piece})
+                delta = {"tool_calls": [call]}
+            else:
+                delta = {"content": piece}
+            if i == 0:
+                delta["role"] = "assistant"
+            self._sse(dict(chunk, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+        self._sse(dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "tool_calls" if tool else "stop"}]))
+        if body.get("stream_options", {}).get("include_usage"):
+            self._sse(dict(chunk, choices=[], usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+    # Transport
+    def _pieces(self, text: str):
+        """Découpe la réponse en morceaux espacés selon le débit de tokens simulé"""
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            time.sleep(self.state.per_token_s * STREAM_CHUNK_CHARS / CHARS_PER_TOKEN)
+            yield text[start:start + STREAM_CHUNK_CHARS]
+
+    def _send_json(self, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _sse(self, payload: Dict, event: Optional[str] = None):
+        prefix = f"event: {event}\n" if event else ""
+        self._write_chunk(f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def _tool_name(provider: str, body: Dict) -> Optional[str]:
+    """Nom de l'outil imposé par tool_choice, ou None en mode texte"""
+    choice = body.get("tool_choice")
+    if not body.get("tools") or not isinstance(choice, dict):
+        return None
+    return choice.get("name") if provider == "anthropic" else choice.get("function", {}).get("name")
+
+
+def _prefill(body: Dict) -> str:
+    """Début de réponse imposé par un dernier message assistant (Anthropic)"""
+    last = body["messages"][-1]
+    return last["content"] if last.get("role") == "assistant" and isinstance(last.get("content"), str) else ""
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **state_kwargs) -> ThreadingHTTPServer:
+    """Démarre le serveur dans un thread ; `server.server_address` donne le port choisi"""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(**state_kwargs)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="délai avant le premier token (s)")
+    parser.add_argument("--per-token", type=float, default=0.0, help="délai par token de sortie (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="part des requêtes en erreur")
+    parser.add_argument("--failure-status", type=int, default=529, help="code HTTP des erreurs simulées")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_stub(args.host, args.port, latency_s=args.latency, per_token_s=args.per_token,
+                        failure_rate=args.failure_rate, failure_status=args.failure_status, seed=args.seed)
+    print(f"LLM stub listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Limeat - Test de charge de bout en bout : sessions Streamlit concurrentes
+(upload -> analyze_meal_image -> display_results) et appels de suggestions,
+contre un serveur local imitant les API Anthropic et OpenAI
+
+Chaque session utilisateur est exécutée par streamlit.testing (AppTest), dans
+ce processus, comme le ferait un serveur Streamlit : client LLM, pool HTTP et
+caches sont partagés entre sessions. Les photos sont synthétiques et les
+réponses du modèle construites à partir des six repas de datathon.ipynb.
+
+Usage :
+    python benchmarks/load_test.py --sessions 24 --concurrency 4 --latency 0.8
+    python benchmarks/load_test.py --failure-rate 0.1 --out logs/load_test.json
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fixtures import USER_MEALS  # noqa: E402
+from llm_stub import start_stub  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+BREAKFASTS = ["continental", "complet", "healthy", "vegan", "skip"]
+
+
+def rss_mib() -> Optional[float]:
+    """RSS courant du processus (psutil), ou pic de RSS à défaut"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_images(count: int, seed: int, size=(640, 480)) -> List[bytes]:
+    """Photos JPEG de bruit coloré, de taille comparable à une photo de repas compressée"""
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_s": None, "p95_s": None, "p99_s": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_s": float(p50), "p95_s": float(p95), "p99_s": float(p99)}
+
+
+class SessionRunner:
+    """Déroule le parcours d'un utilisateur dans l'application et mesure chaque étape"""
+
+    def __init__(self, app_path: Path, images: List[bytes], ingredient_lists: List[List[str]],
+                 suggestions_per_session: int, timeout: float, keep_sessions: bool):
+        self.app_path = app_path
+        self.images = images
+        self.ingredient_lists = ingredient_lists
+        self.suggestions_per_session = suggestions_per_session
+        self.timeout = timeout
+        self.keep_sessions = keep_sessions
+        self.sessions = []
+        self._lock = threading.Lock()
+
+    def run(self, session_id: int) -> Dict:
+        from streamlit.testing.v1 import AppTest
+        from main import get_ai_suggestions
+
+        at = AppTest.from_file(str(self.app_path), default_timeout=self.timeout)
+        at.session_state["page"] = "main"
+        at.session_state["breakfast"] = BREAKFASTS[session_id % len(BREAKFASTS)]
+        # Un utilisateur par session : pas de réutilisation d'analyses enregistrées entre sessions
+        at.session_state["user_id"] = f"load-{session_id}"
+        row = {"session": session_id, "ok": False, "error": None, "analyze_s": None, "suggestions_s": []}
+        try:
+            at.run()
+            at.file_uploader[0].upload(f"meal_{session_id}.jpg", self.images[session_id % len(self.images)],
+                                       "image/jpeg")
+            at.run()
+            start = time.perf_counter()
+            next(button for button in at.button if "Analyser" in button.label).click().run()
+            row["analyze_s"] = time.perf_counter() - start
+
+            errors = [e.value for e in at.error] + [str(e.value) for e in at.exception]
+            if errors:
+                row["error"] = errors[0]
+            elif not any("Résultats" in header.value for header in at.subheader):
+                row["error"] = "results not displayed"
+
+            for i in range(self.suggestions_per_session):
+                ingredients = self.ingredient_lists[(session_id + i) % len(self.ingredient_lists)]
+                start = time.perf_counter()
+                suggestions = get_ai_suggestions(ingredients)
+                row["suggestions_s"].append(time.perf_counter() - start)
+                if suggestions is None and row["error"] is None:
+                    row["error"] = "suggestions not parsed"
+            row["ok"] = row["error"] is None
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+
+        # Les sessions d'un serveur Streamlit restent en mémoire tant que l'onglet est ouvert
+        if self.keep_sessions:
+            with self._lock:
+                self.sessions.append(at)
+        return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="app.py", help="script Streamlit à charger (relatif à la racine)")
+    parser.add_argument("--sessions", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions simultanées")
+    parser.add_argument("--latency", type=float, default=0.8, help="délai du stub avant le premier token (s)")
+    parser.add_argument("--per-token", type=float, default=0.002, help="délai du stub par token de sortie (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="part des requêtes LLM en erreur")
+    parser.add_argument("--failure-status", type=int, default=529)
+    parser.add_argument("--suggestions-per-session", type=int, default=1)
+    parser.add_argument("--release-sessions", action="store_true",
+                        help="libère chaque session après son parcours (sinon elles restent en mémoire)")
+    parser.add_argument("--timeout", type=float, default=120, help="durée max d'une exécution du script (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="enregistre le rapport JSON")
+    args = parser.parse_args()
+    # Les chemins de données de l'application sont relatifs à la racine du dépôt
+    os.chdir(ROOT)
+
+    server = start_stub(latency_s=args.latency, per_token_s=args.per_token, failure_rate=args.failure_rate,
+                        failure_status=args.failure_status, seed=args.seed)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update({
+        "ANTHROPIC_BASE_URL": base_url,
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "ANTHROPIC_API_KEY": "stub",
+        "OPENAI_API_KEY": "stub",
+        "LIMEAT_TELEMETRY_LOG": os.getenv("LIMEAT_TELEMETRY_LOG", "logs/load_test_calls.jsonl"),
+        # Base neuve à chaque exécution : les photos synthétiques reviennent d'une exécution à l'autre
+        "LIMEAT_DB": os.getenv("LIMEAT_DB", str(Path(tempfile.mkdtemp(prefix="limeat_load_")) / "limeat.sqlite3")),
+    })
+    os.environ.pop("LIMEAT_LLM_BACKEND", None)
+
+    import nutrition
+    from llm_client import get_llm_client
+
+    ingredients_db = nutrition.load_ingredients_db()
+    names = ingredients_db.set_index("FoodID")["FoodName"]
+    ingredient_lists = [[names[food_id] for food_id, _ in meal] for meal in USER_MEALS.values()]
+    runner = SessionRunner(ROOT / args.app, synthetic_images(len(USER_MEALS) * 2, args.seed), ingredient_lists,
+                           args.suggestions_per_session, args.timeout, not args.release_sessions)
+
+    # Une session d'échauffement : imports et premiers chargements hors mesure
+    runner.run(-1)
+    runner.sessions.clear()
+    # Avertissements de dépréciation de Streamlit répétés à chaque session
+    from streamlit import logger as st_logger
+    st_logger.set_log_level("error")
+    rss_start = rss_mib()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        rows = list(pool.map(runner.run, range(args.sessions)))
+    wall = time.perf_counter() - start
+    rss_end = rss_mib()
+
+    ok = [row for row in rows if row["ok"]]
+    errors: Dict[str, int] = {}
+    for row in rows:
+        if not row["ok"]:
+            errors[row["error"]] = errors.get(row["error"], 0) + 1
+    report = {
+        "config": vars(args),
+        "sessions": len(rows),
+        "ok": len(ok),
+        "errors": errors,
+        "wall_s": wall,
+        "throughput_sessions_per_s": len(ok) / wall if wall else None,
+        "analyze_latency": percentiles([row["analyze_s"] for row in rows if row["analyze_s"] is not None]),
+        "suggestions_latency": percentiles([s for row in rows for s in row["suggestions_s"]]),
+        "rss_start_mib": rss_start,
+        "rss_end_mib": rss_end,
+        "rss_growth_per_session_mib": ((rss_end - rss_start) / len(rows)
+                                       if rss_start is not None and rss_end is not None and rows else None),
+        "llm": {provider: get_llm_client(provider).stats() for provider in ("anthropic", "openai")},
+        "stub": {"requests": server.RequestHandlerClass.state.requests,
+                 "failures": server.RequestHandlerClass.state.failures},
+    }
+    server.shutdown()
+
+    def fmt(value, unit="s"):
+        return "-" if value is None else f"{value:.3f} {unit}"
+
+    print(f"sessions            {report['ok']}/{report['sessions']} ok in {wall:.1f} s "
+          f"({report['throughput_sessions_per_s']:.2f} sessions/s, concurrency {args.concurrency})")
+    for step in ("analyze_latency", "suggestions_latency"):
+        lat = report[step]
+        print(f"{step:<21}p50 {fmt(lat['p50_s'])}   p95 {fmt(lat['p95_s'])}   p99 {fmt(lat['p99_s'])}")
+    print(f"memory              RSS {fmt(rss_start, 'MiB')} -> {fmt(rss_end, 'MiB')}, "
+          f"{fmt(report['rss_growth_per_session_mib'], 'MiB')} per session")
+    print(f"llm stub            {report['stub']['requests']} requests, {report['stub']['failures']} injected failures")
+    for error, count in errors.items():
+        print(f"  {count} x {error}")
+
+    if args.out:
+        path = Path(args.out)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2, default=str), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
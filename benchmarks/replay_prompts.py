@@ -0,0 +1,125 @@
+"""
+Limeat - Rejeu d'un journal d'appels LLM réels avec plusieurs versions de prompt
+
+Compare latence, time-to-first-token, tokens, coût et taux d'échec de parsing
+avant de changer LIMEAT_PROMPT_VERSION en production.
+
+Les ingrédients ne sont rejouables que s'ils ont été journalisés en clair
+(LIMEAT_TELEMETRY_CAPTURE_INPUTS=1), les photos que si elles ont été conservées
+(LIMEAT_TELEMETRY_CAPTURE_IMAGES=1).
+
+Usage :
+    python benchmarks/replay_prompts.py --log logs/llm_calls.jsonl --versions v1 v2-compact
+    python benchmarks/replay_prompts.py --fake --limit 20        # hors-ligne, sans clé API
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_client import AnthropicBackend, FakeBackend, OpenAIBackend, set_llm_backend  # noqa: E402
+from main import request_suggestions  # noqa: E402
+from meal_vision import call_vision_model  # noqa: E402
+from prompts import PROMPTS, get_prompt  # noqa: E402
+from structured_output import (MEAL_ANALYSIS_SCHEMA, SUGGESTIONS_SCHEMA, StructuredOutputError,  # noqa: E402
+                               parse_structured)
+from telemetry import IMAGES_DIR, TELEMETRY_LOG, PromptTelemetry, load_records, summarize  # noqa: E402
+
+_FAKE_RESPONSES = {
+    "openai": json.dumps({"dish_name": "Chili con carne", "add_calories": ["riz", "avocat"],
+                          "remove_calories": ["fromage"], "add_health": ["poivron"],
+                          "remove_health": ["crème"]}),
+    "anthropic": json.dumps({"ingredients": [{"nom": "Riz blanc, cuit", "quantite": 150}],
+                             "valeurs_nutritionnelles": {"calories": 450, "proteines": 20,
+                                                         "glucides": 60, "lipides": 12, "fibres": 6}}),
+}
+
+
+def collect_inputs(records, limit):
+    """Entrées distinctes du journal, par prompt (les appels sans entrées en clair sont ignorés)"""
+    seen, inputs = set(), {name: [] for name in PROMPTS}
+    for record in records:
+        name = (record.get("label") or "").split("/")[0]
+        if name not in inputs or not record.get("inputs"):
+            continue
+        key = json.dumps(record["inputs"], sort_keys=True)
+        if key in seen or len(inputs[name]) >= limit:
+            continue
+        if name == "suggestions" and "ingredients" not in record["inputs"]:
+            continue
+        if name == "meal_analysis" and not (IMAGES_DIR / f"{record['inputs']['image_sha256']}.jpg").exists():
+            continue
+        seen.add(key)
+        inputs[name].append(record["inputs"])
+    return inputs
+
+
+def replay(inputs, versions, clients):
+    """Rejoue chaque entrée avec chaque version ; renvoie les échecs de parsing par label"""
+    parse_failures = {}
+    for version in versions:
+        for ingredients in (i["ingredients"] for i in inputs["suggestions"]):
+            spec = get_prompt("suggestions", version)
+            _run(parse_failures, spec.label, SUGGESTIONS_SCHEMA, request_suggestions, ingredients, spec)
+        for image_inputs in inputs["meal_analysis"]:
+            spec = get_prompt("meal_analysis", version)
+            image_data = (IMAGES_DIR / f"{image_inputs['image_sha256']}.jpg").read_bytes()
+            _run(parse_failures, spec.label, MEAL_ANALYSIS_SCHEMA, call_vision_model,
+                 clients["anthropic"], image_data, spec)
+    return parse_failures
+
+
+def _run(parse_failures, label, schema, fn, *args):
+    parse_failures.setdefault(label, 0)
+    try:
+        parse_structured(fn(*args), schema, label)
+    except StructuredOutputError:
+        parse_failures[label] += 1
+    except Exception as e:
+        print(f"{label}: call failed ({e})", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=TELEMETRY_LOG, help="journal JSONL des appels enregistrés")
+    parser.add_argument("--versions", nargs="+", default=["v1", "v2-compact"])
+    parser.add_argument("--limit", type=int, default=50, help="nombre max d'entrées rejouées par prompt")
+    parser.add_argument("--out", default="logs/replay_calls.jsonl", help="journal des appels rejoués")
+    parser.add_argument("--fake", action="store_true", help="backend hors-ligne (latence simulée par token)")
+    args = parser.parse_args()
+
+    inputs = collect_inputs(load_records(args.log), args.limit)
+    if args.fake and not inputs["suggestions"]:
+        inputs["suggestions"] = [{"ingredients": ["boeuf haché", "haricots rouges", "riz", "tomate"]}]
+    if not any(inputs.values()):
+        sys.exit(f"No replayable calls found in {args.log}")
+
+    out_path = Path(args.out)
+    out_path.unlink(missing_ok=True)
+    telemetry = PromptTelemetry(out_path, enabled=True)
+    clients = {}
+    for provider, backend_cls in (("openai", OpenAIBackend), ("anthropic", AnthropicBackend)):
+        if args.fake:
+            backend = FakeBackend(responder=lambda messages, model, p=provider: _FAKE_RESPONSES[p],
+                                  latency_s=0.05, per_token_s=0.002, seed=0)
+        else:
+            backend = backend_cls()
+        clients[provider] = set_llm_backend(provider, backend, telemetry=telemetry)
+
+    parse_failures = replay(inputs, args.versions, clients)
+
+    summary = summarize(load_records(out_path))
+    print(f"{'label':<28}{'calls':>6}{'in tok':>9}{'out tok':>9}{'p50 s':>8}{'p95 s':>8}"
+          f"{'ttft s':>8}{'$/call':>9}{'parse KO':>10}")
+    for label, row in summary.items():
+        ttft = row["ttft_p50_s"]
+        print(f"{label:<28}{row['calls']:>6}{row['mean_input_tokens']:>9.0f}{row['mean_output_tokens']:>9.0f}"
+              f"{row['latency_p50_s'] or 0:>8.2f}{row['latency_p95_s'] or 0:>8.2f}"
+              f"{ttft if ttft is not None else float('nan'):>8.2f}{row['mean_cost_usd']:>9.4f}"
+              f"{parse_failures.get(label, 0):>10}")
+
+
+if __name__ == "__main__":
+    main()
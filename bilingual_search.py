@@ -0,0 +1,241 @@
+"""
+Limeat - Index bilingue (FoodName / EnglishFoodName) des noms d'aliments
+
+Le modèle de vision répond en français ("Avocat, cru") alors que
+food_search n'indexe que les noms anglais. Cet index contient les deux noms
+de chaque aliment, normalisés selon leur langue (mots vides, accents,
+pluriels), dans un seul index d'embeddings d'un modèle multilingue :
+
+- un nom identique à un nom de la base après normalisation ("avocat cru",
+  "AVOCAT, CRU") est résolu par une seule recherche dans un dictionnaire ;
+- sinon un index de trigrammes (fuzzy_index) corrige les fautes de frappe
+  quand un aliment se détache nettement des autres ;
+- sinon la requête, normalisée en français et en anglais, est encodée en un
+  seul appel et cherchée dans les deux langues à la fois ; les scores
+  (0.7 sémantique + 0.3 TF-IDF, comme food_search) sont fusionnés par aliment.
+
+    index = get_bilingual_index(ingredients_db)
+    index.search("avocats crus", k=3)
+    index.resolve("Poulet rôti")   # FoodID ou None
+"""
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import food_search
+from fuzzy_index import TrigramIndex
+from nutrition import frame_cache
+
+LANGUAGES = ("fr", "en")
+NAME_COLUMNS = {"fr": "FoodName", "en": "EnglishFoodName"}
+
+# Mots vides français (liste NLTK si ses corpus sont installés)
+FRENCH_STOP_WORDS = {
+    "a", "à", "au", "aux", "avec", "ce", "ces", "d", "dans", "de", "des", "du", "en", "et", "l", "la", "le",
+    "les", "leur", "ou", "par", "pour", "sa", "se", "ses", "son", "sur", "un", "une", "y",
+}
+
+# Mots terminés par s ou x au singulier (sans accents)
+FRENCH_INVARIABLE = {
+    "ananas", "anis", "cassis", "couscous", "epais", "frais", "gras", "houmous", "jus", "mais", "noix",
+    "pois", "radis", "riz", "doux", "roux", "faux", "chaux",
+}
+
+# Mots terminés par s au singulier, et pluriels irréguliers (anglais)
+ENGLISH_INVARIABLE = {"molasses", "series", "species"}
+ENGLISH_IRREGULAR = {
+    "leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife", "calves": "calf",
+    "cookies": "cookie", "brownies": "brownie", "smoothies": "smoothie", "pies": "pie", "quiches": "quiche",
+    "geese": "goose", "teeth": "tooth", "feet": "foot", "mice": "mouse", "children": "child",
+}
+
+# Score minimal d'une correspondance retenue par resolve (même seuil que search_matching_food)
+MIN_SCORE = 0.5
+# Recherche par trigrammes retenue sans embeddings : similarité minimale et avance sur l'aliment suivant
+TRIGRAM_MIN = 0.5
+TRIGRAM_MARGIN = 0.1
+
+
+def fold_accents(text: str) -> str:
+    """Minuscules sans accents ni ligatures : "Œuf, Pâte" -> "oeuf, pate" """
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=None)
+def _stop_words(lang: str) -> frozenset:
+    if lang == "en":
+        return frozenset(fold_accents(word) for word in food_search._text_tools()[1])
+    try:
+        from nltk.corpus import stopwords
+        words = set(stopwords.words("french")) | FRENCH_STOP_WORDS
+    except (ImportError, LookupError):
+        words = FRENCH_STOP_WORDS
+    return frozenset(fold_accents(word) for word in words)
+
+
+def _singular_fr(word: str) -> str:
+    """Pluriels réguliers : "tomates" -> "tomate", "choux" -> "chou", "chevaux" -> "cheval" """
+    if len(word) <= 3 or word in FRENCH_INVARIABLE:
+        return word
+    if word.endswith("aux"):
+        return word[:-3] + "al"
+    if word.endswith(("s", "x")) and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _singular_en(word: str) -> str:
+    """Pluriels réguliers : "beans" -> "bean", "berries" -> "berry", "tomatoes" -> "tomato", "peaches" -> "peach".
+
+    Règles fixes plutôt que le lemmatiseur WordNet : le résultat ne dépend pas des corpus NLTK
+    installés, et les jetons enregistrés (co-occurrences, index de plats) restent comparables.
+    """
+    if word in ENGLISH_IRREGULAR:
+        return ENGLISH_IRREGULAR[word]
+    if len(word) <= 3 or word in ENGLISH_INVARIABLE or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def normalize_name(text: str, lang: str) -> str:
+    """Normalisation d'un nom selon sa langue : accents, ponctuation, mots vides, pluriels"""
+    words = re.sub(r"[^\w\s]", " ", fold_accents(str(text))).split()
+    stop_words = _stop_words(lang)
+    singular = _singular_fr if lang == "fr" else _singular_en
+    return " ".join(singular(word) for word in words if word not in stop_words)
+
+
+class BilingualFoodIndex:
+    """Noms français et anglais d'une base d'aliments, interrogés ensemble.
+
+    Les lignes 0..N-1 de l'index sont les noms français, N..2N-1 les noms anglais.
+    Les embeddings sont calculés à la première recherche non exacte.
+    """
+
+    def __init__(self, data_frame: pd.DataFrame, model_name: str = food_search.MULTILINGUAL_MODEL):
+        self.data_frame = data_frame
+        self.model_name = model_name
+        self.texts: List[str] = [normalize_name(name, lang) for lang in LANGUAGES
+                                 for name in data_frame[NAME_COLUMNS[lang]].fillna("")]
+        self._exact: Dict[str, int] = {}
+        for row, text in enumerate(self.texts):
+            if text:
+                self._exact.setdefault(text, row % len(data_frame))
+        self._index = None
+        self._tfidf = self._tfidf_matrix = None
+        self._trigrams = None
+        # Niveau de résolution de chaque recherche : exact, trigram, semantic ou none
+        self.tiers = Counter()
+
+    def __len__(self) -> int:
+        return len(self.data_frame)
+
+    def _build(self):
+        embeddings = food_search.encode(self.texts, self.model_name)
+        food_search.normalize_L2(embeddings)
+        index = food_search.new_index(embeddings.shape[1])
+        index.add(embeddings)
+        self._tfidf = TfidfVectorizer()
+        self._tfidf_matrix = self._tfidf.fit_transform(self.texts)
+        self._index = index
+
+    def queries(self, name: str) -> List[str]:
+        """Normalisations distinctes de la requête dans les deux langues"""
+        return list(dict.fromkeys(text for text in (normalize_name(name, lang) for lang in LANGUAGES) if text))
+
+    def exact(self, name: str) -> Optional[int]:
+        """Ligne de l'aliment dont un des noms normalisés est celui de la requête, ou None"""
+        for text in self.queries(name):
+            row = self._exact.get(text)
+            if row is not None:
+                return row
+        return None
+
+    def scores(self, name: str, k: int = 5) -> List[Tuple[int, float, str]]:
+        """(ligne, score, origine) des k meilleurs aliments, du meilleur au moins bon ; l'origine est
+        "exact", "trigram" ou la langue ("fr", "en") du nom retenu par la recherche sémantique"""
+        queries = self.queries(name)
+        if not queries or self.data_frame.empty:
+            return []
+        row = self.exact(name)
+        if row is not None:
+            self.tiers["exact"] += 1
+            return [(row, 1.0, "exact")]
+        fuzzy = self.fuzzy_scores(queries, k)
+        if fuzzy:
+            self.tiers["trigram"] += 1
+            return fuzzy
+        self.tiers["semantic"] += 1
+        if self._index is None:
+            self._build()
+        vectors = food_search.encode(queries, self.model_name).reshape(len(queries), -1)
+        food_search.normalize_L2(vectors)
+        distances, indices = self._index.search(vectors, min(2 * k, len(self.texts)))
+        lexical = (self._tfidf.transform(queries) @ self._tfidf_matrix[np.unique(indices)].T).toarray()
+        columns = {candidate: i for i, candidate in enumerate(np.unique(indices))}
+
+        best: Dict[int, Tuple[float, str]] = {}
+        n = len(self.data_frame)
+        for q in range(len(queries)):
+            for distance, candidate in zip(distances[q], indices[q]):
+                score = (1 - distance / 2) * 0.7 + lexical[q, columns[candidate]] * 0.3
+                food = int(candidate) % n
+                if food not in best or score > best[food][0]:
+                    best[food] = (float(score), LANGUAGES[candidate // n])
+        ranked = sorted(best.items(), key=lambda item: -item[1][0])[:k]
+        return [(food, score, lang) for food, (score, lang) in ranked]
+
+    def fuzzy_scores(self, queries: List[str], k: int = 5) -> List[Tuple[int, float, str]]:
+        """Candidats par trigrammes, seulement si le meilleur aliment se détache (sinon [])"""
+        if self._trigrams is None:
+            self._trigrams = TrigramIndex(self.texts)
+        n = len(self.data_frame)
+        best: Dict[int, Tuple[float, str]] = {}
+        for query in queries:
+            for candidate, similarity in self._trigrams.search(query, k + 1):
+                food = candidate % n
+                if food not in best or similarity > best[food][0]:
+                    best[food] = (similarity, "trigram")
+        ranked = sorted(best.items(), key=lambda item: -item[1][0])
+        if not ranked or ranked[0][1][0] < TRIGRAM_MIN:
+            return []
+        if len(ranked) > 1 and ranked[0][1][0] - ranked[1][1][0] < TRIGRAM_MARGIN:
+            return []
+        return [(food, score, lang) for food, (score, lang) in ranked[:k]]
+
+    def resolution_stats(self) -> Dict[str, float]:
+        """Recherches par niveau, et part résolue sans embeddings (exact ou trigrammes)"""
+        total = sum(self.tiers.values())
+        local = self.tiers["exact"] + self.tiers["trigram"]
+        return dict(self.tiers, total=total, without_embeddings=local / total if total else 0.0)
+
+    def search(self, name: str, k: int = 5) -> List[dict]:
+        """Les k meilleurs aliments, au format de food_search (avec la langue du nom retenu)"""
+        return [dict(food_search._match(self.data_frame, row, score), Language=lang)
+                for row, score, lang in self.scores(name, k)]
+
+    def resolve(self, name: str, min_score: float = MIN_SCORE) -> Optional[int]:
+        """FoodID du meilleur aliment si son score atteint `min_score`, sinon None"""
+        scores = self.scores(name, 1)
+        if not scores or scores[0][1] < min_score:
+            return None
+        return int(self.data_frame["FoodID"].iloc[scores[0][0]])
+
+
+@frame_cache
+def get_bilingual_index(data_frame: pd.DataFrame) -> BilingualFoodIndex:
+    """Index bilingue d'une base chargée, construit au premier appel puis réutilisé"""
+    return BilingualFoodIndex(data_frame)
@@ -0,0 +1,363 @@
+"""
+Limeat - Construction incrémentale des artefacts dérivés des données
+
+Chaque artefact (masques d'allergènes, table de substitutions, matrice des
+menus, index d'embeddings, recettes en Parquet, co-occurrences, index LSH des
+plats) est une cible qui dépend de fichiers sources (CSV de data/,
+recipesDataset) ou d'autres cibles, et d'une version de son constructeur. Sa
+clé est l'empreinte SHA-256 de ces entrées : seules les cibles dont la clé a
+changé, ou dont une sortie manque, sont reconstruites, en parallèle quand
+elles sont indépendantes. Modifier meals.csv ne reconstruit ni l'index
+d'embeddings ni les artefacts des recettes.
+
+Le manifeste (var/artifacts/manifest.json) garde la clé de chaque cible et
+l'empreinte de chaque source (avec taille et date, pour ne pas relire un
+fichier inchangé). Les applications le consultent au démarrage
+(stale_artifacts) et signalent les artefacts à reconstruire.
+
+Usage :
+    python build_pipeline.py                  # reconstruit ce qui est périmé
+    python build_pipeline.py --status         # état de chaque cible, sans rien construire
+    python build_pipeline.py menu_matrix --force --jobs 1
+    python build_pipeline.py food_index       # cible hors défaut, construite sur demande
+"""
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from allergens import ARTIFACTS_DIR, TERMS_VERSION
+from nutrition import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = ARTIFACTS_DIR / "manifest.json"
+
+# Fichiers sources
+SOURCES = {
+    "ingredients_db.csv": DATA_DIR / "ingredients_db.csv",
+    "meals.csv": DATA_DIR / "meals.csv",
+    "recipesDataset": DATA_DIR / "recipesDataset",
+}
+
+
+# Constructeurs (fonctions du module : exécutables dans un autre processus)
+def _build_allergens_ingredients():
+    from allergens import save_index
+    save_index("ingredients")
+
+
+def _build_allergens_meals():
+    from allergens import save_index
+    save_index("meals")
+
+
+def _build_substitutions():
+    from substitutions import save_substitutions
+    save_substitutions()
+
+
+def _build_menu_matrix():
+    from menu_matrix import build_or_update
+    build_or_update()
+
+
+def _build_food_index():
+    from index_build import build_catalog_index, catalog_corpus
+    from nutrition import load_ingredients_db
+    build_catalog_index(catalog_corpus(load_ingredients_db()))
+
+
+def _build_recipes_parquet():
+    from recipes_ingest import convert
+    convert(SOURCES["recipesDataset"])
+
+
+def _build_cooccurrence():
+    from cooccurrence import CooccurrenceMatrix
+    from recipes_ingest import RECIPES_PARQUET_PATH
+    CooccurrenceMatrix.from_recipes(RECIPES_PARQUET_PATH).save()
+
+
+def _build_dish_lsh():
+    from dish_lsh import DishIndex
+    from recipes_ingest import RECIPES_PARQUET_PATH
+    DishIndex.from_recipes(RECIPES_PARQUET_PATH).save()
+
+
+# Versions des constructeurs : lues à la demande, certains modules sont lourds à importer
+def _food_index_version() -> str:
+    import food_search
+    return f"{food_search.EMBEDDINGS_BACKEND}:{food_search.EMBEDDINGS_MODEL}"
+
+
+def _menu_matrix_version() -> str:
+    from menu_matrix import PORTION_G
+    return f"v1:portion={PORTION_G}"
+
+
+def _substitutions_version() -> str:
+    from substitutions import SUBSTITUTIONS_VERSION
+    return f"v{SUBSTITUTIONS_VERSION}"
+
+
+def _tokens_version() -> str:
+    from cooccurrence import TOKENS_VERSION
+    return f"tokens-v{TOKENS_VERSION}"
+
+
+def _cooccurrence_version() -> str:
+    from cooccurrence import MIN_COUNT
+    return f"{_tokens_version()}:min_count={MIN_COUNT}"
+
+
+def _dish_lsh_version() -> str:
+    from dish_lsh import BANDS, NAME_COLUMN, NUM_PERM, SEED
+    return f"{_tokens_version()}:perm={NUM_PERM}:bands={BANDS}:seed={SEED}:name={NAME_COLUMN}"
+
+
+@dataclass(frozen=True)
+class Target:
+    """Artefact dérivé : entrées (sources ou cibles), version du constructeur, sorties et constructeur.
+
+    Une cible hors `default` n'est construite et vérifiée que si elle est demandée explicitement.
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    version: Callable[[], str]
+    outputs: Tuple[Path, ...]
+    build: Callable[[], None]
+    default: bool = True
+
+
+TARGETS: Dict[str, Target] = {target.name: target for target in (
+    Target("allergens_ingredients", ("ingredients_db.csv",), lambda: f"terms-v{TERMS_VERSION}",
+           (ARTIFACTS_DIR / "allergens_ingredients.npz",), _build_allergens_ingredients),
+    Target("allergens_meals", ("meals.csv",), lambda: f"terms-v{TERMS_VERSION}",
+           (ARTIFACTS_DIR / "allergens_meals.npz",), _build_allergens_meals),
+    Target("substitutions", ("ingredients_db.csv",), _substitutions_version,
+           (ARTIFACTS_DIR / "substitutions.json",), _build_substitutions),
+    Target("menu_matrix", ("meals.csv",), _menu_matrix_version,
+           (ARTIFACTS_DIR / "menu_matrix.npz",), _build_menu_matrix),
+    # Index du catalogue (index_build) : lu par aucun chemin de recherche, construit sur demande seulement
+    Target("food_index", ("ingredients_db.csv",), _food_index_version,
+           (ARTIFACTS_DIR / "food_index" / "vectors.npy", ARTIFACTS_DIR / "food_index" / "corpus.csv"),
+           _build_food_index, default=False),
+    Target("recipes_parquet", ("recipesDataset",), _tokens_version,
+           (ARTIFACTS_DIR / "recipes.parquet",), _build_recipes_parquet),
+    Target("cooccurrence", ("recipes_parquet",), _cooccurrence_version,
+           (ARTIFACTS_DIR / "cooccurrence.npz",), _build_cooccurrence),
+    Target("dish_lsh", ("recipes_parquet",), _dish_lsh_version,
+           tuple(ARTIFACTS_DIR / "dish_lsh" / name for name in ("signatures.npy", "dish_ids.npy", "band_keys.npy",
+                                                                 "band_order.npy", "index.json")),
+           _build_dish_lsh),
+)}
+DEFAULT_TARGETS: Tuple[str, ...] = tuple(name for name, target in TARGETS.items() if target.default)
+
+
+# Manifeste et empreintes
+def load_manifest(path: Path = MANIFEST_PATH) -> Dict:
+    path = Path(path)
+    if not path.exists():
+        return {"files": {}, "targets": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(manifest: Dict, path: Path = MANIFEST_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path: Path, files: Dict[str, Dict]) -> Optional[str]:
+    """SHA-256 du fichier (None s'il manque) ; relu seulement si sa taille ou sa date ont changé depuis
+    l'empreinte gardée dans `files`, mis à jour en place"""
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    cached = files.get(str(path))
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    files[str(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def _order(names: Sequence[str]) -> List[str]:
+    """Cibles `names` et leurs dépendances, chaque cible après ses entrées"""
+    ordered: List[str] = []
+
+    def visit(name: str):
+        if name in ordered:
+            return
+        for dependency in TARGETS[name].inputs:
+            if dependency in TARGETS:
+                visit(dependency)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def plan(names: Optional[Sequence[str]] = None, manifest: Optional[Dict] = None) -> Dict[str, Dict]:
+    """État de chaque cible (DEFAULT_TARGETS sans `names`) : {"status", "key", "inputs"} ; status vaut "fresh",
+    "stale" (clé changée), "missing" (jamais construite ou sortie absente) ou "unavailable" (source absente)"""
+    manifest = load_manifest() if manifest is None else manifest
+    states: Dict[str, Dict] = {}
+    for name in _order(names or list(DEFAULT_TARGETS)):
+        target = TARGETS[name]
+        inputs: Dict[str, Optional[str]] = {}
+        for dependency in target.inputs:
+            if dependency in TARGETS:
+                upstream = states[dependency]
+                inputs[dependency] = None if upstream["status"] == "unavailable" else upstream["key"]
+            else:
+                inputs[dependency] = file_fingerprint(SOURCES[dependency], manifest["files"])
+        if any(value is None for value in inputs.values()):
+            states[name] = {"status": "unavailable", "key": None, "inputs": inputs}
+            continue
+        key = hashlib.sha256(json.dumps({"version": target.version(), "inputs": inputs},
+                                        sort_keys=True).encode()).hexdigest()
+        built = manifest["targets"].get(name)
+        if built is None or not all(Path(output).exists() for output in target.outputs):
+            status = "missing"
+        else:
+            status = "fresh" if built["key"] == key else "stale"
+        states[name] = {"status": status, "key": key, "inputs": inputs}
+    return states
+
+
+def _run_target(name: str) -> float:
+    start = time.perf_counter()
+    TARGETS[name].build()
+    return time.perf_counter() - start
+
+
+def build(names: Optional[Sequence[str]] = None, jobs: int = os.cpu_count() or 1, force: bool = False,
+          manifest_path: Path = MANIFEST_PATH) -> Dict[str, str]:
+    """Reconstruit les cibles périmées (ou toutes avec `force`), chacune dès que ses entrées sont prêtes,
+    jusqu'à `jobs` à la fois ; le manifeste est écrit après chaque cible. Renvoie le résultat par cible :
+    "fresh", "built", "failed", "skipped" (entrée en échec) ou "unavailable" """
+    manifest = load_manifest(manifest_path)
+    states = plan(names, manifest)
+    results = {name: state["status"] for name, state in states.items()
+               if state["status"] in ("fresh", "unavailable") and not (force and state["status"] == "fresh")}
+    todo = [name for name in states if name not in results]
+
+    def record(name: str, seconds: float):
+        target = TARGETS[name]
+        manifest["targets"][name] = {
+            "key": states[name]["key"], "version": target.version(), "inputs": states[name]["inputs"],
+            "outputs": [str(output) for output in target.outputs], "seconds": round(seconds, 3),
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        save_manifest(manifest, manifest_path)
+        results[name] = "built"
+        logger.info("%s construit en %.1f s", name, seconds)
+
+    def ready(name: str) -> bool:
+        return all(results.get(dependency) in ("fresh", "built") for dependency in TARGETS[name].inputs
+                   if dependency in TARGETS)
+
+    def blocked(name: str) -> bool:
+        return any(results.get(dependency) in ("failed", "skipped") for dependency in TARGETS[name].inputs
+                   if dependency in TARGETS)
+
+    def fail(name: str, error: BaseException):
+        results[name] = "failed"
+        logger.error("%s : échec de la construction (%s)", name, error)
+
+    if jobs <= 1:
+        for name in todo:
+            if blocked(name):
+                results[name] = "skipped"
+                continue
+            try:
+                record(name, _run_target(name))
+            except Exception as error:
+                fail(name, error)
+        return results
+
+    # Processus "spawn" : chaque constructeur importe ses propres modules (modèles, threads BLAS)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+        running = {}
+        while todo or running:
+            for name in [name for name in todo if blocked(name)]:
+                results[name] = "skipped"
+                todo.remove(name)
+            for name in [name for name in todo if ready(name)]:
+                running[pool.submit(_run_target, name)] = name
+                todo.remove(name)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    record(name, future.result())
+                except Exception as error:
+                    fail(name, error)
+    return results
+
+
+@lru_cache(maxsize=None)
+def stale_artifacts() -> Tuple[str, ...]:
+    """Cibles à reconstruire (périmées ou jamais construites), vérifiées une fois par processus ;
+    les cibles dont une source manque ne sont pas signalées"""
+    try:
+        states = plan()
+    except (OSError, ValueError) as error:
+        logger.warning("Manifeste des artefacts illisible : %s", error)
+        return DEFAULT_TARGETS
+    stale = tuple(name for name, state in states.items() if state["status"] in ("stale", "missing"))
+    if stale:
+        logger.warning("Artefacts à reconstruire (python build_pipeline.py) : %s", ", ".join(stale))
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("targets", nargs="*", metavar="TARGET",
+                        help=f"cibles à construire avec leurs dépendances (défaut : {', '.join(DEFAULT_TARGETS)}) ; "
+                             f"sur demande : {', '.join(sorted(set(TARGETS) - set(DEFAULT_TARGETS)))}")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="constructions en parallèle")
+    parser.add_argument("--force", action="store_true", help="reconstruit même les cibles à jour")
+    parser.add_argument("--status", action="store_true", help="affiche l'état des cibles sans rien construire")
+    args = parser.parse_args()
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"cibles inconnues : {', '.join(unknown)}")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        manifest = load_manifest()
+        for name, state in plan(args.targets or None, manifest).items():
+            print(f"{name:<24}{state['status']}")
+        return
+    start = time.perf_counter()
+    results = build(args.targets or None, args.jobs, args.force)
+    for name, result in results.items():
+        print(f"{name:<24}{result}")
+    print(f"{time.perf_counter() - start:.1f} s")
+    if "failed" in results.values():
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
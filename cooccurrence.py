@@ -0,0 +1,262 @@
+"""
+Limeat - Co-occurrences d'ingrédients dans recipesDataset
+
+La base de recettes "peut être utilisée pour tester si des ingrédients vont
+bien ensemble" (readme du datathon). Un job hors-ligne lit le fichier par
+morceaux, normalise chaque nom d'ingrédient une fois, et accumule la matrice
+creuse ingrédient × ingrédient des recettes communes (scipy CSR, diagonale =
+nombre de recettes de chaque ingrédient), enregistrée dans un .npz.
+
+La compatibilité d'un ingrédient avec un repas est la moyenne de son PMI
+normalisé (NPMI, entre -1 et 1) avec les ingrédients du repas : quelques
+lignes creuses lues, sans appel au modèle.
+
+Usage :
+    python cooccurrence.py --recipes datathon_Schoolab-main/data/recipesDataset
+    python cooccurrence.py --pair "ground beef" "kidney bean"
+"""
+import argparse
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from allergens import ARTIFACTS_DIR
+from bilingual_search import normalize_name
+from index_build import RECIPES_PATH
+
+COOCCURRENCE_PATH = ARTIFACTS_DIR / "cooccurrence.npz"
+# Recettes lues par morceau, et nombre minimal de recettes communes pour qu'une paire compte
+CHUNK_SIZE = int(os.getenv("LIMEAT_RECIPES_CHUNK_SIZE", 50_000))
+MIN_COUNT = int(os.getenv("LIMEAT_COOCCURRENCE_MIN_COUNT", 2))
+# Version de la normalisation des noms : la changer invalide les matrices enregistrées
+TOKENS_VERSION = 2
+
+
+def normalize_ingredient(name: str) -> str:
+    """Nom d'ingrédient de recette normalisé (anglais) : "Red Kidney Beans" -> "red kidney bean" """
+    return normalize_name(name, "en")
+
+
+def read_recipe_frames(path: Path, chunksize: int = CHUNK_SIZE, columns: Sequence[str] = ()) -> Iterator[pd.DataFrame]:
+    """Morceaux de `chunksize` recettes : ingredient_names (listes de noms bruts) et les autres `columns`.
+
+    Le découpage de la colonne ingredient_names est fait par les opérations de chaînes de pandas
+    sur tout le morceau, et non par un convertisseur appelé ligne à ligne. Depuis le .parquet de
+    recipes_ingest, ingredient_names contient les noms déjà normalisés (ingredient_tokens).
+    """
+    if Path(path).suffix == ".parquet":
+        from recipes_ingest import iter_recipe_frames
+
+        for chunk in iter_recipe_frames(path, ["ingredient_tokens", *columns], chunksize):
+            yield chunk.rename(columns={"ingredient_tokens": "ingredient_names"})
+        return
+    for chunk in pd.read_csv(path, usecols=["ingredient_names", *columns], chunksize=chunksize):
+        chunk = chunk.dropna(subset=["ingredient_names"])
+        names = chunk["ingredient_names"].str.strip("[]").str.replace("'", "", regex=False)
+        yield chunk.assign(ingredient_names=names.str.split(", "))
+
+
+def read_recipe_chunks(path: Path, chunksize: int = CHUNK_SIZE) -> Iterator[List[List[str]]]:
+    """Listes de noms d'ingrédients (bruts) des recettes, par morceaux de `chunksize` recettes"""
+    for chunk in read_recipe_frames(path, chunksize):
+        yield chunk["ingredient_names"].tolist()
+
+
+def english_name(english_food_name: str) -> str:
+    """Nom anglais usuel d'un aliment, comme dans les recettes : "Kidney bean, red, cooked" -> "kidney bean" """
+    return re.split(r"[,(]", english_food_name)[0].strip().lower()
+
+
+def source_key(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(f"tokens-v{TOKENS_VERSION}".encode())
+    return digest.hexdigest()
+
+
+class CooccurrenceMatrix:
+    """Nombre de recettes communes à chaque paire d'ingrédients normalisés"""
+
+    def __init__(self, counts: sparse.csr_matrix, vocabulary: Sequence[str], n_recipes: int, key: str = ""):
+        self.counts = counts.tocsr()
+        self.vocabulary = list(vocabulary)
+        self.ids: Dict[str, int] = {token: i for i, token in enumerate(self.vocabulary)}
+        self.n_recipes = n_recipes
+        self.key = key
+        self._npmi: Optional[sparse.csr_matrix] = None
+
+    def __len__(self) -> int:
+        return len(self.vocabulary)
+
+    @classmethod
+    def build(cls, chunks: Iterator[List[List[str]]], min_count: int = MIN_COUNT,
+              key: str = "") -> "CooccurrenceMatrix":
+        """Accumule les co-occurrences de recettes lues par morceaux (mémoire bornée par le morceau
+        et par la matrice creuse elle-même)"""
+        ids: Dict[str, int] = {}
+        normalized: Dict[str, int] = {}  # nom brut -> identifiant, chaque nom n'est normalisé qu'une fois
+        counts = sparse.csr_matrix((0, 0), dtype=np.int64)
+        n_recipes = 0
+        for recipes in chunks:
+            rows, columns = [], []
+            for recipe in recipes:
+                tokens = set()
+                for name in recipe:
+                    token_id = normalized.get(name)
+                    if token_id is None:
+                        token = normalize_ingredient(name)
+                        token_id = normalized[name] = ids.setdefault(token, len(ids)) if token else -1
+                    if token_id >= 0:
+                        tokens.add(token_id)
+                if tokens:
+                    columns.extend(tokens)
+                    rows.extend([n_recipes] * len(tokens))
+                    n_recipes += 1
+            if not rows:
+                continue
+            # Incidence recettes × ingrédients du morceau, puis produit creux R^T R
+            rows = np.asarray(rows, dtype=np.int64)
+            rows -= rows[0]
+            incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)),
+                                          shape=(int(rows[-1]) + 1, len(ids)))
+            counts.resize((len(ids), len(ids)))
+            counts = counts + (incidence.T @ incidence).tocsr()
+
+        counts = counts.tocsr()
+        if min_count > 1:
+            diagonal = counts.diagonal()
+            counts.data[counts.data < min_count] = 0
+            counts.setdiag(diagonal)
+            counts.eliminate_zeros()
+        vocabulary = sorted(ids, key=ids.get)
+        return cls(counts, vocabulary, n_recipes, key)
+
+    @classmethod
+    def from_recipes(cls, path: Path = RECIPES_PATH, chunksize: int = CHUNK_SIZE,
+                     min_count: int = MIN_COUNT) -> "CooccurrenceMatrix":
+        return cls.build(read_recipe_chunks(Path(path), chunksize), min_count, source_key(Path(path)))
+
+    def save(self, path: Path = COOCCURRENCE_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+                 vocabulary=np.asarray(self.vocabulary, dtype=str), n_recipes=self.n_recipes, key=self.key)
+
+    @classmethod
+    def load(cls, path: Path = COOCCURRENCE_PATH) -> Optional["CooccurrenceMatrix"]:
+        """Matrice enregistrée par save, ou None si elle manque"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as saved:
+            n = len(saved["vocabulary"])
+            counts = sparse.csr_matrix((saved["data"], saved["indices"], saved["indptr"]), shape=(n, n))
+            return cls(counts, saved["vocabulary"].tolist(), int(saved["n_recipes"]), str(saved["key"]))
+
+    @property
+    def npmi(self) -> sparse.csr_matrix:
+        """PMI normalisé de chaque paire observée : log(p(a,b) / p(a)p(b)) / -log p(a,b), diagonale nulle"""
+        if self._npmi is None:
+            counts = self.counts.tocoo()
+            off_diagonal = counts.row != counts.col
+            row, col, joint = counts.row[off_diagonal], counts.col[off_diagonal], counts.data[off_diagonal]
+            frequency = self.counts.diagonal().astype(np.float64)
+            p_joint = joint / self.n_recipes
+            pmi = np.log(p_joint) - np.log(frequency[row] / self.n_recipes) - np.log(frequency[col] / self.n_recipes)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                npmi = np.where(p_joint < 1, pmi / -np.log(p_joint), 1.0)
+            self._npmi = sparse.csr_matrix((npmi, (row, col)), shape=self.counts.shape)
+        return self._npmi
+
+    def token_id(self, name: str) -> Optional[int]:
+        """Identifiant d'un nom d'ingrédient ; à défaut, celui de son dernier mot ("red kidney bean" -> "bean")"""
+        token = normalize_ingredient(name)
+        if token in self.ids:
+            return self.ids[token]
+        words = token.split()
+        return self.ids.get(words[-1]) if words else None
+
+    def pair_score(self, a: str, b: str) -> Optional[float]:
+        """NPMI de deux noms d'ingrédients (0 s'ils n'apparaissent jamais ensemble), None si l'un est inconnu"""
+        i, j = self.token_id(a), self.token_id(b)
+        if i is None or j is None:
+            return None
+        return float(self.npmi[i, j])
+
+    def compatibility_ids(self, meal_ids: Sequence[int], candidate_ids: Sequence[int]) -> np.ndarray:
+        """Compatibilité (entre 0 et 1) de chaque candidat avec le repas : moyenne des NPMI positifs avec
+        ses ingrédients ; les lignes des ingrédients du repas sont les seules lues"""
+        meal_ids, candidate_ids = np.asarray(meal_ids, dtype=np.intp), np.asarray(candidate_ids, dtype=np.intp)
+        if len(meal_ids) == 0 or len(candidate_ids) == 0:
+            return np.zeros(len(candidate_ids))
+        npmi = self.npmi[meal_ids][:, candidate_ids].toarray()
+        return np.clip(npmi, 0, None).mean(axis=0)
+
+    def compatibility(self, meal: Sequence[str], candidate: str) -> Optional[float]:
+        """Compatibilité d'un ingrédient avec les ingrédients d'un repas (noms), None si inconnu"""
+        candidate_id = self.token_id(candidate)
+        meal_ids = [i for i in (self.token_id(name) for name in meal) if i is not None]
+        if candidate_id is None or not meal_ids:
+            return None
+        return float(self.compatibility_ids(meal_ids, [candidate_id])[0])
+
+    def for_ingredients_db(self, ingredients_db: pd.DataFrame) -> Callable[[np.ndarray, np.ndarray], np.ndarray]:
+        """Fonction (lignes du repas, lignes candidates) -> compatibilité, pour local_suggestions.
+
+        Chaque aliment de la base est rattaché au nom de recette de son nom anglais usuel
+        ("Kidney bean, red, cooked" -> "kidney bean") ; la compatibilité est NaN pour les aliments sans
+        équivalent, ou si aucun ingrédient du repas n'en a.
+        """
+        names = ingredients_db["EnglishFoodName"].fillna("").map(english_name)
+        token_ids = np.array([-1 if i is None else i for i in map(self.token_id, names)], dtype=np.intp)
+
+        def compatibility(rows: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+            meal_ids = token_ids[rows]
+            meal_ids = np.unique(meal_ids[meal_ids >= 0])
+            candidate_ids = token_ids[candidates]
+            fit = np.full(len(candidates), np.nan)
+            known = candidate_ids >= 0
+            if len(meal_ids):
+                fit[known] = self.compatibility_ids(meal_ids, candidate_ids[known])
+            return fit
+
+        return compatibility
+
+
+def load_compatibility(ingredients_db: pd.DataFrame,
+                       path: Path = COOCCURRENCE_PATH) -> Optional[Callable[[np.ndarray, np.ndarray], np.ndarray]]:
+    """Compatibilité par co-occurrences pour une base d'ingrédients, ou None sans matrice construite"""
+    matrix = CooccurrenceMatrix.load(path)
+    return None if matrix is None else matrix.for_ingredients_db(ingredients_db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", help=f"recipesDataset à lire (par exemple {RECIPES_PATH})")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--min-count", type=int, default=MIN_COUNT)
+    parser.add_argument("--path", default=str(COOCCURRENCE_PATH))
+    parser.add_argument("--pair", nargs=2, metavar="NAME", help="NPMI de deux ingrédients")
+    args = parser.parse_args()
+
+    if args.recipes:
+        matrix = CooccurrenceMatrix.from_recipes(Path(args.recipes), args.chunksize, args.min_count)
+        matrix.save(args.path)
+        print(f"{matrix.n_recipes} recettes, {len(matrix)} ingrédients, {matrix.counts.nnz} paires -> {args.path}")
+    if args.pair:
+        matrix = CooccurrenceMatrix.load(args.path)
+        if matrix is None:
+            parser.error(f"{args.path} absent : lancer d'abord --recipes")
+        print(matrix.pair_score(*args.pair))
+
+
+if __name__ == "__main__":
+    main()
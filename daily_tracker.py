@@ -0,0 +1,173 @@
+"""
+Limeat - Suivi incrémental des apports de la journée
+
+Un DayLedger garde, pour un utilisateur et un jour, la somme courante des
+vecteurs d'apports des repas enregistrés. Ajouter, remplacer ou retirer un
+repas met à jour ces totaux par une seule addition de vecteurs, quel que soit
+le nombre de repas déjà présents ; besoins restants et score de la journée se
+lisent directement sur les totaux. Un IntakeTracker répercute chaque
+modification sur les totaux de la semaine et de toute la période.
+"""
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from meal import MAX_VEGETABLES_PROPORTION, Meal
+from nutrition import NutrientTable
+from scoring import compute_daily_score_from_totals
+
+# Clés des valeurs nutritionnelles de l'application -> identifiants des nutriments
+MACRO_IDS = {"calories": "208", "proteines": "203", "glucides": "205", "lipides": "204", "fibres": "291"}
+
+# Petits-déjeuners proposés sur la page de configuration
+BREAKFAST_PRESETS = {
+    "continental": {"calories": 400, "proteines": 8, "glucides": 65, "lipides": 12},
+    "complet": {"calories": 600, "proteines": 20, "glucides": 45, "lipides": 25},
+    "healthy": {"calories": 350, "proteines": 15, "glucides": 50, "lipides": 8},
+    "vegan": {"calories": 380, "proteines": 12, "glucides": 60, "lipides": 10},
+}
+
+ChangeListener = Callable[["DayLedger", np.ndarray], None]
+
+
+class _Entry:
+    """Contribution d'un repas aux totaux de la journée"""
+    __slots__ = ("nutrients", "grams", "vegetables_g", "scored")
+
+    def __init__(self, nutrients: np.ndarray, grams: float = 0.0, vegetables_g: float = 0.0, scored: bool = False):
+        self.nutrients = nutrients
+        self.grams = grams
+        self.vegetables_g = vegetables_g
+        self.scored = scored
+
+
+class DayLedger:
+    """Apports d'une journée, repas par repas ("petit-dejeuner", "dejeuner", "diner"...)
+
+    Seuls les repas détaillés ingrédient par ingrédient (set_meal) entrent dans le
+    score de la journée, comme dans compute_daily_score ; les valeurs globales
+    (set_nutrients : petit-déjeuner type, estimation du modèle) comptent dans les
+    apports consommés et les besoins restants.
+    """
+
+    def __init__(self, table: NutrientTable, day: Optional[date] = None, on_change: Optional[ChangeListener] = None):
+        self.table = table
+        self.day = day or date.today()
+        self.on_change = on_change
+        width = len(table.nutrient_ids)
+        self.totals = np.zeros(width)
+        self.scored_totals = np.zeros(width)
+        self.scored_grams = 0.0
+        self.scored_vegetables_g = 0.0
+        self._entries: Dict[str, _Entry] = {}
+        self._columns = {nutrient_id: i for i, nutrient_id in enumerate(table.nutrient_ids)}
+
+    # Enregistrement des repas
+    def set_meal(self, slot: str, meal: Meal):
+        """Enregistre (ou remplace) un repas détaillé"""
+        if meal.table is not self.table:
+            raise ValueError("Meal was built on a different ingredient table")
+        self._replace(slot, _Entry(meal.nutrients(), float(meal.grams.sum()), meal.vegetables_grams(), scored=True))
+
+    def set_nutrients(self, slot: str, values: Dict[str, float]):
+        """Enregistre (ou remplace) des apports globaux, au format {"calories": ..., "proteines": ...}
+        ou {nutrient_id: ...} ; les clés inconnues sont ignorées"""
+        nutrients = np.zeros(len(self.table.nutrient_ids))
+        for key, value in values.items():
+            column = self._columns.get(MACRO_IDS.get(key, key))
+            if column is not None:
+                nutrients[column] += float(value or 0)
+        self._replace(slot, _Entry(nutrients))
+
+    def remove(self, slot: str):
+        entry = self._entries.pop(slot, None)
+        if entry is not None:
+            self._apply(entry, -1)
+
+    def _replace(self, slot: str, entry: _Entry):
+        self.remove(slot)
+        self._entries[slot] = entry
+        self._apply(entry, 1)
+
+    def _apply(self, entry: _Entry, sign: int):
+        delta = entry.nutrients if sign > 0 else -entry.nutrients
+        self.totals += delta
+        if entry.scored:
+            self.scored_totals += delta
+            self.scored_grams += sign * entry.grams
+            self.scored_vegetables_g += sign * entry.vegetables_g
+        if self.on_change is not None:
+            self.on_change(self, delta)
+
+    def __contains__(self, slot: str) -> bool:
+        return slot in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Lecture des totaux
+    def consumed(self) -> Dict[str, float]:
+        """Apports consommés, au format des valeurs nutritionnelles de l'application"""
+        return {key: float(self.totals[self._columns[nutrient_id]])
+                for key, nutrient_id in MACRO_IDS.items() if nutrient_id in self._columns}
+
+    def remaining_needs(self, daily_needs: Dict[str, float]) -> Dict[str, float]:
+        """Besoins restants : besoins journaliers moins les apports déjà enregistrés"""
+        consumed = self.consumed()
+        return {k: daily_needs[k] - consumed.get(k, 0) for k in daily_needs.keys()}
+
+    def daily_score(self, userProfile: Dict) -> Optional[Tuple[float, float, float]]:
+        """(score, sous-score énergie, sous-score macro) des repas détaillés, ou None s'il n'y en a pas"""
+        if self.scored_grams <= 0:
+            return None
+        vegetables_proportion = min(self.scored_vegetables_g / self.scored_grams, MAX_VEGETABLES_PROPORTION)
+        return compute_daily_score_from_totals(self.table.to_dict(self.scored_totals), vegetables_proportion,
+                                               userProfile)
+
+
+class IntakeTracker:
+    """Journées d'un utilisateur, avec totaux par semaine ISO et sur toute la période tenus à jour"""
+
+    def __init__(self, table: NutrientTable):
+        self.table = table
+        self.days: Dict[date, DayLedger] = {}
+        self.totals = np.zeros(len(table.nutrient_ids))
+        self._weeks: Dict[Tuple[int, int], np.ndarray] = {}
+        self._week_days: Dict[Tuple[int, int], int] = {}
+
+    def day(self, day: Optional[date] = None) -> DayLedger:
+        """Journal du jour demandé (aujourd'hui par défaut), créé au besoin"""
+        day = day or date.today()
+        ledger = self.days.get(day)
+        if ledger is None:
+            ledger = self.days[day] = DayLedger(self.table, day, on_change=self._on_change)
+            week = _week(day)
+            self._week_days[week] = self._week_days.get(week, 0) + 1
+        return ledger
+
+    def _on_change(self, ledger: DayLedger, delta: np.ndarray):
+        self.totals += delta
+        week = _week(ledger.day)
+        if week not in self._weeks:
+            self._weeks[week] = np.zeros(len(self.table.nutrient_ids))
+        self._weeks[week] += delta
+
+    def week_totals(self, day: date) -> Dict[str, float]:
+        """Apports cumulés de la semaine ISO contenant `day`"""
+        return self.table.to_dict(self._weeks.get(_week(day), np.zeros(len(self.table.nutrient_ids))))
+
+    def week_daily_average(self, day: date) -> Dict[str, float]:
+        """Apports moyens par jour suivi de la semaine ISO contenant `day`"""
+        days = self._week_days.get(_week(day), 0)
+        totals = self._weeks.get(_week(day), np.zeros(len(self.table.nutrient_ids)))
+        return self.table.to_dict(totals / days if days else totals)
+
+    def period_totals(self) -> Dict[str, float]:
+        """Apports cumulés de toutes les journées suivies"""
+        return self.table.to_dict(self.totals)
+
+
+def _week(day: date) -> Tuple[int, int]:
+    year, week, _ = day.isocalendar()
+    return year, week
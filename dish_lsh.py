@@ -0,0 +1,251 @@
+"""
+Limeat - Identification du plat par MinHash-LSH sur les recettes de recipesDataset
+
+get_ai_suggestions demande au modèle "le plat le plus probable" pour une liste
+d'ingrédients, en plusieurs secondes. Cet index répond localement : chaque
+recette est résumée par la signature MinHash de son ensemble d'ingrédients
+normalisés (NUM_PERM hachages, calculés en numpy pour des milliers de recettes
+à la fois), découpée en BANDS bandes. Deux recettes dont une bande est
+identique sont candidates ; leur similarité de Jaccard est estimée par la part
+de hachages égaux. Une requête coûte BANDS recherches dichotomiques dans des
+tableaux triés, bien en dessous de la milliseconde.
+
+L'index est construit en lisant le fichier par morceaux et enregistré dans un
+répertoire de .npy, relus en mémoire partagée (mmap). Le modèle n'est appelé
+que si aucune recette n'atteint MIN_JACCARD.
+
+Usage :
+    python dish_lsh.py --recipes datathon_Schoolab-main/data/recipesDataset
+    python dish_lsh.py --query "ground beef" "kidney bean" onion tomato
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allergens import ARTIFACTS_DIR
+from cooccurrence import CHUNK_SIZE, normalize_ingredient, read_recipe_frames, source_key
+from index_build import RECIPES_PATH
+
+DISH_INDEX_DIR = ARTIFACTS_DIR / "dish_lsh"
+# Hachages par signature, découpés en BANDS bandes de NUM_PERM / BANDS valeurs : seuil de Jaccard
+# à partir duquel une recette devient candidate ≈ (1 / BANDS) ** (BANDS / NUM_PERM), soit 0.5 ici
+NUM_PERM = int(os.getenv("LIMEAT_LSH_PERMUTATIONS", 64))
+BANDS = int(os.getenv("LIMEAT_LSH_BANDS", 16))
+# Similarité estimée minimale pour nommer le plat sans le modèle
+MIN_JACCARD = float(os.getenv("LIMEAT_DISH_MIN_JACCARD", 0.5))
+# Colonne du nom de recette dans recipesDataset
+NAME_COLUMN = os.getenv("LIMEAT_RECIPES_NAME_COLUMN", "name")
+# Recettes dont les hachages sont calculés ensemble (mémoire : SIGNATURE_BATCH × ingrédients × NUM_PERM)
+SIGNATURE_BATCH = 4096
+# Recettes lues au plus par bande d'une requête : au-delà, les recettes d'un même seau sont presque identiques
+MAX_BUCKET = 64
+SEED = 0
+
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def token_hash(token: str) -> int:
+    """Hachage 64 bits stable d'un ingrédient normalisé (indépendant de PYTHONHASHSEED)"""
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+@lru_cache(maxsize=1 << 16)
+def ingredient_hash(name: str) -> int:
+    """Hachage d'un nom d'ingrédient brut une fois normalisé (0 si rien ne reste) ; chaque nom distinct
+    n'est normalisé qu'une fois"""
+    token = normalize_ingredient(name)
+    return token_hash(token) if token else 0
+
+
+def _hash_set(ingredients: Sequence[str]) -> np.ndarray:
+    tokens = {ingredient_hash(ingredient) for ingredient in ingredients}
+    tokens.discard(0)
+    return np.fromiter(tokens, dtype=np.uint64, count=len(tokens))
+
+
+class MinHasher:
+    """Famille de NUM_PERM hachages multiplicatifs : h_i(x) = ((x ^ sel_i) * mult_i) >> 32"""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = SEED):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.salts = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+        self.multipliers = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+
+    def hashes(self, token_hashes: np.ndarray) -> np.ndarray:
+        """(jetons, NUM_PERM) valeurs 32 bits ; le débordement des uint64 est voulu (arithmétique modulo 2^64)"""
+        values = np.asarray(token_hashes, dtype=np.uint64)[:, None] ^ self.salts
+        return ((values * self.multipliers) >> np.uint64(32)).astype(np.uint32)
+
+    def signatures(self, sets: Sequence[np.ndarray]) -> np.ndarray:
+        """Signatures (ensembles, NUM_PERM) d'ensembles non vides de hachages de jetons"""
+        lengths = np.fromiter((len(tokens) for tokens in sets), dtype=np.int64, count=len(sets))
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        return np.minimum.reduceat(self.hashes(np.concatenate(sets)), starts, axis=0)
+
+
+def band_keys(signatures: np.ndarray, bands: int = BANDS) -> np.ndarray:
+    """(bandes, signatures) clés 64 bits de chaque bande (FNV sur ses valeurs)"""
+    rows = signatures.shape[1] // bands
+    keys = np.zeros((bands, len(signatures)), dtype=np.uint64)
+    for band in range(bands):
+        for column in range(band * rows, (band + 1) * rows):
+            keys[band] = (keys[band] * _FNV_PRIME) ^ signatures[:, column].astype(np.uint64)
+    return keys
+
+
+class DishIndex:
+    """Signatures MinHash des recettes et bandes LSH triées, pour retrouver un plat par ses ingrédients"""
+
+    def __init__(self, signatures: np.ndarray, dish_ids: np.ndarray, names: Sequence[str],
+                 hasher: Optional[MinHasher] = None, bands: int = BANDS, key: str = "",
+                 sorted_keys: Optional[np.ndarray] = None, band_order: Optional[np.ndarray] = None):
+        """`sorted_keys` et `band_order` (bandes triées, enregistrées par save) sont calculés s'ils manquent"""
+        self.signatures = signatures
+        self.dish_ids = dish_ids
+        self.names = list(names)
+        self.hasher = hasher or MinHasher(signatures.shape[1])
+        self.bands = bands
+        self.key = key
+        if sorted_keys is None or band_order is None:
+            keys = band_keys(np.asarray(signatures), bands)
+            band_order = np.argsort(keys, axis=1, kind="stable").astype(np.int64)
+            sorted_keys = np.take_along_axis(keys, band_order, axis=1)
+        self.band_order = band_order
+        self.band_keys = sorted_keys
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    @classmethod
+    def build(cls, chunks: Iterator[pd.DataFrame], name_column: str = NAME_COLUMN, num_perm: int = NUM_PERM,
+              bands: int = BANDS, key: str = "") -> "DishIndex":
+        """Index des recettes lues par morceaux (DataFrames avec ingredient_names en listes et `name_column`)"""
+        hasher = MinHasher(num_perm)
+        names: Dict[str, int] = {}
+        signatures, dish_ids = [], []
+        for chunk in chunks:
+            sets, ids = [], []
+            for ingredients, name in zip(chunk["ingredient_names"], chunk[name_column].fillna("").astype(str)):
+                tokens = _hash_set(ingredients)
+                if len(tokens) and name.strip():
+                    sets.append(tokens)
+                    ids.append(names.setdefault(name.strip(), len(names)))
+            for start in range(0, len(sets), SIGNATURE_BATCH):
+                signatures.append(hasher.signatures(sets[start:start + SIGNATURE_BATCH]))
+            dish_ids.extend(ids)
+        signatures = np.concatenate(signatures) if signatures else np.zeros((0, num_perm), dtype=np.uint32)
+        # Une seule ligne par (plat, signature) : les recettes au même ensemble d'ingrédients ne servent à rien
+        rows = np.unique(np.column_stack([np.asarray(dish_ids, dtype=np.uint32), signatures]), axis=0)
+        return cls(np.ascontiguousarray(rows[:, 1:]), rows[:, 0].astype(np.int32), sorted(names, key=names.get),
+                   hasher, bands, key)
+
+    @classmethod
+    def from_recipes(cls, path: Path = RECIPES_PATH, chunksize: int = CHUNK_SIZE,
+                     name_column: str = NAME_COLUMN) -> "DishIndex":
+        chunks = read_recipe_frames(Path(path), chunksize, [name_column])
+        return cls.build(chunks, name_column, key=source_key(Path(path)))
+
+    def save(self, out_dir: Path = DISH_INDEX_DIR):
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        np.save(out_dir / "signatures.npy", self.signatures)
+        np.save(out_dir / "dish_ids.npy", self.dish_ids)
+        np.save(out_dir / "band_keys.npy", self.band_keys)
+        np.save(out_dir / "band_order.npy", self.band_order)
+        with open(out_dir / "index.json", "w", encoding="utf-8") as f:
+            json.dump({"names": self.names, "num_perm": self.hasher.num_perm, "bands": self.bands,
+                       "seed": SEED, "key": self.key}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, out_dir: Path = DISH_INDEX_DIR) -> Optional["DishIndex"]:
+        """Index enregistré par save, ou None s'il manque ; signatures et bandes triées sont lues en mmap,
+        rien n'est recalculé au chargement"""
+        out_dir = Path(out_dir)
+        if not (out_dir / "index.json").exists():
+            return None
+        with open(out_dir / "index.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        # Index enregistré sans ses bandes : elles sont recalculées
+        bands = [np.load(out_dir / name, mmap_mode="r") if (out_dir / name).exists() else None
+                 for name in ("band_keys.npy", "band_order.npy")]
+        return cls(np.load(out_dir / "signatures.npy", mmap_mode="r"), np.load(out_dir / "dish_ids.npy", mmap_mode="r"),
+                   meta["names"], MinHasher(meta["num_perm"], meta["seed"]), meta["bands"], meta["key"], *bands)
+
+    def signature(self, ingredients: Sequence[str]) -> Optional[np.ndarray]:
+        """Signature d'une liste de noms d'ingrédients, ou None si aucun n'est exploitable"""
+        tokens = _hash_set(ingredients)
+        return self.hasher.signatures([tokens])[0] if len(tokens) else None
+
+    def query(self, ingredients: Sequence[str], k: int = 5) -> List[Tuple[str, float]]:
+        """(nom du plat, Jaccard estimé) des k plats les plus proches, du plus proche au moins proche"""
+        signature = self.signature(ingredients)
+        if signature is None or len(self) == 0:
+            return []
+        keys = band_keys(signature[None, :], self.bands)[:, 0]
+        candidates = []
+        for band, key in enumerate(keys):
+            lo = np.searchsorted(self.band_keys[band], key, side="left")
+            hi = min(np.searchsorted(self.band_keys[band], key, side="right"), lo + MAX_BUCKET)
+            if hi > lo:
+                candidates.append(self.band_order[band, lo:hi])
+        if not candidates:
+            return []
+        candidates = np.unique(np.concatenate(candidates))
+        jaccard = (np.asarray(self.signatures[candidates]) == signature).mean(axis=1)
+
+        # Meilleure recette de chaque plat
+        best: Dict[int, float] = {}
+        for dish, value in zip(self.dish_ids[candidates].tolist(), jaccard.tolist()):
+            if value > best.get(dish, -1.0):
+                best[dish] = value
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:k]
+        return [(self.names[dish], value) for dish, value in ranked]
+
+    def identify(self, ingredients: Sequence[str], min_jaccard: float = MIN_JACCARD) -> Optional[str]:
+        """Nom du plat le plus proche s'il atteint `min_jaccard`, sinon None (le modèle prend le relais)"""
+        matches = self.query(ingredients, 1)
+        return matches[0][0] if matches and matches[0][1] >= min_jaccard else None
+
+
+@lru_cache(maxsize=None)
+def get_dish_index() -> Optional[DishIndex]:
+    """Index enregistré partagé par le processus, ou None s'il n'a pas été construit"""
+    return DishIndex.load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipes", help=f"recipesDataset à indexer (par exemple {RECIPES_PATH})")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--name-column", default=NAME_COLUMN)
+    parser.add_argument("--dir", default=str(DISH_INDEX_DIR))
+    parser.add_argument("--query", nargs="+", metavar="INGREDIENT", help="plats les plus proches de ces ingrédients")
+    args = parser.parse_args()
+
+    if args.recipes:
+        start = time.perf_counter()
+        index = DishIndex.from_recipes(Path(args.recipes), args.chunksize, args.name_column)
+        index.save(args.dir)
+        print(f"{len(index)} recettes, {len(index.names)} plats en {time.perf_counter() - start:.1f} s -> {args.dir}")
+    if args.query:
+        index = DishIndex.load(args.dir)
+        if index is None:
+            parser.error(f"{args.dir} absent : lancer d'abord --recipes")
+        start = time.perf_counter()
+        matches = index.query(args.query)
+        print(f"{(time.perf_counter() - start) * 1e3:.2f} ms")
+        for name, jaccard in matches:
+            print(f"{jaccard:.2f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Limeat - Regroupement des requêtes d'embeddings (micro-batching)
+
+Chaque recherche d'ingrédient encode une seule chaîne, ce qui laisse inutilisée
+la plus grande partie du débit du transformeur. L'EmbeddingBatcher collecte
+les requêtes des threads appelants pendant quelques millisecondes (ou jusqu'à
+une taille de lot maximale), les encode en une passe, lance une seule
+recherche dans l'index et résout le Future de chaque appelant.
+
+    batcher = EmbeddingBatcher(index)
+    search_matching_food("apple", ingredients_db, batcher)   # à la place de l'index
+    batcher.stats()                                          # débit, tailles de lots, latences
+
+Usage (réglage de la fenêtre d'attente) :
+    python embedding_batcher.py --threads 32 --wait-ms 0 2 5 10
+"""
+import argparse
+import bisect
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import food_search
+
+MAX_BATCH = int(os.getenv("LIMEAT_BATCH_MAX_SIZE", 32))
+MAX_WAIT_MS = float(os.getenv("LIMEAT_BATCH_MAX_WAIT_MS", 5))
+
+LATENCY_BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BATCH_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    """Histogramme à bornes fixes ; les percentiles renvoient la borne supérieure du seau"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, value: float, count: int = 1):
+        self.counts[bisect.bisect_left(self.bounds, value)] += count
+        self.total += count
+        self.sum += value * count
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = p * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {"count": self.total, "mean": self.sum / self.total if self.total else None,
+                "p50": self.percentile(0.50), "p95": self.percentile(0.95), "p99": self.percentile(0.99),
+                "buckets": {label: count for label, count in zip(labels, self.counts) if count}}
+
+
+class _Pending:
+    __slots__ = ("text", "k", "future", "enqueued")
+
+    def __init__(self, text: str, k: int):
+        self.text = text
+        self.k = k
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """File d'attente de requêtes textuelles, encodées et cherchées dans `index` par lots.
+
+    S'utilise à la place de l'index dans search_matching_food / search_top_n_matching_food :
+    les textes reçus sont déjà prétraités (preprocess_text).
+    """
+
+    def __init__(self, index, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.index = index
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reset_stats()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def submit(self, text: str, k: int) -> Future:
+        """Future de (distances, indices) de forme (1, k), comme index.search pour une requête"""
+        pending = _Pending(text, k)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            self._queue.put(pending)
+        return pending.future
+
+    def search_text(self, text: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.submit(text, k).result()
+
+    def close(self):
+        """Traite les requêtes en attente puis arrête le thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def __enter__(self) -> "EmbeddingBatcher":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Thread de traitement
+    def _run(self):
+        closing = False
+        while not closing:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    pending = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None:
+                    closing = True
+                    break
+                batch.append(pending)
+            self._process(batch)
+        # Requêtes arrivées avant la fermeture mais pas encore lues
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending is not None:
+                self._process([pending])
+
+    def _process(self, batch: List[_Pending]):
+        started = time.perf_counter()
+        texts = list(dict.fromkeys(pending.text for pending in batch))  # textes identiques encodés une fois
+        try:
+            vectors = food_search.encode(texts).reshape(len(texts), -1)
+            food_search.normalize_L2(vectors)
+            distances, indices = self.index.search(vectors, max(pending.k for pending in batch))
+        except BaseException as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        rows = {text: row for row, text in enumerate(texts)}
+        for pending in batch:
+            row = rows[pending.text]
+            pending.future.set_result((distances[row:row + 1, :pending.k], indices[row:row + 1, :pending.k]))
+
+        with self._lock:
+            self.batch_sizes.add(len(batch))
+            self.encode_ms.add((finished - started) * 1e3)
+            for pending in batch:
+                self.queue_ms.add((started - pending.enqueued) * 1e3)
+                self.latency_ms.add((finished - pending.enqueued) * 1e3)
+            self.queries += len(batch)
+            self.batches += 1
+            self.busy_s += finished - started
+
+    def _reset_stats(self):
+        self.batch_sizes = Histogram(BATCH_BOUNDS)
+        self.queue_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.encode_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.latency_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.queries = 0
+        self.batches = 0
+        self.busy_s = 0.0
+        self.since = time.perf_counter()
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    def stats(self) -> Dict:
+        """Débit, tailles de lots et latences (attente en file, encodage + recherche, bout en bout) en ms"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.since
+            return {"queries": self.queries, "batches": self.batches,
+                    "queries_per_s": self.queries / elapsed if elapsed else 0.0,
+                    "busy_queries_per_s": self.queries / self.busy_s if self.busy_s else 0.0,
+                    "max_batch": self.max_batch, "max_wait_ms": self.max_wait_s * 1e3,
+                    "batch_size": self.batch_sizes.to_dict(), "queue_ms": self.queue_ms.to_dict(),
+                    "encode_ms": self.encode_ms.to_dict(), "latency_ms": self.latency_ms.to_dict()}
+
+
+def _load_run(search, texts: Sequence[str], threads: int, k: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda text: search(text, k), texts))
+    return time.perf_counter() - start
+
+
+def main():
+    from nutrition import load_ingredients_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32, help="appelants concurrents")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0, 1, 2, 5, 10])
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    ingredients_db = load_ingredients_db()
+    index, _ = food_search.init_model(ingredients_db)
+    names = ingredients_db["EnglishFoodName"].apply(food_search.preprocess_text).tolist()
+    texts = [names[i] for i in np.random.default_rng(0).integers(0, len(names), args.queries)]
+
+    def unbatched(text, k):
+        vector = food_search.encode(text).reshape(1, -1)
+        food_search.normalize_L2(vector)
+        return index.search(vector, k)
+
+    print(f"{args.queries} requêtes, {args.threads} threads, embeddings {food_search.EMBEDDINGS_BACKEND}")
+    print(f"{'attente ms':>10}{'req/s':>9}{'lot moy.':>10}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}")
+    seconds = _load_run(unbatched, texts, args.threads, args.k)
+    print(f"{'sans lot':>10}{args.queries / seconds:>9.0f}{1:>10.1f}")
+    for wait_ms in args.wait_ms:
+        with EmbeddingBatcher(index, args.max_batch, wait_ms) as batcher:
+            seconds = _load_run(batcher.search_text, texts, args.threads, args.k)
+            stats = batcher.stats()
+        latency = stats["latency_ms"]
+        print(f"{wait_ms:>10g}{args.queries / seconds:>9.0f}{stats['batch_size']['mean']:>10.1f}"
+              f"{latency['p50']:>8g}{latency['p95']:>8g}{latency['p99']:>8g}")
+
+
+if __name__ == "__main__":
+    main()
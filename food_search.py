@@ -0,0 +1,412 @@
+"""
+Limeat - Recherche de l'ingrédient de la base correspondant à un nom libre
+
+Version importable de search_matching_food.ipynb : similarité sémantique
+(embeddings normalisés dans un index FAISS) combinée à une similarité TF-IDF.
+
+Exemple : search_matching_food("apple", ingredients_db, index) renvoie
+l'ingrédient de la base qui semble correspondre à "Apple".
+
+Les résultats sont gardés dans un cache LRU (requête prétraitée, k, empreinte
+de l'index) : une recherche répétée ne réencode rien ; search_cache_stats()
+donne les taux de succès.
+"""
+import hashlib
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Hashable
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from nutrition import frame_cache
+
+try:
+    import faiss
+except ImportError:  # index exact en numpy, mêmes résultats sur une base de cette taille
+    faiss = None
+
+EMBEDDINGS_MODEL = "all-mpnet-base-v2"
+# Modèle multilingue de l'index français / anglais (bilingual_search)
+MULTILINGUAL_MODEL = os.getenv("LIMEAT_MULTILINGUAL_MODEL", "paraphrase-multilingual-mpnet-base-v2")
+# "fake" : embeddings déterministes par hachage de trigrammes, sans modèle à télécharger
+EMBEDDINGS_BACKEND = os.getenv("LIMEAT_EMBEDDINGS", "sentence-transformers")
+# Entrées des caches de résultats et d'embeddings de requêtes (0 : désactivés)
+SEARCH_CACHE_SIZE = int(os.getenv("LIMEAT_SEARCH_CACHE_SIZE", 4096))
+
+
+class HashingEmbedder:
+    """Embeddings hors-ligne : trigrammes de caractères hachés dans `dim` composantes signées"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f" {text} "
+            for i in range(len(padded) - 2):
+                digest = hashlib.blake2b(padded[i:i + 3].encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest, "little")
+                vectors[row, bucket % self.dim] += 1.0 if bucket & (1 << 63) else -1.0
+        return vectors[0] if single else vectors
+
+
+class FlatIndex:
+    """Équivalent numpy de faiss.IndexFlatL2 (distances L2 au carré)"""
+
+    def __init__(self, dimension: int):
+        self.d = dimension
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+
+    @property
+    def ntotal(self) -> int:
+        return len(self._vectors)
+
+    def add(self, vectors: np.ndarray):
+        self._vectors = np.vstack([self._vectors, np.asarray(vectors, dtype=np.float32)])
+
+    def search(self, queries: np.ndarray, k: int):
+        queries = np.asarray(queries, dtype=np.float32)
+        distances = ((queries ** 2).sum(axis=1)[:, None] - 2 * queries @ self._vectors.T
+                     + (self._vectors ** 2).sum(axis=1)[None, :])
+        indices = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, indices, axis=1), indices
+
+
+def normalize_L2(vectors: np.ndarray):
+    """Normalise les lignes en place, comme faiss.normalize_L2"""
+    if faiss is not None:
+        faiss.normalize_L2(vectors)
+        return
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+
+
+def new_index(dimension: int):
+    return faiss.IndexFlatL2(dimension) if faiss is not None else FlatIndex(dimension)
+
+
+def get_embeddings_model(model_name: str = None):
+    """Modèle d'embeddings partagé (EMBEDDINGS_MODEL par défaut), chargé au premier appel"""
+    return _load_model(model_name or EMBEDDINGS_MODEL, EMBEDDINGS_BACKEND)
+
+
+@lru_cache(maxsize=None)
+def _load_model(model_name: str, backend: str):
+    if backend == "fake":
+        return HashingEmbedder()
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, tokenizer_kwargs={"clean_up_tokenization_spaces": True})
+
+
+def encode(texts, model_name: str = None) -> np.ndarray:
+    return np.asarray(get_embeddings_model(model_name).encode(texts), dtype=np.float32)
+
+
+@lru_cache(maxsize=None)
+def _text_tools():
+    """Tokeniseur, mots vides et lemmatiseur NLTK ; repli sans NLTK si ses corpus ne sont pas installés"""
+    try:
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+        from nltk.tokenize import word_tokenize
+        lemmatizer = WordNetLemmatizer()
+        lemmatizer.lemmatize("apples")
+        word_tokenize("apples")
+        return word_tokenize, set(stopwords.words('english')), lemmatizer.lemmatize
+    except (ImportError, LookupError):
+        return str.split, set(ENGLISH_STOP_WORDS), lambda word: word
+
+
+def preprocess_text(text):
+    """
+    Preprocesses the input text for improved search performance.
+
+    This function performs the following steps:
+    - Converts text to lowercase.
+    - Removes punctuation.
+    - Tokenizes the text into words.
+    - Removes English stop words.
+    - Lemmatizes the tokens.
+
+    Args:
+        text (str): The text to preprocess.
+
+    Returns:
+        str: The preprocessed text as a single string.
+    """
+    word_tokenize, stop_words, lemmatize = _text_tools()
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', '', text)
+    tokens = word_tokenize(text)
+    tokens = [word for word in tokens if word not in stop_words]
+    tokens = [lemmatize(word) for word in tokens]
+    return ' '.join(tokens)
+
+
+def init_model(data_frame: pd.DataFrame, workers: int = 1):
+    """
+    Creates a FAISS index from the ingredient names in the DataFrame.
+
+    Args:
+        data_frame (pd.DataFrame): DataFrame containing ingredient information with columns: "EnglishFoodName" (Name), "Groupe" (Group), "Sous-groupe" (Subgroup), "Id_CIQUAL".
+        workers (int, optional): Number of processes encoding the names (see index_build). Defaults to 1.
+
+    Returns:
+        tuple: A tuple containing the FAISS index and the embeddings, or None if the DataFrame is empty.
+    """
+    if workers > 1:
+        import tempfile
+        from index_build import encode_sharded
+
+        if data_frame.empty:
+            return None
+        with tempfile.TemporaryDirectory() as shard_dir:
+            embeddings, _ = encode_sharded(data_frame['EnglishFoodName'].tolist(), shard_dir, workers,
+                                           shard_size=-(-len(data_frame) // workers))
+    else:
+        ingredients_names = data_frame['EnglishFoodName'].apply(preprocess_text).tolist()
+
+        if len(ingredients_names) == 0:
+            return None
+
+        embeddings = encode(ingredients_names)
+        normalize_L2(embeddings)
+    vector_dimension = embeddings.shape[1]
+
+    index = new_index(vector_dimension)
+    index.add(embeddings)
+    _register_build(index, data_frame, embeddings)
+
+    return (index, embeddings)
+
+
+class LRUCache:
+    """Cache borné, l'entrée la moins récemment lue étant évincée en premier ; sûr entre threads"""
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# Résultats par (empreinte de l'index, recherche, requête prétraitée, k) ; embeddings par (modèle, requête)
+result_cache = LRUCache()
+embedding_cache = LRUCache()
+_MISSING = object()
+_build_hashes: Dict[int, str] = {}
+
+
+def _names_digest(data_frame: pd.DataFrame, digest=None):
+    """Empreinte (blake2b) des noms anglais indexés, prolongée de `digest` s'il est fourni"""
+    digest = digest or hashlib.blake2b(digest_size=16)
+    digest.update("\0".join(data_frame['EnglishFoodName'].astype(str)).encode("utf-8"))
+    return digest
+
+
+@frame_cache
+def _names_hash(data_frame: pd.DataFrame) -> str:
+    return _names_digest(data_frame).hexdigest()
+
+
+def _register_build(index, data_frame: pd.DataFrame, embeddings: np.ndarray):
+    """Empreinte du contenu d'un index construit par init_model : un index reconstruit sur d'autres données
+    change de clé, les résultats obtenus sur l'ancien ne sont plus lus"""
+    digest = _names_digest(data_frame, hashlib.blake2b(np.ascontiguousarray(embeddings).tobytes(), digest_size=16))
+    key = id(index)
+    _build_hashes[key] = digest.hexdigest()
+    try:
+        weakref.finalize(index, _build_hashes.pop, key, None)
+    except TypeError:  # objet sans weakref : l'empreinte reste enregistrée
+        pass
+
+
+def index_build_hash(index, data_frame: pd.DataFrame) -> str:
+    """Empreinte de l'index (ou de celui d'un EmbeddingBatcher) utilisée dans les clés du cache de résultats"""
+    index = getattr(index, "index", index)
+    build_hash = _build_hashes.get(id(index))
+    if build_hash is None:  # index construit hors de init_model : taille et noms indexés (pas d'id réutilisable)
+        build_hash = f"names:{index.ntotal}:{_names_hash(data_frame)}"
+    return build_hash
+
+
+def search_cache_stats() -> Dict[str, Dict[str, float]]:
+    """Taux de succès des caches de résultats et d'embeddings de requêtes"""
+    return {"results": result_cache.stats(), "embeddings": embedding_cache.stats()}
+
+
+def _query_vector(aliment_processed: str) -> np.ndarray:
+    """Embedding normalisé (1, d) d'une requête, mis en cache"""
+    key = (EMBEDDINGS_BACKEND, EMBEDDINGS_MODEL, aliment_processed)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        vector = encode(aliment_processed).reshape(1, -1)
+        normalize_L2(vector)
+        vector.setflags(write=False)
+        embedding_cache.put(key, vector)
+    return vector
+
+
+def _cached(key: tuple, compute):
+    """Résultat en cache pour `key`, sinon calculé et enregistré ; les dictionnaires renvoyés sont des copies"""
+    result = result_cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = compute()
+        result_cache.put(key, result)
+    if result is None:
+        return None
+    return dict(result) if isinstance(result, dict) else [dict(match) for match in result]
+
+
+def _match(data_frame: pd.DataFrame, match_index: int, score: float) -> dict:
+    return {
+        'FoodID': data_frame['FoodID'].iloc[match_index],
+        'FoodName': data_frame['FoodName'].iloc[match_index],
+        'EnglishFoodName': data_frame['EnglishFoodName'].iloc[match_index],
+        'FoodGroupName': data_frame['FoodGroupName'].iloc[match_index],
+        'FoodSubGroup': data_frame['FoodSubGroup'].iloc[match_index],
+        'Score': score
+    }
+
+
+def _combined_scores(aliment_processed: str, data_frame: pd.DataFrame, index, k: int):
+    """Scores hybrides (0.7 sémantique + 0.3 TF-IDF) des k plus proches voisins"""
+    if hasattr(index, "search_text"):  # EmbeddingBatcher : requête encodée avec celles des autres appelants
+        distances, indices = index.search_text(aliment_processed, k)
+    else:
+        distances, indices = index.search(_query_vector(aliment_processed), k)
+
+    tfidf = TfidfVectorizer()
+    tfidf_matrix = tfidf.fit_transform(data_frame['EnglishFoodName'].apply(preprocess_text))
+    aliment_tfidf = tfidf.transform([aliment_processed])
+    tfidf_similarities = cosine_similarity(aliment_tfidf, tfidf_matrix).flatten()
+
+    indices_flat = indices.flatten()
+    combined_scores = (1 - distances.flatten() / 2) * 0.7 + tfidf_similarities[indices_flat] * 0.3
+    return combined_scores, indices_flat
+
+
+def search_matching_food(aliment: str, data_frame: pd.DataFrame, index) -> dict | None:
+    """
+    Searches for a food item in the FAISS index using a hybrid approach (semantic and TF-IDF).
+
+    This function encodes the input food item, searches for the most similar items in the FAISS index,
+    combines the semantic similarity with TF-IDF similarity, and returns the best match with additional information.
+
+    Args:
+        aliment (str): The food item to search for.
+        data_frame (pd.DataFrame): DataFrame containing ingredient information with columns:
+            'FoodID', 'FoodName', 'EnglishFoodName', 'FoodGroupName', 'FoodSubGroup'.
+        index (faiss.IndexFlatL2): Precomputed FAISS index containing embeddings of the ingredient names,
+            or an embedding_batcher.EmbeddingBatcher wrapping it.
+
+    Returns:
+        (dict | None): A dictionary containing:
+            'FoodID', 'FoodName', 'EnglishFoodName', 'FoodGroupName', 'FoodSubGroup', 'Score'
+        or None if no suitable match is found.
+    """
+    aliment_processed = preprocess_text(aliment)
+
+    if data_frame.empty:
+        return None
+
+    k = min(5, len(data_frame))
+    return _cached((index_build_hash(index, data_frame), "best", aliment_processed, k),
+                   lambda: _best_match(aliment_processed, data_frame, index, k))
+
+
+def _best_match(aliment_processed: str, data_frame: pd.DataFrame, index, k: int) -> dict | None:
+    combined_scores, indices_flat = _combined_scores(aliment_processed, data_frame, index, k)
+    best_index = combined_scores.argmax()
+    best_score = combined_scores[best_index]
+
+    if best_score < 0.5:
+        return None
+
+    return _match(data_frame, indices_flat[best_index], best_score)
+
+
+def search_top_n_matching_food(aliment: str, data_frame: pd.DataFrame, index, topn: int = 1) -> list[dict] | None:
+    """
+    Searches for the top N food items in the FAISS index using a hybrid approach (semantic and TF-IDF).
+
+    This function encodes the input food item, searches for the most similar items in the FAISS index,
+    combines the semantic similarity with TF-IDF similarity, and returns the top N matches with additional information.
+
+    Args:
+        aliment (str): The food item to search for.
+        data_frame (pd.DataFrame): DataFrame containing ingredient information with columns:
+            'FoodID', 'FoodName', 'EnglishFoodName', 'FoodGroupName', 'FoodSubGroup'.
+        index (faiss.IndexFlatL2): Precomputed FAISS index containing embeddings of the ingredient names,
+            or an embedding_batcher.EmbeddingBatcher wrapping it.
+        topn (int, optional): The number of top matches to return. Defaults to 1.
+
+    Returns:
+        (list[dict] | None): A list of dictionaries, each containing:
+            'FoodID', 'FoodName', 'EnglishFoodName', 'FoodGroupName', 'FoodSubGroup', and 'Score' of a match,
+        or None if no suitable matches are found.
+    """
+    aliment_processed = preprocess_text(aliment)
+
+    if data_frame.empty:
+        return None
+
+    k = min(max(topn, 15), len(data_frame))
+    return _cached((index_build_hash(index, data_frame), "top", aliment_processed, k, topn),
+                   lambda: _top_n_matches(aliment_processed, data_frame, index, k, topn))
+
+
+def _top_n_matches(aliment_processed: str, data_frame: pd.DataFrame, index, k: int, topn: int) -> list[dict] | None:
+    combined_scores, indices_flat = _combined_scores(aliment_processed, data_frame, index, k)
+
+    sorted_indices = np.argsort(combined_scores)[::-1]
+    results = []
+    for i in sorted_indices[:topn]:
+        score = combined_scores[i]
+
+        if score < 0.3:
+            continue
+
+        results.append(_match(data_frame, indices_flat[i], score))
+
+    return results if results else None
@@ -0,0 +1,200 @@
+"""
+Limeat - Construction parallèle de l'index d'embeddings des noms d'aliments
+
+Le corpus (FoodName et EnglishFoodName de ingredients_db.csv, plus les noms
+d'ingrédients de recipesDataset s'il est fourni) est découpé en fragments
+encodés par un pool de processus, chacun avec son propre modèle. Chaque
+fragment est écrit sur disque sous un nom dérivé de son contenu et du modèle :
+une construction interrompue reprend là où elle s'était arrêtée. Les fragments
+sont ensuite fusionnés en un seul index FAISS (ou son équivalent numpy).
+
+Usage :
+    python index_build.py --workers 4
+    python index_build.py --recipes datathon_Schoolab-main/data/recipesDataset
+    python index_build.py --scaling 1 2 4      # débit selon le nombre de processus
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import food_search
+from allergens import ARTIFACTS_DIR
+from nutrition import DATA_DIR, load_ingredients_db
+
+INDEX_DIR = ARTIFACTS_DIR / "food_index"
+# Noms par fragment écrit sur disque, et par appel à encode (batch_size de sentence-transformers)
+SHARD_SIZE = int(os.getenv("LIMEAT_INDEX_SHARD_SIZE", 4096))
+BATCH_SIZE = int(os.getenv("LIMEAT_INDEX_BATCH_SIZE", 64))
+RECIPES_PATH = DATA_DIR / "recipesDataset"
+
+
+def catalog_corpus(ingredients_db: pd.DataFrame, recipes_path: Optional[Path] = None) -> pd.DataFrame:
+    """Noms à indexer, sans doublons : colonnes name, lang ("fr", "en" ou "recipe") et FoodID (-1 hors base)"""
+    parts = [pd.DataFrame({"name": ingredients_db[column], "lang": lang, "FoodID": ingredients_db["FoodID"]})
+             for column, lang in (("FoodName", "fr"), ("EnglishFoodName", "en"))]
+    if recipes_path is not None:
+        names = recipe_ingredient_names(recipes_path)
+        parts.append(pd.DataFrame({"name": names, "lang": "recipe", "FoodID": -1}))
+    corpus = pd.concat(parts, ignore_index=True).dropna(subset=["name"])
+    corpus["name"] = corpus["name"].astype(str).str.strip()
+    return corpus[corpus["name"] != ""].drop_duplicates("name").reset_index(drop=True)
+
+
+def recipe_ingredient_names(path: Path, chunksize: int = 50_000) -> List[str]:
+    """Noms d'ingrédients distincts de recipesDataset (CSV lu par morceaux, ou .parquet de recipes_ingest)"""
+    if Path(path).suffix == ".parquet":
+        import pyarrow.compute as pc
+        from recipes_ingest import read_recipes
+
+        names = pc.unique(pc.list_flatten(read_recipes(path, ["ingredient_names"]).column("ingredient_names")))
+        return sorted(name.strip() for name in names.to_pylist() if name and name.strip())
+    names = set()
+    for chunk in pd.read_csv(path, usecols=["ingredient_names"], chunksize=chunksize):
+        for value in chunk["ingredient_names"].dropna():
+            names.update(name.strip() for name in value.strip("[]").replace("'", "").split(", "))
+    names.discard("")
+    return sorted(names)
+
+
+# Processus de calcul
+def _init_worker(backend: str, threads: int):
+    food_search.EMBEDDINGS_BACKEND = backend
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _encode_shard(texts: List[str], path: str, batch_size: int) -> Tuple[str, int, float]:
+    """Encode un fragment et l'écrit dans `path` ; renvoie (path, noms, secondes d'encodage)"""
+    start = time.perf_counter()
+    processed = [food_search.preprocess_text(text) for text in texts]
+    embeddings = np.asarray(food_search.get_embeddings_model().encode(processed, batch_size=batch_size),
+                            dtype=np.float32)
+    food_search.normalize_L2(embeddings)
+    np.save(path + ".tmp.npy", embeddings)
+    os.replace(path + ".tmp.npy", path)
+    return path, len(texts), time.perf_counter() - start
+
+
+def _shard_key(texts: Sequence[str]) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{food_search.EMBEDDINGS_BACKEND}:{food_search.EMBEDDINGS_MODEL}".encode())
+    for text in texts:
+        digest.update(text.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def encode_sharded(texts: Sequence[str], shard_dir: Path, workers: int = 1, shard_size: int = SHARD_SIZE,
+                   batch_size: int = BATCH_SIZE) -> Tuple[np.ndarray, Dict[str, float]]:
+    """Embeddings normalisés de `texts`, calculés par fragments en parallèle (fragments déjà sur disque
+    réutilisés)"""
+    texts = list(texts)
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+    paths = [str(shard_dir / f"{_shard_key(shard)}.npy") for shard in shards]
+    todo = [(shard, path) for shard, path in zip(shards, paths) if not Path(path).exists()]
+
+    start = time.perf_counter()
+    encode_s = 0.0
+    if todo and workers <= 1:
+        for shard, path in todo:
+            encode_s += _encode_shard(shard, path, batch_size)[2]
+    elif todo:
+        workers = min(workers, len(todo))
+        # spawn : pas de fork d'un processus qui a déjà chargé torch ou FAISS
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+                                 initargs=(food_search.EMBEDDINGS_BACKEND, max(1, os.cpu_count() // workers))) as pool:
+            for _, _, seconds in pool.map(_encode_shard, *zip(*todo), [batch_size] * len(todo)):
+                encode_s += seconds
+    wall_s = time.perf_counter() - start
+
+    embeddings = np.concatenate([np.load(path) for path in paths]) if paths else np.empty((0, 0), np.float32)
+    encoded = sum(len(shard) for shard, _ in todo)
+    return embeddings, {"texts": len(texts), "encoded": encoded, "shards": len(shards),
+                        "reused": len(shards) - len(todo), "workers": workers, "wall_s": wall_s, "encode_s": encode_s,
+                        "texts_per_s": encoded / wall_s if encoded and wall_s else 0.0}
+
+
+# Index fusionné
+def build_catalog_index(corpus: pd.DataFrame, out_dir: Path = INDEX_DIR, workers: int = 1,
+                        shard_size: int = SHARD_SIZE, batch_size: int = BATCH_SIZE) -> Dict[str, float]:
+    """Encode le corpus et écrit l'index fusionné (vectors.npy, corpus.csv, et index.faiss avec FAISS)"""
+    out_dir = Path(out_dir)
+    embeddings, stats = encode_sharded(corpus["name"].tolist(), out_dir / "shards", workers, shard_size, batch_size)
+    np.save(out_dir / "vectors.npy", embeddings)
+    corpus.to_csv(out_dir / "corpus.csv", index=False)
+    if food_search.faiss is not None:
+        index = food_search.new_index(embeddings.shape[1])
+        index.add(embeddings)
+        food_search.faiss.write_index(index, str(out_dir / "index.faiss"))
+    (out_dir / "build.json").write_text(json.dumps(
+        dict(stats, backend=food_search.EMBEDDINGS_BACKEND, model=food_search.EMBEDDINGS_MODEL)), encoding="utf-8")
+    return stats
+
+
+def load_catalog_index(out_dir: Path = INDEX_DIR):
+    """(index, corpus) écrits par build_catalog_index, ou None"""
+    out_dir = Path(out_dir)
+    if not (out_dir / "vectors.npy").exists():
+        return None
+    corpus = pd.read_csv(out_dir / "corpus.csv")
+    if food_search.faiss is not None and (out_dir / "index.faiss").exists():
+        return food_search.faiss.read_index(str(out_dir / "index.faiss")), corpus
+    vectors = np.load(out_dir / "vectors.npy", mmap_mode="r")
+    index = food_search.new_index(vectors.shape[1])
+    index.add(vectors)
+    return index, corpus
+
+
+def scaling_report(texts: Sequence[str], worker_counts: Sequence[int], shard_size: int = SHARD_SIZE,
+                   batch_size: int = BATCH_SIZE) -> List[Dict[str, float]]:
+    """Débit d'encodage (noms/s, chargement des modèles compris) pour chaque nombre de processus"""
+    # Assez de fragments pour occuper tous les processus
+    shard_size = min(shard_size, max(1, -(-len(texts) // (4 * max(worker_counts)))))
+    rows = []
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as shard_dir:
+            _, stats = encode_sharded(texts, Path(shard_dir), workers, shard_size, batch_size)
+        stats["speedup"] = stats["texts_per_s"] / rows[0]["texts_per_s"] if rows else 1.0
+        rows.append(stats)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=str(INDEX_DIR))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--recipes", help=f"recipesDataset (par exemple {RECIPES_PATH})")
+    parser.add_argument("--scaling", type=int, nargs="+", help="mesure le débit pour ces nombres de processus")
+    args = parser.parse_args()
+
+    corpus = catalog_corpus(load_ingredients_db(), Path(args.recipes) if args.recipes else None)
+    print(f"{len(corpus)} noms ({', '.join(f'{k}: {v}' for k, v in corpus['lang'].value_counts().items())}), "
+          f"{os.cpu_count()} coeurs, embeddings {food_search.EMBEDDINGS_BACKEND}")
+    if args.scaling:
+        print(f"{'processus':>10}{'secondes':>10}{'noms/s':>10}{'accélération':>14}")
+        for row in scaling_report(corpus["name"].tolist(), args.scaling, args.shard_size, args.batch_size):
+            print(f"{row['workers']:>10}{row['wall_s']:>10.2f}{row['texts_per_s']:>10.0f}{row['speedup']:>14.2f}")
+        return
+    stats = build_catalog_index(corpus, Path(args.out), args.workers, args.shard_size, args.batch_size)
+    print(f"{args.out}: {stats['shards']} fragments ({stats['reused']} réutilisés), {stats['encoded']} noms encodés "
+          f"en {stats['wall_s']:.2f} s ({stats['texts_per_s']:.0f} noms/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Limeat - Couche d'accès partagée aux fournisseurs LLM (Anthropic, OpenAI)
+avec pool de connexions HTTP, timeouts, retries et limitation de concurrence
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from telemetry import get_telemetry
+from tracing import span
+
+load_dotenv()
+
+# Réglages par défaut, surchargeables par variables d'environnement
+DEFAULT_TIMEOUT = float(os.getenv("LIMEAT_LLM_TIMEOUT", 60))
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_MAX_RETRIES = int(os.getenv("LIMEAT_LLM_MAX_RETRIES", 3))
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LIMEAT_LLM_MAX_CONCURRENCY", 8))
+# Le streaming permet de mesurer le time-to-first-token, sans surcoût de latence totale
+STREAM_RESPONSES = os.getenv("LIMEAT_LLM_STREAM", "1") == "1"
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30.0
+
+# Codes HTTP pour lesquels un nouvel essai a du sens (rate limit, surcharge, erreurs serveur)
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class LLMError(Exception):
+    """Erreur normalisée remontée par un backend LLM"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retryable: Optional[bool] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = status_code in RETRYABLE_STATUS if retryable is None else retryable
+        self.retry_after = retry_after
+
+
+@dataclass
+class LLMResponse:
+    """Réponse d'un appel LLM, indépendante du fournisseur"""
+    text: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    ttft_s: Optional[float] = None
+    raw: object = None
+
+
+@dataclass
+class CallRecord:
+    """Mesure d'un appel : latence totale, time-to-first-token, tokens et nombre de tentatives"""
+    provider: str
+    model: str
+    latency_s: float
+    input_tokens: int = 0
+    output_tokens: int = 0
+    ttft_s: Optional[float] = None
+    attempts: int = 1
+    ok: bool = True
+    error: Optional[str] = None
+    label: Optional[str] = None
+    inputs: Optional[Dict] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière du nombre de tokens (~4 caractères par token)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _retry_after(exc) -> Optional[float]:
+    """Lit l'en-tête Retry-After d'une erreur HTTP du SDK, s'il existe"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Client httpx partagé (pool keep-alive) entre tous les backends du processus"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=DEFAULT_CONNECT_TIMEOUT),
+            )
+        return _http_client
+
+
+class AnthropicBackend:
+    """Backend Anthropic (API Messages)"""
+    name = "anthropic"
+
+    def __init__(self, api_key: Optional[str] = None, http_client=None):
+        import anthropic
+        api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("Missing Anthropic API key. Make sure to set it in the .env file.")
+        self._sdk = anthropic
+        # Les retries sont gérés par LLMClient, on les désactive côté SDK
+        self._client = anthropic.Anthropic(api_key=api_key, http_client=http_client or get_http_client(),
+                                           max_retries=0)
+
+    def complete(self, messages: List[Dict], model: str, max_tokens: int,
+                 temperature: Optional[float] = None, timeout: Optional[float] = None,
+                 stream: bool = False, **kwargs) -> LLMResponse:
+        params = dict(model=model, max_tokens=max_tokens, messages=messages, **kwargs)
+        if temperature is not None:
+            params["temperature"] = temperature
+        ttft = None
+        try:
+            if stream:
+                start = time.perf_counter()
+                with self._client.messages.stream(timeout=timeout, **params) as events:
+                    for event in events:
+                        if ttft is None and event.type == "content_block_delta":
+                            ttft = time.perf_counter() - start
+                    response = events.get_final_message()
+            else:
+                response = self._client.messages.create(timeout=timeout, **params)
+        except self._sdk.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code, retry_after=_retry_after(e)) from e
+        except self._sdk.APIConnectionError as e:
+            raise LLMError(str(e), retryable=True) from e
+
+        # En mode outil, la sortie structurée est renvoyée sous forme de texte JSON
+        tool_input = next((block.input for block in response.content
+                           if getattr(block, "type", None) == "tool_use"), None)
+        if tool_input is not None:
+            text = json.dumps(tool_input, ensure_ascii=False)
+        else:
+            text = "".join(block.text for block in response.content if getattr(block, "type", None) == "text")
+        return LLMResponse(
+            text=text,
+            model=response.model,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            ttft_s=ttft,
+            raw=response,
+        )
+
+
+class OpenAIBackend:
+    """Backend OpenAI (API Chat Completions)"""
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, http_client=None):
+        import openai
+        api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("Missing OpenAI API key. Make sure to set it in the .env file.")
+        self._sdk = openai
+        self._client = openai.OpenAI(api_key=api_key, http_client=http_client or get_http_client(),
+                                     max_retries=0)
+
+    def complete(self, messages: List[Dict], model: str, max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None, timeout: Optional[float] = None,
+                 stream: bool = False, **kwargs) -> LLMResponse:
+        params = dict(model=model, messages=messages, **kwargs)
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+        if temperature is not None:
+            params["temperature"] = temperature
+        try:
+            if stream:
+                return self._stream(params, timeout)
+            response = self._client.chat.completions.create(timeout=timeout, **params)
+        except self._sdk.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code, retry_after=_retry_after(e)) from e
+        except self._sdk.APIConnectionError as e:
+            raise LLMError(str(e), retryable=True) from e
+
+        message = response.choices[0].message
+        # En mode outil, les arguments de l'appel de fonction sont déjà du texte JSON
+        tool_calls = getattr(message, "tool_calls", None)
+        usage = response.usage
+        return LLMResponse(
+            text=tool_calls[0].function.arguments if tool_calls else message.content or "",
+            model=response.model,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+            raw=response,
+        )
+
+    def _stream(self, params: Dict, timeout: Optional[float]) -> LLMResponse:
+        """Appel en streaming : mesure du premier token, usage renvoyé dans le dernier chunk"""
+        start = time.perf_counter()
+        ttft = usage = None
+        model = params["model"]
+        parts = []
+        chunks = self._client.chat.completions.create(timeout=timeout, stream=True,
+                                                      stream_options={"include_usage": True}, **params)
+        for chunk in chunks:
+            model = chunk.model or model
+            usage = chunk.usage or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            piece = delta.content or "".join(call.function.arguments or "" for call in delta.tool_calls or [])
+            if piece:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(piece)
+
+        return LLMResponse(
+            text="".join(parts),
+            model=model,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+            ttft_s=ttft,
+        )
+
+
+class FakeBackend:
+    """Backend hors-ligne pour les tests et les benchmarks de charge.
+
+    `responder` reçoit (messages, model) et renvoie le texte de la réponse.
+    La latence (fixe + par token de sortie) et le taux d'échec (erreurs HTTP
+    simulées) sont configurables.
+    """
+    name = "fake"
+
+    def __init__(self, responder: Optional[Callable[[List[Dict], str], str]] = None,
+                 latency_s: float = 0.0, failure_rate: float = 0.0, failure_status: int = 503,
+                 seed: Optional[int] = None, per_token_s: float = 0.0):
+        self.responder = responder or (lambda messages, model: "{}")
+        self.latency_s = latency_s
+        self.per_token_s = per_token_s
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def complete(self, messages: List[Dict], model: str, max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None, timeout: Optional[float] = None,
+                 stream: bool = False, **kwargs) -> LLMResponse:
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+        start = time.perf_counter()
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if fail:
+            raise LLMError("Simulated failure", status_code=self.failure_status)
+
+        text = self.responder(messages, model)
+        output_tokens = estimate_tokens(text)
+        if max_tokens is not None and output_tokens > max_tokens:
+            output_tokens = max_tokens
+            text = text[:max_tokens * 4]
+        ttft = time.perf_counter() - start
+        if self.per_token_s:
+            time.sleep(self.per_token_s * output_tokens)
+
+        prompt_text = " ".join(_message_text(m) for m in messages)
+        return LLMResponse(text=text, model=model, input_tokens=estimate_tokens(prompt_text),
+                           output_tokens=output_tokens, ttft_s=ttft if stream else None)
+
+
+def _message_text(message: Dict) -> str:
+    """Concatène les parties texte d'un message (contenu simple ou blocs)"""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+class LLMClient:
+    """Client LLM partagé : timeouts, retries avec backoff exponentiel jitteré,
+    limitation de concurrence et mesure de chaque appel"""
+
+    def __init__(self, backend, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries: int = DEFAULT_MAX_RETRIES, timeout: float = DEFAULT_TIMEOUT,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_records: int = 1000,
+                 sleep: Callable[[float], None] = time.sleep, seed: Optional[int] = None,
+                 telemetry=None):
+        self.backend = backend
+        self.telemetry = telemetry if telemetry is not None else get_telemetry()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.records = deque(maxlen=max_records)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._sleep = sleep
+        self._rng = random.Random(seed)
+
+    @property
+    def provider(self) -> str:
+        return getattr(self.backend, "name", type(self.backend).__name__)
+
+    def _backoff(self, attempt: int, error: LLMError) -> float:
+        """Délai avant la tentative suivante (full jitter, borné)"""
+        if error.retry_after is not None:
+            return min(error.retry_after, self.backoff_max)
+        return self._rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def complete(self, messages: List[Dict], model: str, max_tokens: Optional[int] = 1000,
+                 temperature: Optional[float] = None, timeout: Optional[float] = None,
+                 stream: bool = STREAM_RESPONSES, label: Optional[str] = None,
+                 inputs: Optional[Dict] = None, **kwargs) -> LLMResponse:
+        """Envoie une requête au backend, avec retries sur 429/5xx et erreurs réseau.
+
+        `label` identifie la version de prompt dans la télémétrie ; `inputs` conserve
+        les variables du prompt pour pouvoir rejouer l'appel (benchmarks/replay_prompts.py).
+        """
+        with span("llm.complete", provider=self.provider, model=model, label=label) as call_span:
+            start = time.perf_counter()
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    # Le sémaphore n'est pas tenu pendant l'attente du backoff
+                    with self._semaphore:
+                        response = self.backend.complete(
+                            messages=messages, model=model, max_tokens=max_tokens, temperature=temperature,
+                            timeout=timeout or self.timeout, stream=stream, **kwargs
+                        )
+                    break
+                except LLMError as e:
+                    if not e.retryable or attempts > self.max_retries:
+                        self._record(CallRecord(self.provider, model, time.perf_counter() - start,
+                                                attempts=attempts, ok=False, error=str(e),
+                                                label=label, inputs=inputs))
+                        raise
+                    self._sleep(self._backoff(attempts, e))
+
+            self._record(CallRecord(self.provider, model, time.perf_counter() - start,
+                                    input_tokens=response.input_tokens, output_tokens=response.output_tokens,
+                                    ttft_s=response.ttft_s, attempts=attempts, label=label, inputs=inputs))
+            call_span.set(attempts=attempts, input_tokens=response.input_tokens,
+                          output_tokens=response.output_tokens, ttft_s=response.ttft_s)
+            return response
+
+    def _record(self, record: CallRecord):
+        with self._lock:
+            self.records.append(record)
+        self.telemetry.log(asdict(record))
+
+    def stats(self) -> Dict:
+        """Agrégats sur les derniers appels : volumes, erreurs, retries, latences, tokens"""
+        with self._lock:
+            records = list(self.records)
+        latencies = sorted(r.latency_s for r in records)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "calls": len(records),
+            "errors": sum(not r.ok for r in records),
+            "retries": sum(r.attempts - 1 for r in records),
+            "latency_p50_s": percentile(0.50),
+            "latency_p95_s": percentile(0.95),
+            "input_tokens": sum(r.input_tokens for r in records),
+            "output_tokens": sum(r.output_tokens for r in records),
+        }
+
+
+_BACKENDS = {"anthropic": AnthropicBackend, "openai": OpenAIBackend}
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def use_fake_backend() -> bool:
+    """Mode hors-ligne activé par LIMEAT_LLM_BACKEND=fake"""
+    return os.getenv("LIMEAT_LLM_BACKEND", "").lower() == "fake"
+
+
+def get_llm_client(provider: str) -> LLMClient:
+    """Renvoie le client partagé du fournisseur (créé au premier appel)"""
+    with _clients_lock:
+        if provider not in _clients:
+            backend = FakeBackend() if use_fake_backend() else _BACKENDS[provider]()
+            _clients[provider] = LLMClient(backend)
+        return _clients[provider]
+
+
+def set_llm_backend(provider: str, backend, **client_kwargs) -> LLMClient:
+    """Remplace le backend d'un fournisseur (ex. FakeBackend pour les tests hors-ligne)"""
+    with _clients_lock:
+        _clients[provider] = LLMClient(backend, **client_kwargs)
+        return _clients[provider]
@@ -0,0 +1,200 @@
+"""
+Limeat - Suggestions d'ajouts et de retraits d'ingrédients calculées localement
+
+Les listes add_calories / remove_calories / add_health / remove_health de
+get_ai_suggestions se déduisent de la base des ingrédients : densité
+énergétique (208) pour les calories, gain de Nutri-Score (nutriscore.MealScorer)
+pour la santé. Les ajouts sont choisis parmi les aliments qui vont avec le
+plat : mêmes sous-groupes que ses ingrédients ou accompagnements usuels, puis
+classés par une fonction de compatibilité (co-occurrence dans des recettes si
+la matrice de cooccurrence.py a été construite).
+
+Modes (LIMEAT_SUGGESTIONS) :
+    "hybrid"  listes locales si la confiance est suffisante (jamais sans matrice de co-occurrences),
+              le LLM ne nomme que le plat
+    "local"   aucun appel au LLM (PyQt et CLI hors-ligne)
+    "llm"     comportement d'origine, tout est demandé au LLM
+"""
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bilingual_search import get_bilingual_index
+from cooccurrence import english_name, load_compatibility
+from meal import Meal
+from nutriscore import MealScorer, energy_kcal
+from nutrition import get_ingredients_db, get_nutrient_table
+
+SUGGESTIONS_MODE = os.getenv("LIMEAT_SUGGESTIONS", "hybrid")
+MIN_CONFIDENCE = float(os.getenv("LIMEAT_SUGGESTIONS_MIN_CONFIDENCE", 0.6))
+# Confiance maximale quand la plupart des candidats sont absents de la matrice de co-occurrences (ou sans
+# matrice) : la compatibilité heuristique ne suffit pas à se passer du LLM en mode "hybrid"
+HEURISTIC_CONFIDENCE = 0.5
+# Part minimale de candidats de compatibilité connue pour dépasser HEURISTIC_CONFIDENCE
+MIN_KNOWN_SHARE = 0.5
+MAX_ITEMS = 3
+# Quantité supposée de chaque ingrédient de la liste, et portion d'un ingrédient ajouté (par sous-groupe)
+DEFAULT_GRAMS = 100
+ADDITION_GRAMS = 80
+ADDITION_GRAMS_BY_SUBGROUP = {"herbes": 5, "épices": 2, "condiments": 10, "sauces": 20,
+                              "fruits à coque et graines oléagineuses": 15, "huiles et graisses végétales": 10,
+                              "margarines": 10, "fromages et assimilés": 30}
+# Part minimale de l'énergie du plat pour suggérer de retirer un ingrédient
+MIN_ENERGY_SHARE = 0.15
+
+# Accompagnements proposés quel que soit le plat
+SIDE_SUBGROUPS = {"légumes", "légumineuses", "pâtes, riz et céréales", "pommes de terre et autres tubercules",
+                  "herbes", "fruits à coque et graines oléagineuses"}
+# Compatibilité par défaut (sans co-occurrences) : même sous-groupe qu'un ingrédient du plat, accompagnement
+SAME_SUBGROUP_FIT = 1.0
+SIDE_FIT = 0.8
+# Groupes et sous-groupes jamais proposés en ajout à un plat salé
+EXCLUDED_GROUPS = {"Produits sucrés et desserts", "Glaces et sorbets"}
+EXCLUDED_SUBGROUPS = {"gâteaux et pâtisseries", "biscuits sucrés", "viennoiseries", "confiseries non chocolatées",
+                      "chocolats et produits à base de chocolat", "céréales de petit-déjeuner", "glaces",
+                      "sucres, miels et assimilés", "confitures et assimilés", "ingrédients divers"}
+# Formes rarement ajoutées telles quelles à un plat
+EXCLUDED_WORDS = ("sec", "sèche", "séché", "déshydraté", "poudre", "appertisé", "surgelé", "friture", "palme",
+                  "chips", "farine")
+
+# (lignes du plat, lignes candidates) -> compatibilité de chaque candidat, entre 0 et 1 (NaN si inconnue)
+Compatibility = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+SUGGESTION_KEYS = ("add_calories", "remove_calories", "add_health", "remove_health")
+
+
+def short_name(food_name: str) -> str:
+    """Nom usuel d'un aliment CIQUAL : "Avocat, cru" -> "avocat" """
+    name = food_name.split(",")[0].strip()
+    return name[:1].lower() + name[1:]
+
+
+class LocalSuggester:
+    """Suggestions pour une liste de noms d'ingrédients, sans appel au modèle"""
+
+    def __init__(self, ingredients_db: pd.DataFrame, compatibility: Optional[Compatibility] = None):
+        self.ingredients_db = ingredients_db
+        self.table = get_nutrient_table(ingredients_db)
+        self.index = get_bilingual_index(ingredients_db)
+        self.scorer = MealScorer(ingredients_db)
+        self.compatibility = compatibility
+        columns = {nutrient_id: i for i, nutrient_id in enumerate(self.table.nutrient_ids)}
+        matrix = self.table.matrix
+        self.energy = energy_kcal(*(matrix[:, columns[n]] for n in ("208", "203", "205", "204")))
+        self.subgroups = ingredients_db["FoodSubGroup"].fillna("").to_numpy()
+        self.short_names = [short_name(name) for name in ingredients_db["FoodName"].fillna("")]
+        self.english_names = [english_name(name) for name in ingredients_db["EnglishFoodName"].fillna("")]
+        self.addition_grams = np.array([ADDITION_GRAMS_BY_SUBGROUP.get(subgroup, ADDITION_GRAMS)
+                                        for subgroup in self.subgroups], dtype=np.float64)
+        names = ingredients_db["FoodName"].fillna("").str.lower()
+        self._addable = ~(pd.Series(self.subgroups).isin(EXCLUDED_SUBGROUPS).to_numpy()
+                          | ingredients_db["FoodGroupName"].isin(EXCLUDED_GROUPS).to_numpy()
+                          | names.str.contains("|".join(EXCLUDED_WORDS), regex=True).to_numpy())
+
+    def resolve(self, names: Sequence[str]) -> Tuple[List[int], List[str], List[str]]:
+        """(lignes, noms retenus, noms non résolus) ; la recherche sémantique n'est tentée que si son
+        modèle est disponible"""
+        rows, kept, unresolved = [], [], []
+        for name in names:
+            name = name.strip()
+            if not name:
+                continue
+            try:
+                food_id = self.index.resolve(name)
+            except (ImportError, OSError):  # modèle d'embeddings absent : niveaux exact et trigrammes seuls
+                scores = self.index.fuzzy_scores(self.index.queries(name), 1)
+                row = self.index.exact(name)
+                food_id = (int(self.ingredients_db["FoodID"].iloc[row]) if row is not None
+                           else int(self.ingredients_db["FoodID"].iloc[scores[0][0]]) if scores else None)
+            if food_id is None:
+                unresolved.append(name)
+            else:
+                rows.append(int(self.table.rows([food_id])[0]))
+                kept.append(name)
+        return rows, kept, unresolved
+
+    def candidates(self, rows: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(lignes candidates à l'ajout, compatibilité avec le plat, compatibilité connue par les co-occurrences).
+
+        Sans co-occurrences, la compatibilité est heuristique (même sous-groupe, accompagnement) et ne se
+        compare pas aux NPMI : les candidats connus sont classés avant les autres par suggest."""
+        rows = np.asarray(rows, dtype=np.intp)
+        same_subgroup = np.isin(self.subgroups, self.subgroups[rows])
+        pool = self._addable & (same_subgroup | np.isin(self.subgroups, list(SIDE_SUBGROUPS)))
+        pool[rows] = False
+        candidates = np.flatnonzero(pool)
+        fit = np.where(same_subgroup[candidates], SAME_SUBGROUP_FIT, SIDE_FIT)
+        known = np.zeros(len(candidates), dtype=bool)
+        if self.compatibility is not None:
+            compatibility = np.asarray(self.compatibility(rows, candidates), dtype=np.float64)
+            known = ~np.isnan(compatibility)
+            fit = np.where(known, compatibility, fit)
+        keep = fit > 0
+        return candidates[keep], fit[keep], known[keep]
+
+    def _names(self, rows: Sequence[int], exclude: Sequence[str] = ()) -> List[str]:
+        """Noms usuels distincts des lignes, dans l'ordre, au plus MAX_ITEMS"""
+        names, seen = [], {name.lower() for name in exclude}
+        for row in rows:
+            name = self.short_names[row]
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                names.append(name)
+            if len(names) == MAX_ITEMS:
+                break
+        return names
+
+    def suggest(self, ingredients: Sequence[str], grams: Optional[Sequence[float]] = None) -> Dict:
+        """Listes de suggestions au format de get_ai_suggestions (sans dish_name), avec "confidence"
+        (part des noms résolus, multipliée par la part des ajouts proposés dont la compatibilité est connue ;
+        au plus HEURISTIC_CONFIDENCE si la plupart des candidats sont inconnus), "unresolved" et "english_names"
+        (noms anglais usuels des ingrédients résolus, puis noms non résolus, pour dish_lsh)"""
+        rows, kept, unresolved = self.resolve(ingredients)
+        result = {key: [] for key in SUGGESTION_KEYS}
+        result.update(confidence=0.0, unresolved=unresolved,
+                      english_names=[self.english_names[row] for row in rows] + unresolved)
+        if not rows:
+            return result
+        grams = np.full(len(rows), DEFAULT_GRAMS, dtype=np.float64) if grams is None else grams
+        meal = Meal(self.table, rows, grams)
+        candidates, fit, known = self.candidates(rows)
+        kept_short = [self.short_names[row] for row in rows]
+
+        # Calories : énergie d'une portion de chaque candidat (connus d'abord) ; part de l'énergie du plat
+        order = np.lexsort((-(self.energy[candidates] * self.addition_grams[candidates] * fit), ~known))
+        result["add_calories"] = self._names(candidates[order], kept_short)
+        energy = self.energy[meal.rows] * meal.grams / 100
+        if len(rows) > 1 and energy.sum() > 0:
+            share = energy / energy.sum()
+            heavy = [i for i in np.argsort(-share, kind="stable") if share[i] >= MIN_ENERGY_SHARE]
+            result["remove_calories"] = [kept[i] for i in heavy[:MAX_ITEMS]]
+
+        # Santé : gain de Nutri-Score du plat
+        fits = dict(zip(candidates.tolist(), fit.tolist()))
+        is_known = dict(zip(candidates.tolist(), known.tolist()))
+        additions = [a for a in self.scorer.rank_additions(meal, candidates, self.addition_grams[candidates])
+                     if a["gain"] > 0]
+        additions.sort(key=lambda a: (not is_known[a["row"]], -a["gain"], -fits[a["row"]]))
+        result["add_health"] = self._names([a["row"] for a in additions], kept_short)
+        position = {row: i for i, row in enumerate(rows)}
+        result["remove_health"] = [kept[position[r["row"]]] for r in self.scorer.rank_removals(meal)
+                                   if r["gain"] > 0][:MAX_ITEMS]
+
+        # Confiance : seuls les ajouts de compatibilité connue comptent
+        suggested = [is_known[a["row"]] for a in additions[:MAX_ITEMS]]
+        confidence = len(rows) / (len(rows) + len(unresolved)) * (float(np.mean(suggested)) if suggested else 1.0)
+        if not len(known) or known.mean() < MIN_KNOWN_SHARE:
+            confidence = min(confidence, HEURISTIC_CONFIDENCE)
+        result["confidence"] = confidence
+        return result
+
+
+@lru_cache(maxsize=None)
+def get_local_suggester() -> LocalSuggester:
+    """Moteur partagé du processus, sur la base des ingrédients chargée au premier appel ; la
+    compatibilité vient des co-occurrences de recettes si leur matrice a été construite"""
+    ingredients_db = get_ingredients_db()
+    return LocalSuggester(ingredients_db, load_compatibility(ingredients_db))
@@ -1,61 +1,85 @@
 #Le fichier de code principal du projet datathon-2025
 # API ChatGPT qui se connecte et fournit des donnees culinaires par rapport aux donnees d'ingredients et de plats
-import openai
-import json
-import os
-from dotenv import load_dotenv
+from llm_client import get_llm_client
+from prompts import get_prompt
+from singleflight import get_group, make_key, normalize_ingredients
+from structured_output import (DISH_NAME_SCHEMA, SUGGESTIONS_SCHEMA, STRUCTURED_OUTPUT_MODE, StructuredOutputError,
+                               openai_tool, parse_structured)
+from telemetry import capture_ingredients
+from tracing import traced
 
-load_dotenv()
+SUGGESTIONS_MODEL = "gpt-4"
 
-# Set up OpenAI API key
-
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-if not openai_api_key:
-    raise ValueError("Missing OpenAI API key. Make sure to set it in the .env file.")
-
-client = openai.OpenAI(api_key=openai_api_key)  # Update this line
-
-def get_ai_suggestions(ingredients):
+@traced("get_ai_suggestions")
+def get_ai_suggestions(ingredients, prompt_version=None):
     """Fetches AI-generated dish name and ingredient suggestions."""
-    prompt = f"""
-    You are a chef and nutritionist. Given the following ingredients:
-    {", ".join(ingredients)}
-    
-    1. Identify the most likely dish.
-    2. Suggest ingredients to **add** to increase calorie content.
-    3. Suggest ingredients to **remove** to decrease calories.
-    4. Suggest ingredients to **add** to improve the Nutri-Score (health benefits).
-    5. Suggest ingredients to **remove** to improve the Nutri-Score.
-
-    All ingredients must make sense in the context of the dish!
+    import local_suggestions
+    from dish_lsh import get_dish_index
 
-    Return your response in this **JSON format**:
-    {{
-      "dish_name": "Dish Name",
-      "add_calories": ["ingredient1", "ingredient2"],
-      "remove_calories": ["ingredient3", "ingredient4"],
-      "add_health": ["ingredient5", "ingredient6"],
-      "remove_health": ["ingredient7", "ingredient8"]
-    }}
-    """
+    # Listes calculées localement si la confiance suffit ; le plat est reconnu par l'index des recettes,
+    # le modèle ne le nomme que si aucune recette n'est assez proche. En mode "hybrid" sans matrice de
+    # co-occurrences, la confiance reste sous le seuil : le passage local est sauté
+    mode = local_suggestions.SUGGESTIONS_MODE
+    suggester = local_suggestions.get_local_suggester() if mode != "llm" else None
+    if mode == "local" or (mode == "hybrid" and suggester.compatibility is not None):
+        local = suggester.suggest(ingredients)
+        if mode == "local" or local["confidence"] >= local_suggestions.MIN_CONFIDENCE:
+            dish_index = get_dish_index()
+            dish_name = dish_index.identify(local["english_names"]) if dish_index is not None else None
+            if dish_name is None:
+                dish_name = "" if mode == "local" else get_dish_name(ingredients)
+            return {"dish_name": dish_name, **{key: local[key] for key in local_suggestions.SUGGESTION_KEYS}}
 
-    response = client.chat.completions.create(  # Updated method call
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
-    )
+    spec = get_prompt("suggestions", prompt_version)
 
-    ai_response = response.choices[0].message.content  # Updated response parsing
+    # Les requêtes identiques en cours partagent un seul appel au modèle
+    key = make_key("suggestions", SUGGESTIONS_MODEL, spec.label, STRUCTURED_OUTPUT_MODE,
+                   normalize_ingredients(ingredients))
+    ai_response = get_group("suggestions").do(key, request_suggestions, ingredients, spec)
 
+    # Validation par schéma, avec réparation locale du JSON presque valide
     try:
-        return json.loads(ai_response)
-    except json.JSONDecodeError:
+        return parse_structured(ai_response, SUGGESTIONS_SCHEMA, "suggestions")
+    except StructuredOutputError:
         print("Error: AI response could not be parsed.")
         return None
 
+def get_dish_name(ingredients):
+    """Asks the model for the dish name only; returns "" if the response is unusable."""
+    spec = get_prompt("dish_name")
+    key = make_key("dish_name", SUGGESTIONS_MODEL, spec.label, STRUCTURED_OUTPUT_MODE,
+                   normalize_ingredients(ingredients))
+    ai_response = get_group("dish_name").do(key, request_suggestions, ingredients, spec, "name_dish",
+                                            DISH_NAME_SCHEMA)
+    try:
+        return parse_structured(ai_response, DISH_NAME_SCHEMA, "dish_name")["dish_name"]
+    except StructuredOutputError:
+        return ""
+
+def request_suggestions(ingredients, spec, tool_name="suggest_dish", schema=SUGGESTIONS_SCHEMA):
+    """Sends the suggestion prompt to GPT-4 and returns the raw response text."""
+    # En mode outil, la réponse est contrainte par le schéma via un appel de fonction
+    structured = openai_tool(tool_name, schema) if STRUCTURED_OUTPUT_MODE == "tool" else {}
+
+    # Client partagé : pool de connexions, timeouts, retries et télémétrie par version de prompt
+    response = get_llm_client("openai").complete(
+        model=SUGGESTIONS_MODEL,
+        messages=[{"role": "user", "content": spec.render(ingredients=", ".join(ingredients))}],
+        max_tokens=spec.max_tokens,
+        temperature=spec.temperature,
+        label=spec.label,
+        inputs=capture_ingredients(ingredients),
+        **structured,
+    )
+    return response.text
+
 def main():
     """Runs the main script when executed directly."""
+    from build_pipeline import stale_artifacts
+
+    stale = stale_artifacts()
+    if stale:
+        print(f"Warning: stale artifacts, run build_pipeline.py: {', '.join(stale)}")
     user_ingredients = input("Enter ingredients (comma-separated): ").split(", ")
     suggestions = get_ai_suggestions(user_ingredients)
 
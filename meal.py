@@ -0,0 +1,236 @@
+"""
+Limeat - Représentation compacte et immuable d'un repas
+
+Un Meal stocke ses ingrédients dans trois tableaux NumPy parallèles en lecture
+seule (lignes de la NutrientTable, grammes, groupes alimentaires) au lieu
+d'une liste d'objets Ingredient modifiables. Les scores travaillent
+directement sur ces tableaux, sans recopie ; un MealLog concatène de
+nombreux repas dans les mêmes tableaux.
+"""
+import hashlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from nutrition import Ingredient, NutrientTable, get_nutrient_table
+
+# Groupe alimentaire "Fruits et légumes" de la base des ingrédients
+VEGETABLES_GROUP_ID = 1
+# Les légumes comptent au plus pour moitié dans les scores
+MAX_VEGETABLES_PROPORTION = 0.5
+
+TableSource = Union[NutrientTable, pd.DataFrame]
+
+
+def _table(source: TableSource) -> NutrientTable:
+    return source if isinstance(source, NutrientTable) else get_nutrient_table(source)
+
+
+def _frozen(values, dtype) -> np.ndarray:
+    """Tableau en lecture seule ; un tableau déjà figé du bon type est partagé sans copie"""
+    if isinstance(values, np.ndarray) and values.dtype == dtype and not values.flags.writeable:
+        return values
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+class MealItem:
+    """Vue en lecture seule d'un ingrédient d'un Meal, compatible avec Ingredient"""
+    __slots__ = ("_meal", "_i")
+
+    def __init__(self, meal: "Meal", i: int):
+        self._meal = meal
+        self._i = i
+
+    @property
+    def row(self) -> int:
+        return int(self._meal.rows[self._i])
+
+    @property
+    def id(self) -> int:
+        return int(self._meal.table.food_ids[self._meal.rows[self._i]])
+
+    @property
+    def gQuantity(self) -> float:
+        return float(self._meal.grams[self._i])
+
+    @property
+    def groupId(self):
+        return self._meal.group_ids[self._i].item()
+
+    def __repr__(self):
+        return f"MealItem(id={self.id}, gQuantity={self.gQuantity:g}, groupId={self.groupId})"
+
+
+class Meal:
+    """Repas immuable : tableaux parallèles (lignes, grammes, groupes) liés à une NutrientTable"""
+    __slots__ = ("table", "rows", "grams", "group_ids", "_key")
+
+    def __init__(self, table: NutrientTable, rows: Sequence[int], grams: Sequence[float]):
+        rows = _frozen(rows, np.intp)
+        grams = _frozen(grams, np.float64)
+        if rows.shape != grams.shape or rows.ndim != 1:
+            raise ValueError("rows and grams must be 1-D arrays of the same length")
+        object.__setattr__(self, "table", table)
+        object.__setattr__(self, "rows", rows)
+        object.__setattr__(self, "grams", grams)
+        object.__setattr__(self, "group_ids", _frozen(table.group_ids[rows], table.group_ids.dtype))
+        object.__setattr__(self, "_key", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Meal is immutable")
+
+    # Construction
+    @classmethod
+    def from_ingredients(cls, ingredients: Iterable[Ingredient], source: TableSource) -> "Meal":
+        """Depuis une liste d'Ingredient (ou de MealItem)"""
+        ingredients = list(ingredients)
+        table = _table(source)
+        return cls(table, table.rows([ingredient.id for ingredient in ingredients]),
+                   [ingredient.gQuantity for ingredient in ingredients])
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], source: TableSource, default_grams: float = 100) -> "Meal":
+        """Depuis des dicts {'id': FoodID, 'quantite': grammes}"""
+        records = list(records)
+        table = _table(source)
+        return cls(table, table.rows([record['id'] for record in records]),
+                   [record.get('quantite', default_grams) for record in records])
+
+    @classmethod
+    def from_vision(cls, result: Dict, source: TableSource,
+                    resolve: Optional[Callable[[str], Optional[int]]] = None,
+                    unknown: Optional[List[str]] = None) -> "Meal":
+        """Depuis le JSON du modèle de vision ({'ingredients': [{'nom', 'quantite'}]}) ; les noms absents
+        de la base sont confiés à `resolve` (nom -> FoodID ou None). Un nom qui reste inconnu lève KeyError,
+        ou, si `unknown` est une liste, y est ajouté et ignoré"""
+        table = _table(source)
+        ingredients = result['ingredients']
+        if unknown is None:
+            return cls(table, table.rows_by_name([ingredient['nom'] for ingredient in ingredients], resolve),
+                       [ingredient['quantite'] for ingredient in ingredients])
+        rows, grams = [], []
+        for ingredient in ingredients:
+            try:
+                rows.append(int(table.rows_by_name([ingredient['nom']], resolve)[0]))
+            except KeyError:
+                unknown.append(ingredient['nom'])
+                continue
+            grams.append(ingredient['quantite'])
+        return cls(table, rows, grams)
+
+    # Accès aux ingrédients
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i: int) -> MealItem:
+        if not -len(self) <= i < len(self):
+            raise IndexError("Meal index out of range")
+        return MealItem(self, i % len(self))
+
+    def __iter__(self) -> Iterator[MealItem]:
+        return (MealItem(self, i) for i in range(len(self)))
+
+    def __add__(self, other: "Meal") -> "Meal":
+        """Concaténation de deux repas (ex. midi + soir pour le score de la journée)"""
+        if other.table is not self.table:
+            raise ValueError("Cannot combine meals built on different ingredient tables")
+        return Meal(self.table, np.concatenate([self.rows, other.rows]), np.concatenate([self.grams, other.grams]))
+
+    @property
+    def food_ids(self) -> np.ndarray:
+        return self.table.food_ids[self.rows]
+
+    def to_ingredients(self) -> List[Ingredient]:
+        return [Ingredient(item.id, item.gQuantity, item.groupId) for item in self]
+
+    # Calculs
+    def nutrients(self) -> np.ndarray:
+        """Vecteur des apports totaux, dans l'ordre de table.nutrient_ids"""
+        return self.table.sum_rows(self.rows, self.grams)
+
+    def nutrients_dict(self) -> Dict[str, float]:
+        """Apports totaux au format {nutrient_id: quantité}, comme get_nutrients_from_meal"""
+        return self.table.to_dict(self.nutrients())
+
+    def vegetables_grams(self) -> float:
+        """Quantité de légumes (groupe 1) dans le repas, en grammes"""
+        return float(self.grams[self.group_ids == VEGETABLES_GROUP_ID].sum())
+
+    def vegetables_proportion(self) -> float:
+        """Proportion de légumes (groupe 1) dans le repas, limitée à 50%"""
+        return min(self.vegetables_grams() / float(self.grams.sum()), MAX_VEGETABLES_PROPORTION)
+
+    # Clé de cache : indépendante de l'ordre des ingrédients
+    @property
+    def key(self) -> bytes:
+        if self._key is None:
+            food_ids = self.food_ids.astype(np.int64)
+            order = np.lexsort((self.grams, food_ids))
+            digest = hashlib.blake2b(food_ids[order].tobytes() + self.grams[order].tobytes(), digest_size=16)
+            object.__setattr__(self, "_key", digest.digest())
+        return self._key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Meal) and self.key == other.key
+
+    def __repr__(self):
+        return f"Meal({len(self)} ingredients, {self.grams.sum():g} g)"
+
+
+def as_meal(meal: Union[Meal, Iterable[Ingredient]], source: TableSource) -> Meal:
+    """Meal tel quel, ou construit depuis une liste d'Ingredient"""
+    return meal if isinstance(meal, Meal) else Meal.from_ingredients(meal, source)
+
+
+class MealLog:
+    """Journal de repas (non vides) : tous les ingrédients dans des tableaux concaténés, délimités par `offsets`"""
+    __slots__ = ("table", "rows", "grams", "offsets")
+
+    def __init__(self, table: NutrientTable, rows: np.ndarray, grams: np.ndarray, offsets: np.ndarray):
+        self.table = table
+        self.rows = _frozen(rows, np.intp)
+        self.grams = _frozen(grams, np.float64)
+        self.offsets = _frozen(offsets, np.intp)
+
+    @classmethod
+    def from_meals(cls, meals: Sequence[Meal]) -> "MealLog":
+        if not meals:
+            raise ValueError("MealLog needs at least one meal")
+        table = meals[0].table
+        if any(meal.table is not table for meal in meals):
+            raise ValueError("Cannot log meals built on different ingredient tables")
+        if any(len(meal) == 0 for meal in meals):
+            raise ValueError("Cannot log an empty meal")
+        offsets = np.zeros(len(meals) + 1, dtype=np.intp)
+        np.cumsum([len(meal) for meal in meals], out=offsets[1:])
+        return cls(table, np.concatenate([meal.rows for meal in meals]),
+                   np.concatenate([meal.grams for meal in meals]), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> Meal:
+        # Index négatif compté depuis la fin, comme une liste (offsets[-1]:offsets[0] serait vide)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("MealLog index out of range")
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return Meal(self.table, self.rows[start:end], self.grams[start:end])
+
+    def nutrients(self) -> np.ndarray:
+        """Apports totaux de chaque repas : matrice (repas x nutriments)"""
+        weighted = self.table.matrix[self.rows] * (self.grams / 100)[:, None]
+        return np.add.reduceat(weighted, self.offsets[:-1], axis=0)
+
+    def vegetables_proportions(self) -> np.ndarray:
+        """Proportion de légumes de chaque repas, limitée à 50%"""
+        vegetables = np.where(self.table.group_ids[self.rows] == VEGETABLES_GROUP_ID, self.grams, 0.0)
+        totals = np.add.reduceat(self.grams, self.offsets[:-1])
+        return np.minimum(np.add.reduceat(vegetables, self.offsets[:-1]) / totals, MAX_VEGETABLES_PROPORTION)
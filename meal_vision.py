@@ -0,0 +1,73 @@
+"""
+Limeat - Appel au modèle de vision pour l'analyse d'une photo de repas
+"""
+import base64
+import hashlib
+
+from llm_client import LLMClient, get_llm_client
+from prompts import PromptSpec, get_prompt
+from singleflight import get_group, make_key
+from structured_output import MEAL_ANALYSIS_SCHEMA, STRUCTURED_OUTPUT_MODE, anthropic_tool, parse_structured
+from telemetry import capture_image
+from tracing import span, traced
+
+VISION_MODEL = "claude-3-opus-20240229"
+
+
+def call_vision_model(client: LLMClient, image_data: bytes, spec: PromptSpec) -> str:
+    """Encode l'image et interroge le modèle de vision"""
+    with span("vision.encode_image", image_bytes=len(image_data)):
+        base64_image = base64.b64encode(image_data).decode('utf-8')
+
+    if STRUCTURED_OUTPUT_MODE == "tool":
+        # Réponse contrainte par le schéma : plus de JSON mal formé à reparser
+        structured, prefill = anthropic_tool("report_meal_analysis", MEAL_ANALYSIS_SCHEMA), []
+    else:
+        # Pré-remplissage de la réponse : le modèle commence directement l'objet JSON
+        structured, prefill = {}, [{"role": "assistant", "content": "{"}]
+
+    response = client.complete(
+        model=VISION_MODEL,
+        max_tokens=spec.max_tokens,
+        temperature=spec.temperature,
+        label=spec.label,
+        inputs={"image_sha256": capture_image(image_data)},
+        messages=[{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": spec.render()},
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": base64_image
+                    }
+                }
+            ]
+        }] + prefill,
+        **structured,
+    )
+    return "{" + response.text if prefill else response.text
+
+
+@traced("vision.request")
+def request_meal_analysis(image_data: bytes, client: LLMClient = None, prompt_version: str = None) -> str:
+    """Renvoie le texte brut de l'analyse d'une image.
+
+    Les analyses concurrentes d'une même image (même photo envoyée par plusieurs
+    convives, double clic) partagent un seul appel au modèle.
+    """
+    spec = get_prompt("meal_analysis", prompt_version)
+    key = make_key("vision", VISION_MODEL, spec.label, STRUCTURED_OUTPUT_MODE, hashlib.sha256(image_data).digest())
+    return get_group("vision").do(key, call_vision_model, client or get_llm_client("anthropic"), image_data, spec)
+
+
+def analyze_meal(image_data: bytes, client: LLMClient = None, prompt_version: str = None) -> dict:
+    """Analyse une image et renvoie le résultat validé par MEAL_ANALYSIS_SCHEMA.
+
+    Chaque appelant reçoit son propre dict (parsé depuis le texte partagé).
+    Lève StructuredOutputError si la réponse est irrécupérable.
+    """
+    return parse_structured(request_meal_analysis(image_data, client, prompt_version),
+                            MEAL_ANALYSIS_SCHEMA, "meal_analysis")
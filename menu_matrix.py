@@ -0,0 +1,194 @@
+"""
+Limeat - Matrice des scores (segment de profils x plat) pour la planification des menus
+
+Chaque plat de meals.csv est scoré comme un repas pour chaque segment de
+profils (tranches d'âge, de poids et d'activité, besoins calculés par la
+formule de Black & al) en un seul appel aux noyaux de scoring_kernels. La
+matrice est enregistrée en float32 dans un .npz, avec une empreinte par plat
+et par segment : une mise à jour ne recalcule que les colonnes des plats et
+les lignes des segments modifiés.
+
+Usage :
+    python menu_matrix.py                       # construit ou met à jour la matrice
+    python menu_matrix.py --top 5 --segment "30-44 ans, 65-79 kg, actif" --allergies gluten
+"""
+import argparse
+import hashlib
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from allergens import ARTIFACTS_DIR, get_allergen_index, safe_mask
+from nutrition import get_meals_db
+from scoring_kernels import SCORE_NUTRIENTS, calory_needs, population_meal_scores
+
+MATRIX_PATH = ARTIFACTS_DIR / "menu_matrix.npz"
+# Portion servie d'un plat (meals.csv donne les apports pour 100 g)
+PORTION_G = float(os.getenv("LIMEAT_MENU_PORTION_G", 300))
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Segment de profils, représenté par un profil type"""
+    name: str
+    age: float
+    weight: float
+    size: float
+    activityLevel: float
+
+    def key(self) -> str:
+        return repr(tuple(float(v) for v in (self.age, self.weight, self.size, self.activityLevel)))
+
+
+def default_segments(size: float = 170) -> List[Segment]:
+    """Tranches d'âge x poids x niveau d'activité, au milieu de chaque tranche"""
+    ages = [("18-29 ans", 24), ("30-44 ans", 37), ("45-59 ans", 52), ("60 ans et +", 68)]
+    weights = [("50-64 kg", 57), ("65-79 kg", 72), ("80-94 kg", 87), ("95 kg et +", 102)]
+    activities = [("sédentaire", 1.4), ("actif", 1.6), ("très actif", 1.9)]
+    return [Segment(f"{age_name}, {weight_name}, {activity_name}", age, weight, size, activity)
+            for age_name, age in ages for weight_name, weight in weights for activity_name, activity in activities]
+
+
+def dish_totals(meals_db: pd.DataFrame, portion_g: float = PORTION_G) -> np.ndarray:
+    """Apports d'une portion de chaque plat, colonnes dans l'ordre SCORE_NUTRIENTS"""
+    totals = meals_db[list(SCORE_NUTRIENTS)].to_numpy(dtype=np.float64) * (portion_g / 100)
+    # Énergie absente (0) pour certains plats : estimée à partir des macro-nutriments
+    estimated = totals[:, 1] * 4 + totals[:, 2] * 4 + totals[:, 3] * 9
+    totals[:, 0] = np.where(totals[:, 0] > 0, totals[:, 0], estimated)
+    return totals
+
+
+def _row_keys(totals: np.ndarray) -> np.ndarray:
+    """Empreinte des apports de chaque plat"""
+    return np.array([hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest() for row in totals])
+
+
+class MenuMatrix:
+    """Scores (segments, plats) en float32, avec les empreintes qui permettent une mise à jour partielle"""
+
+    def __init__(self, segments: List[Segment], codes: np.ndarray, names: np.ndarray, scores: np.ndarray,
+                 meal_keys: np.ndarray, portion_g: float):
+        self.segments = list(segments)
+        self.codes = np.asarray(codes)
+        self.names = np.asarray(names, dtype=str)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.meal_keys = np.asarray(meal_keys)
+        self.portion_g = portion_g
+        self._rows = {segment.name: i for i, segment in enumerate(self.segments)}
+
+    @classmethod
+    def empty(cls, portion_g: float = PORTION_G) -> "MenuMatrix":
+        return cls([], np.array([], dtype=np.int64), np.array([], dtype=str), np.zeros((0, 0)), np.array([]), portion_g)
+
+    @classmethod
+    def build(cls, meals_db: pd.DataFrame, segments: Sequence[Segment] = None,
+              portion_g: float = PORTION_G) -> "MenuMatrix":
+        matrix = cls.empty(portion_g)
+        matrix.update(meals_db, segments)
+        return matrix
+
+    def update(self, meals_db: pd.DataFrame, segments: Sequence[Segment] = None) -> Dict[str, int]:
+        """Aligne la matrice sur les plats et segments donnés ; seuls les changements sont recalculés"""
+        segments = list(default_segments() if segments is None else segments)
+        totals = dish_totals(meals_db, self.portion_g)
+        codes = meals_db["alim_code"].to_numpy()
+        meal_keys = _row_keys(totals)
+
+        old_cols = pd.Index(self.codes).get_indexer(codes)
+        meal_kept = old_cols >= 0
+        meal_kept[meal_kept] = self.meal_keys[old_cols[meal_kept]] == meal_keys[meal_kept]
+        old_segments = {segment.name: (i, segment.key()) for i, segment in enumerate(self.segments)}
+        old_rows = np.array([old_segments[s.name][0] if old_segments.get(s.name, (-1, None))[1] == s.key() else -1
+                             for s in segments], dtype=np.intp)
+        segment_kept = old_rows >= 0
+
+        scores = np.empty((len(segments), len(codes)), dtype=np.float32)
+        scores[np.ix_(segment_kept, meal_kept)] = self.scores[np.ix_(old_rows[segment_kept], old_cols[meal_kept])]
+        params = np.array([(s.weight, s.size, s.age, s.activityLevel) for s in segments], dtype=np.float64)
+        needs = calory_needs(*params.reshape(-1, 4).T)
+        vegetables = np.zeros(len(codes))  # composition inconnue : même contribution pour tous les plats
+        # Plats nouveaux ou modifiés, pour tous les segments ; puis segments nouveaux ou modifiés, pour tous les plats
+        if (~meal_kept).any():
+            scores[:, ~meal_kept] = population_meal_scores(totals[~meal_kept], vegetables[~meal_kept], needs)[0]
+        if (~segment_kept).any():
+            scores[~segment_kept, :] = population_meal_scores(totals, vegetables, needs[~segment_kept])[0]
+
+        self.segments, self.codes, self.scores, self.meal_keys = segments, codes, scores, meal_keys
+        self.names = meals_db["alim_nom_fr"].to_numpy(dtype=str)
+        self._rows = {segment.name: i for i, segment in enumerate(segments)}
+        return {"meals_recomputed": int((~meal_kept).sum()), "segments_recomputed": int((~segment_kept).sum())}
+
+    def best_dishes(self, segment: str, n: int = 10, allergies: Iterable[str] = (),
+                    meals_db: Optional[pd.DataFrame] = None) -> List[Tuple[int, str, float]]:
+        """Les `n` plats les mieux notés pour un segment, sans les plats contenant un allergène du profil"""
+        scores = np.nan_to_num(self.scores[self._rows[segment]], nan=-np.inf)
+        allergies = list(allergies)
+        if allergies:
+            meals_db = get_meals_db() if meals_db is None else meals_db
+            masks = get_allergen_index(meals_db, "meals").masks_for(self.codes)
+            scores = np.where(safe_mask(masks, allergies), scores, -np.inf)
+        n = min(n, int(np.isfinite(scores).sum()))
+        top = np.argpartition(-scores, n - 1)[:n] if n else np.array([], dtype=np.intp)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.codes[i]), str(self.names[i]), float(scores[i])) for i in top]
+
+    def save(self, path: Path = MATRIX_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            path, scores=self.scores, codes=self.codes, names=self.names, meal_keys=self.meal_keys,
+            portion_g=self.portion_g,
+            segments=np.array([[str(v) for v in asdict(s).values()] for s in self.segments]).reshape(-1, 5))
+
+    @classmethod
+    def load(cls, path: Path = MATRIX_PATH) -> Optional["MenuMatrix"]:
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as saved:
+            segments = [Segment(name, *map(float, values)) for name, *values in saved["segments"].tolist()]
+            return cls(segments, saved["codes"], saved["names"], saved["scores"], saved["meal_keys"],
+                       float(saved["portion_g"]))
+
+
+def build_or_update(meals_db: pd.DataFrame = None, segments: Sequence[Segment] = None,
+                    path: Path = MATRIX_PATH, portion_g: float = PORTION_G) -> Tuple[MenuMatrix, Dict[str, int]]:
+    """Recharge la matrice enregistrée (même portion) et la met à jour, ou la construit ; puis l'enregistre"""
+    meals_db = get_meals_db() if meals_db is None else meals_db
+    matrix = MenuMatrix.load(path)
+    if matrix is None or matrix.portion_g != portion_g:
+        matrix = MenuMatrix.empty(portion_g)
+    stats = matrix.update(meals_db, segments)
+    if stats["meals_recomputed"] or stats["segments_recomputed"] or not Path(path).exists():
+        matrix.save(path)
+    return matrix, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=str(MATRIX_PATH))
+    parser.add_argument("--portion", type=float, default=PORTION_G, help="portion servie (g)")
+    parser.add_argument("--segment", help="segment à interroger (par défaut : le premier)")
+    parser.add_argument("--top", type=int, default=0, help="affiche les N meilleurs plats du segment")
+    parser.add_argument("--allergies", nargs="*", default=[])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    matrix, stats = build_or_update(path=Path(args.path), portion_g=args.portion)
+    print(f"{args.path}: {matrix.scores.shape[0]} segments x {matrix.scores.shape[1]} plats, "
+          f"{stats['segments_recomputed']} segments et {stats['meals_recomputed']} plats recalculés "
+          f"en {time.perf_counter() - start:.3f} s")
+    if args.top:
+        segment = args.segment or matrix.segments[0].name
+        print(f"\n{segment}")
+        for code, name, score in matrix.best_dishes(segment, args.top, args.allergies):
+            print(f"  {score:.3f}  {name} ({code})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Limeat - Nutri-Score calculé localement, pour les tables d'aliments et pour les repas
+
+Algorithme 2017 (aliments solides) : points A (énergie, sucres, acides gras
+saturés, sodium) moins points C (fruits, légumes, légumineuses et fruits à
+coque, fibres, protéines), puis lettre de A à E. Les seuils sont appliqués par
+np.searchsorted sur des colonnes entières : toute la table des ingrédients ou
+des plats est notée en une fois, au chargement (colonnes "nutriscore" et
+"nutriscore_grade"), et un repas l'est à partir de son vecteur d'apports.
+
+Cas particuliers pris en compte : fromages (protéines toujours comptées) et
+matières grasses ajoutées (rapport acides gras saturés / lipides). Les
+boissons suivent une autre grille, absente de ces tables.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Points A : un point par seuil strictement dépassé (pour 100 g)
+ENERGY_KJ = np.array([335, 670, 1005, 1340, 1675, 2010, 2345, 2680, 3015, 3350])
+SUGARS_G = np.array([4.5, 9, 13.5, 18, 22.5, 27, 31, 36, 40, 45])
+SATURATED_FAT_G = np.array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
+SATURATED_RATIO_PCT = np.array([10, 16, 22, 28, 34, 40, 46, 52, 58, 64])  # matières grasses ajoutées
+SODIUM_MG = np.array([90, 180, 270, 360, 450, 540, 630, 720, 810, 900])
+# Points C
+FIBRE_G = np.array([0.9, 1.9, 2.8, 3.7, 4.7])
+PROTEIN_G = np.array([1.6, 3.2, 4.8, 6.4, 8.0])
+FVN_PCT = np.array([40, 60, 80])
+FVN_POINTS = np.array([0, 1, 2, 5])
+
+# Score maximal de chaque lettre (aliments solides)
+GRADES = ("A", "B", "C", "D", "E")
+GRADE_BOUNDS = np.array([-1, 2, 10, 18])
+
+KCAL_TO_KJ = 4.184
+# Identifiants des nutriments utilisés (colonnes des tables et de NutrientTable)
+NUTRIENTS = {"energy": "208", "sugars": "269", "saturated_fat": "606", "sodium": "307", "fibre": "291",
+             "protein": "203", "carbs": "205", "lipids": "204"}
+
+# Aliments comptés à 100% dans "fruits, légumes, légumineuses et fruits à coque"
+FVN_GROUPS = {"Fruits et légumes"}
+FVN_SUBGROUPS = {"légumineuses", "fruits à coque et graines oléagineuses"}
+FVN_OILS = ("huile d'olive", "huile de colza", "huile de noix")
+CHEESE_SUBGROUPS = {"fromages et assimilés"}
+FAT_GROUPS = {"Matières grasses"}
+
+
+def _points(values, thresholds: np.ndarray) -> np.ndarray:
+    return np.searchsorted(thresholds, np.nan_to_num(np.asarray(values, dtype=np.float64)), side="left")
+
+
+def energy_kcal(energy, proteins, carbs, lipids) -> np.ndarray:
+    """Énergie pour 100 g ; estimée à partir des macro-nutriments quand elle vaut 0 ou manque"""
+    energy = np.nan_to_num(np.asarray(energy, dtype=np.float64))
+    estimated = (np.nan_to_num(np.asarray(proteins, dtype=np.float64)) * 4
+                 + np.nan_to_num(np.asarray(carbs, dtype=np.float64)) * 4
+                 + np.nan_to_num(np.asarray(lipids, dtype=np.float64)) * 9)
+    return np.where(energy > 0, energy, estimated)
+
+
+def nutriscore_points(energy_kcal, sugars, saturated_fat, sodium_mg, fibre, protein, fvn_percent=0,
+                      lipids=None, cheese=False, fat=False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(score, points A, points C) de tableaux de valeurs pour 100 g, diffusés entre eux"""
+    saturated_points = _points(saturated_fat, SATURATED_FAT_G)
+    if lipids is not None and np.any(fat):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(np.asarray(lipids, dtype=np.float64) > 0,
+                             100 * np.asarray(saturated_fat, dtype=np.float64) / np.asarray(lipids, dtype=np.float64),
+                             0)
+        saturated_points = np.where(fat, _points(ratio, SATURATED_RATIO_PCT), saturated_points)
+    points_a = (_points(np.asarray(energy_kcal, dtype=np.float64) * KCAL_TO_KJ, ENERGY_KJ)
+                + _points(sugars, SUGARS_G) + saturated_points + _points(sodium_mg, SODIUM_MG))
+    fvn_points = FVN_POINTS[_points(fvn_percent, FVN_PCT)]
+    fibre_points = _points(fibre, FIBRE_G)
+    protein_points = _points(protein, PROTEIN_G)
+    # Au-delà de 11 points A, les protéines ne comptent que si fruits et légumes rapportent 5 points
+    # (ou pour les fromages)
+    protein_counted = (points_a < 11) | (fvn_points >= 5) | np.asarray(cheese, dtype=bool)
+    points_c = fvn_points + fibre_points + np.where(protein_counted, protein_points, 0)
+    return points_a - points_c, points_a, points_c
+
+
+def grade(score) -> np.ndarray:
+    """Lettres (A à E) de scores Nutri-Score"""
+    return np.asarray(GRADES)[np.searchsorted(GRADE_BOUNDS, np.asarray(score), side="left")]
+
+
+# Tables d'aliments et de plats
+def _column(database: pd.DataFrame, *names: str) -> str:
+    """Première colonne présente parmi `names` (noms de ingredients_db.csv, puis de meals.csv)"""
+    return next(name for name in names if name in database.columns)
+
+
+def food_flags(database: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(part de fruits/légumes/légumineuses/fruits à coque en %, fromage, matière grasse ajoutée) par ligne ;
+    les plats de meals.csv, de composition inconnue, comptent 0%"""
+    group = database[_column(database, "FoodGroupName", "alim_grp_nom_fr")].fillna("")
+    subgroup = database[_column(database, "FoodSubGroup", "alim_ssgrp_nom_fr")].fillna("")
+    name = database[_column(database, "FoodName", "alim_nom_fr")].fillna("").str.lower()
+    fvn = group.isin(FVN_GROUPS) | subgroup.isin(FVN_SUBGROUPS) | name.str.startswith(FVN_OILS)
+    return (np.where(fvn, 100.0, 0.0), subgroup.isin(CHEESE_SUBGROUPS).to_numpy(),
+            group.isin(FAT_GROUPS).to_numpy())
+
+
+def score_table(database: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """(score, lettre) de chaque ligne d'une table pour 100 g (ingredients_db.csv ou meals.csv)"""
+    values = {key: database[column].to_numpy(dtype=np.float64) if column in database.columns
+              else np.zeros(len(database)) for key, column in NUTRIENTS.items()}
+    fvn, cheese, fat = food_flags(database)
+    score, _, _ = nutriscore_points(
+        energy_kcal(values["energy"], values["protein"], values["carbs"], values["lipids"]),
+        values["sugars"], values["saturated_fat"], values["sodium"], values["fibre"], values["protein"],
+        fvn, values["lipids"], cheese, fat)
+    return score, grade(score)
+
+
+def add_nutriscore_columns(database: pd.DataFrame) -> pd.DataFrame:
+    """Ajoute (en place) les colonnes "nutriscore" et "nutriscore_grade" ; renvoie la table"""
+    score, letters = score_table(database)
+    database["nutriscore"] = score
+    database["nutriscore_grade"] = letters
+    return database
+
+
+# Repas
+class MealScorer:
+    """Nutri-Score de repas construits sur une base d'ingrédients (vecteurs de NutrientTable).
+
+    Un repas est noté comme un aliment : apports totaux ramenés à 100 g, part de fruits et
+    légumes pondérée par les grammes.
+    """
+
+    def __init__(self, ingredients_db: pd.DataFrame):
+        from nutrition import get_nutrient_table
+
+        self.table = get_nutrient_table(ingredients_db)
+        columns = {nutrient_id: i for i, nutrient_id in enumerate(self.table.nutrient_ids)}
+        self.columns = {key: columns[nutrient_id] for key, nutrient_id in NUTRIENTS.items()}
+        self.fvn, _, _ = food_flags(ingredients_db)
+
+    def score_totals(self, totals: np.ndarray, grams, fvn_grams) -> Tuple[np.ndarray, np.ndarray]:
+        """(score, lettre) d'apports totaux (..., nutriments) pour `grams` grammes dont `fvn_grams` de fruits,
+        légumes, légumineuses et fruits à coque"""
+        grams = np.asarray(grams, dtype=np.float64)
+        per_100g = np.asarray(totals, dtype=np.float64) * (100 / np.where(grams > 0, grams, 1))[..., None]
+        value = {key: per_100g[..., column] for key, column in self.columns.items()}
+        fvn_percent = 100 * np.asarray(fvn_grams, dtype=np.float64) / np.where(grams > 0, grams, 1)
+        score, _, _ = nutriscore_points(
+            energy_kcal(value["energy"], value["protein"], value["carbs"], value["lipids"]),
+            value["sugars"], value["saturated_fat"], value["sodium"], value["fibre"], value["protein"],
+            fvn_percent)
+        return score, grade(score)
+
+    def score(self, meal) -> Tuple[int, str]:
+        """(score, lettre) d'un meal.Meal"""
+        score, letter = self.score_totals(meal.nutrients(), meal.grams.sum(), self._fvn_grams(meal))
+        return int(score), str(letter)
+
+    def _fvn_grams(self, meal) -> float:
+        return float(meal.grams @ (self.fvn[meal.rows] / 100))
+
+    def rank_removals(self, meal) -> List[Dict]:
+        """Gain de score en retirant chaque ingrédient du repas, du plus utile au moins utile.
+
+        Seuls les ingrédients moins bien notés (pour 100 g) que le repas sont candidats, jamais
+        les fruits, légumes, légumineuses et fruits à coque."""
+        if len(meal) < 2:
+            return []
+        contributions = (meal.grams / 100)[:, None] * self.table.matrix[meal.rows]
+        fvn = meal.grams * self.fvn[meal.rows] / 100
+        base, _ = self.score_totals(meal.nutrients(), meal.grams.sum(), fvn.sum())
+        own, _ = self.score_totals(self.table.matrix[meal.rows], 100, self.fvn[meal.rows])
+        keep = np.flatnonzero((own > base) & (self.fvn[meal.rows] == 0))
+        scores, letters = self.score_totals(meal.nutrients() - contributions[keep], meal.grams.sum() - meal.grams[keep],
+                                            fvn.sum() - fvn[keep])
+        return self._ranked(meal.rows[keep], base - scores, letters)
+
+    def rank_additions(self, meal, candidate_rows: Optional[Sequence[int]] = None,
+                       grams=100) -> List[Dict]:
+        """Gain de score en ajoutant `grams` g (un nombre, ou un par candidat) de chaque candidat (toute la
+        base par défaut), tous notés en une fois"""
+        rows = np.arange(len(self.fvn)) if candidate_rows is None else np.asarray(candidate_rows, dtype=np.intp)
+        grams = np.broadcast_to(np.asarray(grams, dtype=np.float64), rows.shape)
+        fvn_grams = self._fvn_grams(meal)
+        base, _ = self.score_totals(meal.nutrients(), meal.grams.sum(), fvn_grams)
+        scores, letters = self.score_totals(meal.nutrients() + self.table.matrix[rows] * (grams / 100)[:, None],
+                                            meal.grams.sum() + grams, fvn_grams + self.fvn[rows] * grams / 100)
+        return self._ranked(rows, base - scores, letters)
+
+    def _ranked(self, rows: np.ndarray, gains: np.ndarray, letters: np.ndarray) -> List[Dict]:
+        order = np.argsort(-gains, kind="stable")
+        return [{"FoodID": int(self.table.food_ids[rows[i]]), "row": int(rows[i]), "gain": int(gains[i]),
+                 "grade": str(letters[i])} for i in order]
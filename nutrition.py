@@ -0,0 +1,220 @@
+"""
+Limeat - Calcul vectorisé des apports nutritionnels d'un repas
+
+Version importable des fonctions annexes de datathon.ipynb : les lignes
+nutritionnelles sont rassemblées en une seule indexation, puis pondérées par
+les quantités via un produit matrice-vecteur.
+"""
+import weakref
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path("datathon_Schoolab-main/data")
+
+T = TypeVar("T")
+
+# Liste des nutriments pris en compte, de leur ID et de leur unité.
+nut_dict = {'203': "Protéines", '204': "Lipides", '205': "Glucides", '208': "Energie", '291': "Fibres", '601': "Cholesterol", '255' : "Eau", '269': "Sucres", '810': "Amidon", '301': "Calcium", '304': "Magnesium", '305' : "Phosphore", '306': "Potassium", '307': "Sodium", '303': "Fer", '309' : "Zinc", '312': "Cuivre", '315': "Manganese", '317': "Selenium", '606': "AG Saturés", '645': "AG monoinsaturés", '646': "AG polyinsaturés", '617': "AG oléique", '618': "AG linoléique", '619': "AG alpha-linolénique", '620': "AG arachidonique", '629': "AG EPA", '621': "AG DHA", '319' : "Vitamine A (Retinol)", '321': "Vitamine A (B-carotene)", '339': "Vitamine D", '401': "Vitamine C", '404': "Vitamine B1", '405' : "Vitamine B2", '406': "Vitamine B3", '410': "Vitamine B5", '415': "Vitamine B6", '417': "Vitamine B9", '418': "Vitamine B12", '501' : "Tryptophane (AA)", '502': "Threonine (AA)", '503': "Isoleucine (AA)", '504': "Leucine (AA)", '505' : "Lysine (AA)", '506': "Methionine (AA)", '508': "Phenylalanine (AA)", '512' : "Histidine (AA)", '510' : "Valine (AA)", '3000': "Iode", '4000': "Vitamine E", '4001': "Vitamine K"}
+unities_dict = {'203': "g/100 g", '204': "g/100 g", '205': "g/100 g", '208': "kcal/100 g", '291': "g/100 g", '601': "mg/100 g", '255' : "g/100 g", '269': "g/100 g", '810': "g/100 g", '301': "mg/100 g", '304': "mg/100 g", '305' : "mg/100 g", '306': "mg/100 g", '307': "mg/100 g", '303': "mg/100 g", '309' : "mg/100 g", '312': "mg/100 g", '315': "mg/100 g", '317': "µg/100 g", '606': "g/100 g",  '645': "g/100 g", '646': "g/100 g",  '617': "g/100 g", '618': "g/100 g",  '619': "g/100 g", '620': "g/100 g",  '629': "g/100 g", '621': "g/100 g", '319' : "µg/100 g", '321': "µg/100 g", '339': "µg/100 g", '401': "mg/100 g", '404': "mg/100 g", '405' : "mg/100 g", '406': "mg/100 g", '410': "mg/100 g", '415': "mg/100 g", '417': "µg/100 g", '418': "µg/100 g", '501' : "g/100 g", '502': "g/100 g", '503': "g/100 g", '504': "g/100 g", '505' : "g/100 g", '506': "g/100 g", '508': "g/100 g", '512' : "g/100 g", '510' : "g/100 g", '3000': "µg/100 g", '4000': "mg/100 g", '4001': "µg/100 g"}
+
+# Unités d'un repas (sans le "/100 g"), construites une seule fois au chargement du module
+nutrient_units = {key: value.split('/')[0] for key, value in unities_dict.items()}
+
+
+class Ingredient():
+    """Ingrédient d'un repas : id (FoodID de la table des ingrédients) et quantité en grammes"""
+    id: int
+    gQuantity: float
+    groupId: int = None
+
+    def __init__(self, id, gQuantity, groupId=None):
+        self.id = id
+        self.gQuantity = gQuantity
+        self.groupId = groupId
+
+
+class NutrientTable:
+    """Matrice (aliments x nutriments) pour 100 g, indexée par identifiant d'aliment.
+
+    Construite une fois par base ; chaque repas ne coûte ensuite qu'une
+    indexation et un produit matrice-vecteur.
+    """
+
+    def __init__(self, database: pd.DataFrame, id_column: str = "FoodID", group_column: str = "FoodGroupID",
+                 name_column: str = "FoodName"):
+        self.nutrient_ids: List[str] = [col for col in database.columns if col in nut_dict]
+        self.food_ids = database[id_column].to_numpy()
+        self._index = pd.Index(self.food_ids)
+        # Les valeurs manquantes sont ignorées dans la somme, comme dans le notebook (skipna)
+        self.matrix = np.nan_to_num(database[self.nutrient_ids].to_numpy(dtype=np.float64))
+        self.group_ids = (database[group_column].to_numpy() if group_column in database.columns
+                          else np.full(len(database), np.nan))
+        # Noms en minuscules -> ligne, pour résoudre les ingrédients renvoyés par le modèle de vision
+        # (première occurrence en cas de doublon, comme la recherche de l'application)
+        names = database[name_column].str.lower().tolist() if name_column in database.columns else []
+        self._name_rows: Dict[str, int] = {}
+        for row, name in enumerate(names):
+            self._name_rows.setdefault(name, row)
+
+    def rows(self, food_ids: Sequence[int]) -> np.ndarray:
+        """Positions des aliments dans la matrice ; KeyError si un identifiant est inconnu"""
+        rows = self._index.get_indexer(np.asarray(food_ids))
+        if (rows < 0).any():
+            unknown = np.asarray(food_ids)[rows < 0]
+            raise KeyError(f"Unknown food ids: {sorted(set(unknown.tolist()))}")
+        return rows
+
+    def rows_by_name(self, names: Sequence[str],
+                     resolve: Optional[Callable[[str], Optional[int]]] = None) -> np.ndarray:
+        """Positions des aliments par nom (insensible à la casse) ; les noms inconnus sont confiés à
+        `resolve` (nom -> identifiant d'aliment, ou None) ; KeyError si un nom reste inconnu"""
+        rows = [self._name_rows.get(name.lower()) for name in names]
+        if resolve is not None:
+            for i, name in enumerate(names):
+                if rows[i] is None:
+                    food_id = resolve(name)
+                    rows[i] = int(self.rows([food_id])[0]) if food_id is not None else None
+        unknown = [name.lower() for name, row in zip(names, rows) if row is None]
+        if unknown:
+            raise KeyError(f"Unknown food names: {sorted(set(unknown))}")
+        return np.array(rows, dtype=np.intp)
+
+    def sum_rows(self, rows: np.ndarray, grams: Sequence[float]) -> np.ndarray:
+        """Vecteur des apports totaux : somme des lignes pondérées par quantité / 100"""
+        return (np.asarray(grams, dtype=np.float64) / 100) @ self.matrix[rows]
+
+    def sum_nutrients(self, food_ids: Sequence[int], grams: Sequence[float]) -> np.ndarray:
+        """Apports totaux d'une liste (identifiants, grammes) ; les doublons s'additionnent"""
+        return self.sum_rows(self.rows(food_ids), grams)
+
+    def to_dict(self, totals: np.ndarray) -> Dict[str, float]:
+        """Convertit un vecteur d'apports au format {nutrient_id: quantité}"""
+        return dict(zip(self.nutrient_ids, totals.tolist()))
+
+
+def frame_cache(build: Callable[..., T]) -> Callable[..., T]:
+    """Décorateur : `build(data_frame, *args)` calculé au premier appel pour une base, puis réutilisé.
+
+    Les DataFrames ne sont pas hashables : cache par id, libéré avec la base.
+    La base est supposée non modifiée après son chargement.
+    """
+    cache: Dict[tuple, T] = {}
+
+    @wraps(build)
+    def cached(data_frame: pd.DataFrame, *args, **kwargs) -> T:
+        key = (id(data_frame), *args, *sorted(kwargs.items()))
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = build(data_frame, *args, **kwargs)
+            weakref.finalize(data_frame, cache.pop, key, None)
+        return value
+
+    cached.cache = cache
+    return cached
+
+
+@frame_cache
+def get_nutrient_table(database: pd.DataFrame) -> NutrientTable:
+    """NutrientTable associée à une base, construite au premier appel puis réutilisée"""
+    return NutrientTable(database)
+
+
+#  Fonctions annexes qui permettent de manipuler les données nutritionnelles
+def build_DF_from_selection(Database: pd.DataFrame, foods: list[Ingredient]):
+    """
+    Cette méthode construit un Dataframe à partir d'une liste d'objets de type Ingredient. Elle permet de récupérer les informations nutritionnelles des aliments sélectionnés par l'utilisateur.
+    Un même aliment présent plusieurs fois dans le repas n'apparaît qu'une fois, avec la somme de ses quantités.
+
+    Args:
+        Database (pd.DataFrame): DataFrame contenant les informations nutritionnelles des aliments
+        foods (list): Liste d'objets de type Ingredient
+
+    Returns:
+        selection_info_DF (pd.DataFrame): DataFrame contenant les informations nutritionnelles des aliments sélectionnés par l'utilisateur
+    """
+    quantities = pd.Series([food.gQuantity for food in foods], index=[food.id for food in foods], dtype=np.float64)
+    quantities = quantities.groupby(level=0, sort=False).sum()
+
+    selection_info_DF = Database.loc[Database['FoodID'].isin(quantities.index)].copy()
+    selection_info_DF['Quantity'] = quantities.reindex(selection_info_DF['FoodID']).to_numpy()
+
+    return selection_info_DF.set_index("FoodID", drop=False)
+
+
+def sum_nutrients(selection: pd.DataFrame):
+    """
+    Cette méthode permet de sommer les nutriments des aliments sélectionnés par l'utilisateur, pour obtenir les valeurs nutritionnelles totales de la sélection.
+
+    Args:
+        selection (pd.DataFrame): DataFrame contenant les informations nutritionnelles des aliments sélectionnés par l'utilisateur
+
+    Returns:
+        total (pd.Series): Série contenant les valeurs nutritionnelles totales de la sélection
+    """
+    nutrient_ids = [col for col in selection.columns if col in nut_dict]
+    nutrients = np.nan_to_num(selection[nutrient_ids].to_numpy(dtype=np.float64))
+
+    # Total nutrient = sum of nutrient of each aliments, weighted by the ratio
+    total = (selection['Quantity'].to_numpy(dtype=np.float64) / 100) @ nutrients
+
+    return pd.Series(total, index=nutrient_ids)
+
+
+def get_nutrients_from_meal(meal: list[Ingredient], ingredients_DB: pd.DataFrame):
+    """
+    Cette méthode récupère la somme des informations nutritionnelles des aliments sélectionnés par l'utilisateur.
+
+    Args:
+        meal (list): Liste d'objets de type Ingredient
+        ingredients_DB (pd.DataFrame): DataFrame contenant les informations nutritionnelles des aliments
+
+    Returns:
+        nutrient_dict (dict): Dictionnaire contenant les informations nutritionnelles des aliments sélectionnés par l'utilisateur au format {nutrient_id: quantity}
+    """
+    table = get_nutrient_table(ingredients_DB)
+    totals = table.sum_nutrients([food.id for food in meal], [food.gQuantity for food in meal])
+    return table.to_dict(totals)
+
+
+def sigmoid_piecewise(x, k1=5, k2=10, x0=0.4):
+    """
+    Sigmoïde avec deux pentes différentes selon que x est inférieur ou supérieur à x0.
+    k1 : Pente pour x < x0
+    k2 : Pente pour x >= x0
+    x0 : Point central où y=0.5
+    """
+    y = np.where(
+        x < x0,
+        1 / (1 + np.exp(-k1 * (x - x0))),  # k1 pour x < x0
+        1 / (1 + np.exp(-k2 * (x - x0)))   # k2 pour x >= x0
+    )
+    return y
+
+
+def load_ingredients_db(data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """Chargement de la base de données des ingrédients, avec le Nutri-Score de chaque aliment"""
+    from nutriscore import add_nutriscore_columns
+    return add_nutriscore_columns(pd.read_csv(Path(data_dir) / "ingredients_db.csv", sep=';'))
+
+
+def load_meals_db(data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """Chargement de la base de données des repas, pour suggérer des repas du soir, avec leur Nutri-Score"""
+    from nutriscore import add_nutriscore_columns
+    return add_nutriscore_columns(pd.read_csv(Path(data_dir) / "meals.csv", sep=';'))
+
+
+@lru_cache(maxsize=None)
+def get_ingredients_db(data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """Base des ingrédients lue une seule fois par processus : le même objet pour toutes les sessions,
+    pour que les index construits dessus (frame_cache) soient réutilisés d'un appel à l'autre"""
+    return load_ingredients_db(data_dir)
+
+
+@lru_cache(maxsize=None)
+def get_meals_db(data_dir: Path = DATA_DIR) -> pd.DataFrame:
+    """Base des repas lue une seule fois par processus (voir get_ingredients_db)"""
+    return load_meals_db(data_dir)
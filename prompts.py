@@ -0,0 +1,122 @@
+"""
+Limeat - Prompts versionnés et réglages de génération associés
+
+Chaque prompt existe en plusieurs versions comparables (latence, tokens, coût)
+avec benchmarks/replay_prompts.py avant d'être activées via LIMEAT_PROMPT_VERSION.
+"""
+import os
+from dataclasses import dataclass
+from string import Template
+from typing import Dict, Optional
+
+PROMPT_VERSION = os.getenv("LIMEAT_PROMPT_VERSION", "v1")
+
+
+@dataclass(frozen=True)
+class PromptSpec:
+    """Un prompt versionné et ses paramètres de génération"""
+    name: str
+    version: str
+    template: str
+    max_tokens: Optional[int]
+    temperature: Optional[float]
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}/{self.version}"
+
+    def render(self, **inputs) -> str:
+        return Template(self.template).substitute(**inputs)
+
+
+_SUGGESTIONS_V1 = """
+    You are a chef and nutritionist. Given the following ingredients:
+    $ingredients
+
+    1. Identify the most likely dish.
+    2. Suggest ingredients to **add** to increase calorie content.
+    3. Suggest ingredients to **remove** to decrease calories.
+    4. Suggest ingredients to **add** to improve the Nutri-Score (health benefits).
+    5. Suggest ingredients to **remove** to improve the Nutri-Score.
+
+    All ingredients must make sense in the context of the dish!
+
+    Return your response in this **JSON format**:
+    {
+      "dish_name": "Dish Name",
+      "add_calories": ["ingredient1", "ingredient2"],
+      "remove_calories": ["ingredient3", "ingredient4"],
+      "add_health": ["ingredient5", "ingredient6"],
+      "remove_health": ["ingredient7", "ingredient8"]
+    }
+    """
+
+# Version compacte : pas d'indentation ni de mise en forme, listes bornées
+_SUGGESTIONS_COMPACT = (
+    "Chef and nutritionist. Ingredients: $ingredients\n"
+    "Name the most likely dish; suggest ingredients to add/remove to raise/lower calories "
+    "and to add/remove to improve the Nutri-Score. Max 3 per list, all must fit the dish.\n"
+    'JSON only: {"dish_name":"","add_calories":[],"remove_calories":[],"add_health":[],"remove_health":[]}'
+)
+
+# Nom du plat seul, quand les listes de suggestions sont calculées localement (local_suggestions)
+_DISH_NAME_V1 = (
+    "Ingredients: $ingredients\n"
+    'Name the most likely dish. JSON only: {"dish_name":""}'
+)
+
+_ANALYSIS_V1 = """Analyse cette image de repas et retourne uniquement du JSON au format suivant :
+            {
+                "ingredients": [{"nom": "ingredient", "quantite": nombre_grammes}],
+                "valeurs_nutritionnelles": {
+                    "calories": nombre,
+                    "proteines": nombre_g,
+                    "glucides": nombre_g,
+                    "lipides": nombre_g,
+                    "fibres": nombre_g
+                },
+                "analyse": {
+                    "points_forts": ["point1", "point2"],
+                    "points_faibles": ["point1", "point2"],
+                    "description": "explication détaillée"
+                },
+                "suggestions": {
+                    "ajouts": [{"ingredient": "nom", "raison": "explication"}],
+                    "remplacements": [{"remplacer": "ingredient", "par": "alternative", "raison": "explication"}]
+                },
+                "repas_soir": [
+                    {"nom": "nom du plat", "description": "description", "raison": "complémentarité avec le repas de midi"}
+                ]
+            }"""
+
+_ANALYSIS_COMPACT = (
+    "Analyse ce repas. Uniquement du JSON, max 3 éléments par liste, phrases courtes :\n"
+    '{"ingredients":[{"nom":"","quantite":g}],'
+    '"valeurs_nutritionnelles":{"calories":kcal,"proteines":g,"glucides":g,"lipides":g,"fibres":g},'
+    '"analyse":{"points_forts":[],"points_faibles":[],"description":""},'
+    '"suggestions":{"ajouts":[{"ingredient":"","raison":""}],'
+    '"remplacements":[{"remplacer":"","par":"","raison":""}]},'
+    '"repas_soir":[{"nom":"","description":"","raison":""}]}'
+)
+
+PROMPTS: Dict[str, Dict[str, PromptSpec]] = {
+    "suggestions": {
+        "v1": PromptSpec("suggestions", "v1", _SUGGESTIONS_V1, max_tokens=None, temperature=0.7),
+        "v2-compact": PromptSpec("suggestions", "v2-compact", _SUGGESTIONS_COMPACT, max_tokens=300, temperature=0.2),
+    },
+    "dish_name": {
+        "v1": PromptSpec("dish_name", "v1", _DISH_NAME_V1, max_tokens=30, temperature=0.0),
+    },
+    "meal_analysis": {
+        "v1": PromptSpec("meal_analysis", "v1", _ANALYSIS_V1, max_tokens=1000, temperature=None),
+        "v2-compact": PromptSpec("meal_analysis", "v2-compact", _ANALYSIS_COMPACT, max_tokens=700, temperature=0.0),
+    },
+}
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptSpec:
+    """Renvoie la version demandée du prompt (par défaut LIMEAT_PROMPT_VERSION)"""
+    versions = PROMPTS[name]
+    if version:
+        return versions[version]
+    return versions.get(PROMPT_VERSION, versions["v1"])
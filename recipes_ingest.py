@@ -0,0 +1,132 @@
+"""
+Limeat - Conversion de recipesDataset en Parquet, par morceaux
+
+Le notebook lit recipesDataset avec un convertisseur Python appelé sur chaque
+ligne (strip, replace, split) et garde tout le fichier en mémoire. Ici le CSV
+est lu par blocs (pyarrow.csv, mémoire bornée par BLOCK_SIZE), la colonne
+ingredient_names est découpée par les fonctions de chaînes d'Arrow, et chaque
+nom distinct n'est normalisé qu'une fois. Chaque bloc devient un row group
+Parquet avec deux colonnes de listes :
+
+    ingredient_names   noms tels qu'écrits dans la recette
+    ingredient_tokens  noms normalisés (cooccurrence.normalize_ingredient), sans vides
+
+Les lecteurs (cooccurrence, dish_lsh, index_build) ne lisent que les colonnes
+dont ils ont besoin, en mmap, quand on leur passe le .parquet au lieu du CSV.
+
+Usage :
+    python recipes_ingest.py datathon_Schoolab-main/data/recipesDataset
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from allergens import ARTIFACTS_DIR
+from cooccurrence import TOKENS_VERSION, normalize_ingredient
+from dish_lsh import NAME_COLUMN
+from index_build import RECIPES_PATH
+
+RECIPES_PARQUET_PATH = ARTIFACTS_DIR / "recipes.parquet"
+# Octets de CSV lus par bloc (un row group Parquet par bloc)
+BLOCK_SIZE = 16 << 20
+
+
+def split_ingredient_names(column: pa.Array) -> pa.ListArray:
+    """"['a', 'b']" -> ["a", "b"], sur toute une colonne Arrow à la fois"""
+    column = pc.replace_substring(pc.utf8_trim(column, characters="[]"), pattern="'", replacement="")
+    return pc.split_pattern(column, pattern=", ")
+
+
+class TokenNormalizer:
+    """Normalisation des noms d'ingrédients, mémorisée : un appel à normalize_ingredient par nom distinct"""
+
+    def __init__(self):
+        self.tokens: Dict[str, str] = {}
+
+    def __call__(self, names: pa.ListArray) -> pa.ListArray:
+        """Listes de noms normalisés, mêmes lignes que `names`, noms vides retirés"""
+        flat = pc.list_flatten(names)
+        distinct = pc.unique(flat)
+        for name in distinct.to_pylist():
+            if name not in self.tokens:
+                self.tokens[name] = normalize_ingredient(name)
+        normalized = pa.array([self.tokens[name] for name in distinct.to_pylist()], type=pa.string())
+        tokens = pc.take(normalized, pc.index_in(flat, value_set=distinct))
+        keep = pc.not_equal(tokens, "").to_numpy(zero_copy_only=False)
+        parents = pc.list_parent_indices(names).to_numpy()
+        counts = np.bincount(parents[keep], minlength=len(names))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+        return pa.ListArray.from_arrays(pa.array(offsets), pc.filter(tokens, pa.array(keep)),
+                                        mask=pc.is_null(names))
+
+
+def convert(csv_path: Path = RECIPES_PATH, out_path: Path = RECIPES_PARQUET_PATH,
+            name_column: Optional[str] = NAME_COLUMN, block_size: int = BLOCK_SIZE) -> Dict[str, float]:
+    """Écrit `out_path` bloc par bloc ; renvoie le nombre de recettes, de noms distincts et la durée"""
+    start = time.perf_counter()
+    header = pa_csv.open_csv(csv_path, read_options=pa_csv.ReadOptions(block_size=1 << 16)).schema.names
+    columns = ["ingredient_names"] + ([name_column] if name_column and name_column in header else [])
+    reader = pa_csv.open_csv(
+        csv_path, read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(include_columns=columns,
+                                              column_types={column: pa.string() for column in columns}))
+    normalize = TokenNormalizer()
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp.parquet")
+    writer, recipes = None, 0
+    try:
+        for batch in reader:
+            names = split_ingredient_names(batch.column("ingredient_names"))
+            arrays = {"ingredient_names": names, "ingredient_tokens": normalize(names)}
+            if len(columns) > 1:
+                arrays[name_column] = batch.column(name_column)
+            table = pa.table(arrays)
+            if writer is None:
+                schema = table.schema.with_metadata({"source": str(csv_path), "tokens_version": str(TOKENS_VERSION)})
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(table.replace_schema_metadata(schema.metadata))
+            recipes += len(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        tmp_path.replace(out_path)
+    return {"recipes": recipes, "distinct_names": len(normalize.tokens), "seconds": time.perf_counter() - start}
+
+
+def read_recipes(path: Path = RECIPES_PARQUET_PATH, columns: Sequence[str] = ("ingredient_tokens",)) -> pa.Table:
+    """Colonnes demandées de la table Parquet, en mmap"""
+    return pq.read_table(path, columns=list(columns), memory_map=True)
+
+
+def iter_recipe_frames(path: Path = RECIPES_PARQUET_PATH, columns: Sequence[str] = ("ingredient_tokens",),
+                       batch_size: int = 50_000) -> Iterator[pd.DataFrame]:
+    """Morceaux de `batch_size` recettes des colonnes demandées (listes en tableaux numpy)"""
+    recipes = pq.ParquetFile(path, memory_map=True)
+    for batch in recipes.iter_batches(batch_size=batch_size, columns=list(columns)):
+        yield batch.to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", nargs="?", default=str(RECIPES_PATH))
+    parser.add_argument("--out", default=str(RECIPES_PARQUET_PATH))
+    parser.add_argument("--name-column", default=NAME_COLUMN)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+    stats = convert(Path(args.csv), Path(args.out), args.name_column, args.block_size)
+    print(f"{stats['recipes']} recettes, {stats['distinct_names']} noms distincts "
+          f"en {stats['seconds']:.1f} s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Limeat - Scores nutritionnels d'un repas et d'une journée
+
+Version importable des méthodes de calcul de datathon.ipynb (sous-scores
+énergie et macro-nutriments, score général), basée sur nutrition.NutrientTable.
+"""
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from meal import MAX_VEGETABLES_PROPORTION, Meal, as_meal
+from nutrition import Ingredient, get_nutrient_table, sigmoid_piecewise
+from tracing import traced
+
+
+def daily_calory_needs(userProfile: dict) -> float:
+    """Besoins caloriques journaliers estimés avec la formule de Black & al"""
+    return 1.083 * (userProfile["weight"] ** 0.48) * ((userProfile["size"]/100) ** 0.50) * (userProfile["age"] ** (-0.13)) * (1000 / 4.1855) * userProfile["activityLevel"]
+
+
+# Calcul du sous-score énergétique,
+def compute_meal_energy_sub_score(summed_nutrients_info: dict, userProfile: dict):
+    """
+    Cette fonction calcule le score de l'énergie pour un repas, en fonction des besoins caloriques journaliers de l'utilisateur.\n
+    *Inputs*:
+        - summed_nutrients_info (Series): pandas Series contenant la somme des valeurs nutritionnelles du repas.
+        - userProfile (dict): Profil de l'utilisateur contenant les clés "age", "weight", "size" et "activityLevel".
+    *Outputs*:
+        - energy_sub_score (float): score de l'énergie pour le repas (0 à 1).
+    """
+
+    meal_energy_in_kcal = summed_nutrients_info['208']
+
+    meal_calory_needs = daily_calory_needs(userProfile) / 3
+
+    # Calcul de l'écart maximal (en fonction de x % de la valeur idéale)
+    ecart_max = meal_calory_needs
+    ecart_plage_max = meal_calory_needs * 0.2  # Plage avec score maximal
+
+    # Calcul de l'écart absolu entre la valeur et la valeur idéale
+    ecart = abs(meal_energy_in_kcal - meal_calory_needs)
+
+    # Si l'écart dépasse la tolérance (tolerance_factor), le score est 0
+    if ecart >= ecart_max:
+        energy_sub_score = 0
+    elif ecart <= ecart_plage_max:
+        energy_sub_score = 1
+    else:
+        energy_sub_score = 1 - ((ecart - ecart_plage_max) / (ecart_max - ecart_plage_max))
+
+    return energy_sub_score
+
+
+def _vegetables_proportion(current_meal: list[Ingredient] | Meal) -> float:
+    """Proportion de légumes (groupe 1) dans le repas, limitée à 50%"""
+    if isinstance(current_meal, Meal):
+        return current_meal.vegetables_proportion()
+    sum_g = sum(ingredient.gQuantity for ingredient in current_meal)
+    sum_vegetables_g = sum(ingredient.gQuantity for ingredient in current_meal if ingredient.groupId == 1)
+    return min(sum_vegetables_g / sum_g, 0.5)
+
+
+# Calcul du sous-score macro nutritionnel
+def compute_meal_macro_sub_score(current_meal: list[Ingredient], summed_nutrients_info: dict):
+    """
+    Calcule le score macro nutritionnel pour un repas donné en fonction des informations nutritionnelles résumées.
+    Le score est basé sur les proportions de légumes, protéines, glucides et lipides dans le repas, par rapport aux proportions optimales.\n
+
+    Args:
+        current_meal (list[Ingredient]): Liste des ingrédients du repas.
+        summed_nutrients_info (pd.Series): Informations nutritionnelles résumées pour le repas.
+
+    Returns:
+        float: Le score macro nutritionnel calculé.
+    """
+
+    proportionVEGETABLES = _vegetables_proportion(current_meal)
+
+    # Estimation de l'énergie à partir des macronutriments
+    estimated_energy_from_macronutrients = (
+        summed_nutrients_info['203'] * 4 +  # Protéines
+        summed_nutrients_info['205'] * 4 +  # Glucides
+        summed_nutrients_info['204'] * 9    # Lipides
+    )
+
+    # Calculer les proportions des macronutriments par rapport à l'énergie estimée
+    proportionPROT = summed_nutrients_info['203'] * 4 / estimated_energy_from_macronutrients
+    proportionGLU = summed_nutrients_info['205'] * 4 / estimated_energy_from_macronutrients
+    proportionLIP = summed_nutrients_info['204'] * 9 / estimated_energy_from_macronutrients
+
+    # Proportions idéales des macronutriments
+    proportion_idealVEGETABLES = 0.5
+    proportion_idealePROT = 0.2
+    proportion_idealeGLU = 0.45
+    proportion_idealeLIP = 0.35
+
+    # Calcul de la distance relative par rapport aux proportions idéales
+    ecartVEGETABLES = abs(proportionVEGETABLES - proportion_idealVEGETABLES) / proportion_idealVEGETABLES
+    ecartPROT = abs(proportionPROT - proportion_idealePROT) / proportion_idealePROT
+    ecartGLU = abs(proportionGLU - proportion_idealeGLU) / proportion_idealeGLU
+    ecartLIP = abs(proportionLIP - proportion_idealeLIP) / proportion_idealeLIP
+
+    # Inverser les écarts pour obtenir un score où 0 est l'écart maximal et 1 est l'idéal parfait
+    scoreVEGETABLES = max(0, 1 - ecartVEGETABLES)  # Score limité à 0 au minimum
+    scorePROT = max(0, 1 - ecartPROT)  # Score limité à 0 au minimum
+    scoreGLU = max(0, 1 - ecartGLU)  # Score limité à 0 au minimum
+    scoreLIP = max(0, 1 - ecartLIP)  # Score limité à 0 au minimum
+
+    # Moyenne des scores pour obtenir un score global
+    score_macro = (scoreVEGETABLES + scorePROT + scoreGLU + scoreLIP) / 4
+
+    return score_macro
+
+
+# Calcul du sous-score énergétique,
+def compute_daily_energy_sub_score(summed_nutrients_info: dict, userProfile: dict):
+    """
+    Cette fonction calcule le score de l'énergie pour 2 repas, en fonction des besoins caloriques journaliers de l'utilisateur.\n
+    *Inputs*:
+        - summed_nutrients_info (Series): pandas Series contenant la somme des valeurs nutritionnelles du repas.
+        - userProfile (dict): Profil de l'utilisateur contenant les clés "age", "weight", "size" et "activityLevel".
+    *Outputs*:
+        - energy_sub_score (float): score de l'énergie pour le repas (0 à 1).
+    """
+
+    meal_energy_in_kcal = summed_nutrients_info['208']
+
+    # On considère que les repas du soir et midi doivent représenter 80% des besoins journaliers
+    daily_needs = daily_calory_needs(userProfile) * 0.8
+
+    # Calcul de l'écart maximal (en fonction de x % de la valeur idéale)
+    ecart_max = (daily_needs / 2)
+    ecart_plage_max = daily_needs * 0.2  # Plage avec score maximal
+
+    # Calcul de l'écart absolu entre la valeur et la valeur idéale
+    ecart = abs(meal_energy_in_kcal - daily_needs)
+
+    # Si l'écart dépasse la tolérance (tolerance_factor), le score est 0
+    if ecart >= ecart_max:
+        energy_sub_score = 0
+    elif ecart <= ecart_plage_max:
+        energy_sub_score = 1
+    else:
+        energy_sub_score = 1 - ((ecart - ecart_plage_max) / (ecart_max - ecart_plage_max))
+
+    return energy_sub_score
+
+
+# Calcul du sous-score macro nutritionnel
+def compute_daily_macro_sub_score(current_meal: list[Ingredient], summed_nutrients_info: dict, userProfile: dict,
+                                  vegetables_proportion: float | None = None):
+    """
+    Calcule le score macro nutritionnel pour 2 repas donnés en fonction des informations nutritionnelles résumées.
+    Le score est basé sur les proportions de légumes, et apports en protéines, glucides, lipides et fibres dans les repas, par rapport aux besoins journaliers.\n
+
+    Args:
+        current_meal (list[Ingredient]): Liste des ingrédients du repas.
+        summed_nutrients_info (pd.Series): Informations nutritionnelles résumées pour le repas.
+        userProfile (dict): Profil de l'utilisateur.
+        vegetables_proportion (float, optionnel): Proportion de légumes déjà connue ; current_meal est alors ignoré.
+
+    Returns:
+        float: Le score macro nutritionnel calculé.
+    """
+
+    # On considère que les repas du soir et midi doivent représenter 80% des besoins journaliers
+    daily_needs = daily_calory_needs(userProfile) * 0.8
+
+    # Calculer les recommandations de macronutriments par rapport à l'énergie estimée
+    daily_recommended_proteins_g = 0.15 * daily_needs / 4
+    daily_recommended_lipids_g = 0.38 * daily_needs / 9
+    daily_recommended_glucides_g = 0.47 * daily_needs / 4
+    daily_recommended_fibers_g = 12
+    daily_recommended_vegetables_proportion = 0.4
+
+    if vegetables_proportion is None:
+        proportionVEGETABLES = _vegetables_proportion(current_meal)
+    else:
+        proportionVEGETABLES = vegetables_proportion
+
+    # Calcul de la distance relative par rapport aux proportions idéales
+    ecartVEGETABLES = abs(proportionVEGETABLES - daily_recommended_vegetables_proportion) / daily_recommended_vegetables_proportion
+    ecartFIBERS = abs(summed_nutrients_info['291'] - daily_recommended_fibers_g) / daily_recommended_fibers_g
+    ecartPROT = abs(summed_nutrients_info['203'] - daily_recommended_proteins_g) / daily_recommended_proteins_g
+    ecartGLU = abs(summed_nutrients_info['205'] - daily_recommended_glucides_g) / daily_recommended_glucides_g
+    ecartLIP = abs(summed_nutrients_info['204'] - daily_recommended_lipids_g) / daily_recommended_lipids_g
+
+    # Inverser les écarts pour obtenir un score où 0 est l'écart maximal et 1 est l'idéal parfait
+    scoreVEGETABLES = max(0, 1 - ecartVEGETABLES)  # Score limité à 0 au minimum
+    scorePROT = max(0, 1 - ecartPROT)  # Score limité à 0 au minimum
+    scoreGLU = max(0, 1 - ecartGLU)  # Score limité à 0 au minimum
+    scoreLIP = max(0, 1 - ecartLIP)  # Score limité à 0 au minimum
+    scoreFIBERS = max(0, 1 - ecartFIBERS)  # Score limité à 0 au minimum
+
+    # Moyenne des scores pour obtenir un score global
+    score_macro = (scoreVEGETABLES + scorePROT + scoreGLU + scoreLIP + scoreFIBERS) / 5
+
+    return score_macro
+
+
+def assign_group_ids(current_meal: list[Ingredient], ingredients_DB: pd.DataFrame):
+    """Associer les groupes alimentaires aux ingrédients (nécessaire pour calculer la proportion de légumes)"""
+    table = get_nutrient_table(ingredients_DB)
+    group_ids = table.group_ids[table.rows([ingredient.id for ingredient in current_meal])]
+    for ingredient, group_id in zip(current_meal, group_ids):
+        ingredient.groupId = group_id
+
+
+def compute_meal_score(current_meal: list[Ingredient], ingredients_DB: pd.DataFrame, userProfile: dict):
+    """
+    Calcule le score d'un repas en fonction des informations nutritionnelles résumées et du profil utilisateur.
+
+    Args:
+        current_meal (list[Ingredient] | Meal): Ingrédients du repas (les Ingredient ne sont pas modifiés).
+        ingredients_DB (pd.DataFrame): Base des ingrédients.
+        userProfile (dict): Profil utilisateur.
+
+    Returns:
+        nut_score (float): Score nutritionnel du repas.
+        energy_sub_score (float): Score de l'énergie du repas.
+        macro_sub_score (float): Score macro nutritionnel du repas.
+    """
+    meal = as_meal(current_meal, ingredients_DB)
+
+    # Récupérer les informations nutritionnelles du repas
+    summed_nutrients_info = meal.nutrients_dict()
+
+    # Calculer les sous scores
+    meal_energy_sub_score = compute_meal_energy_sub_score(summed_nutrients_info, userProfile=userProfile)
+    meal_macro_sub_score = compute_meal_macro_sub_score(meal, summed_nutrients_info)
+
+    # Calculer le score final
+    meal_nut_sum = (1/3) * meal_energy_sub_score + (2/3) * meal_macro_sub_score
+    meal_nut_score = sigmoid_piecewise(meal_nut_sum, k1=5, k2=7.5, x0=0.5)
+    meal_nut_score = meal_nut_score.item()
+
+    return meal_nut_score, meal_energy_sub_score, meal_macro_sub_score
+
+
+def compute_daily_score(current_meal: list[Ingredient], second_meal: list[Ingredient], ingredients_DB: pd.DataFrame, userProfile: dict):
+    """
+    Calcule le score d'une journée (repas du midi et du soir) en fonction des informations nutritionnelles résumées et du profil utilisateur.
+
+    Args:
+        current_meal (list[Ingredient] | Meal): Ingrédients du repas.
+        second_meal (list[Ingredient] | Meal): Ingrédients du second repas.
+        ingredients_DB (pd.DataFrame): Base des ingrédients.
+        userProfile (dict): Profil utilisateur.
+
+    Returns:
+        nut_score (float): Score nutritionnel de la journée.
+        energy_sub_score (float): Score de l'énergie de la journée.
+        macro_sub_score (float): Score macro nutritionnel de la journée.
+    """
+    # Pour simplifier, on considère que consommer 2 repas est équivalent à consommer une fois la somme des 2 repas :
+    # on additionne les vecteurs d'apports et les grammes des deux repas, sans les concaténer
+    meals = [as_meal(current_meal, ingredients_DB), as_meal(second_meal, ingredients_DB)]
+    summed_nutrients_info = meals[0].table.to_dict(meals[0].nutrients() + meals[1].nutrients())
+    vegetables_proportion = min(sum(meal.vegetables_grams() for meal in meals) / sum(float(meal.grams.sum()) for meal in meals),
+                                MAX_VEGETABLES_PROPORTION)
+
+    return compute_daily_score_from_totals(summed_nutrients_info, vegetables_proportion, userProfile)
+
+
+def compute_daily_score_from_totals(summed_nutrients_info: dict, vegetables_proportion: float, userProfile: dict):
+    """Score de la journée à partir des apports cumulés et de la proportion de légumes (voir daily_tracker.DayLedger)"""
+    daily_energy_sub_score = compute_daily_energy_sub_score(summed_nutrients_info, userProfile=userProfile)
+    daily_macro_sub_score = compute_daily_macro_sub_score(None, summed_nutrients_info, userProfile, vegetables_proportion)
+
+    daily_nut_sum = (1/3) * daily_energy_sub_score + (2/3) * daily_macro_sub_score
+    daily_nut_score = sigmoid_piecewise(daily_nut_sum, k1=5, k2=7.5, x0=0.5)
+    daily_nut_score = daily_nut_score.item()
+
+    return daily_nut_score, daily_energy_sub_score, daily_macro_sub_score
+
+
+class NutritionalScorer:
+    def __init__(self, ingredients_db: pd.DataFrame, user_profile: Dict):
+        """Initialise le calculateur nutritionnel avec la base d'ingrédients et le profil utilisateur"""
+        self.ingredients_db = ingredients_db
+        self.user_profile = user_profile
+
+        self.nut_dict = {
+            '203': "Protéines", '204': "Lipides", '205': "Glucides", 
+            '208': "Energie", '291': "Fibres", '601': "Cholesterol", 
+            '255': "Eau", '269': "Sucres", '810': "Amidon"
+        }
+
+    @traced()
+    def analyze_meal_nutritional_score(self, ingredients: List[Dict] | Meal) -> Dict:
+        """Analyse le score nutritionnel du repas ({'id', 'quantite'} par ingrédient, ou un Meal)"""
+        meal = ingredients if isinstance(ingredients, Meal) else Meal.from_records(ingredients, self.ingredients_db)
+        nutrients = meal.nutrients_dict()
+        meal_nut_score, meal_energy_sub_score, meal_macro_sub_score = self._compute_meal_score(meal, nutrients)
+
+        return {
+            'nutritional_score': meal_nut_score,
+            'energy_subscore': meal_energy_sub_score,
+            'macro_subscore': meal_macro_sub_score,
+            'nutrient_details': {self.nut_dict.get(k, k): v for k, v in nutrients.items()}
+        }
+
+    def _compute_meal_score(self, current_meal: Meal, summed_nutrients_info: Dict) -> Tuple[float, float, float]:
+        """Calcule le score nutritionnel global d'un repas"""
+        meal_energy_sub_score = compute_daily_energy_sub_score(summed_nutrients_info, self.user_profile)
+        meal_macro_sub_score = compute_daily_macro_sub_score(current_meal, summed_nutrients_info, self.user_profile)
+
+        meal_nut_sum = (1/3) * meal_energy_sub_score + (2/3) * meal_macro_sub_score
+        meal_nut_score = sigmoid_piecewise(meal_nut_sum, k1=5, k2=7.5, x0=0.5).item()
+
+        return meal_nut_score, meal_energy_sub_score, meal_macro_sub_score
@@ -0,0 +1,178 @@
+"""
+Limeat - Scores nutritionnels vectorisés
+
+Mêmes formules que scoring.py (sous-scores énergie et macro-nutriments, score
+général), appliquées à des tableaux : apports de nombreux repas et besoins de
+nombreux utilisateurs sont combinés par diffusion NumPy en un seul appel, les
+if/elif des fonctions scalaires devenant des np.clip. Avec numba installé
+(LIMEAT_NUMBA=1 par défaut), le calcul utilisateurs x repas passe par une
+boucle compilée qui évite les tableaux intermédiaires.
+
+    needs = profile_needs(profiles)                       # (U,)
+    score, energy, macro = score_meal_log(log, profiles)  # (U, M)
+"""
+import os
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from meal import MealLog
+from nutrition import NutrientTable
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+USE_NUMBA = numba is not None and os.getenv("LIMEAT_NUMBA", "1") == "1"
+
+# Nutriments utilisés par les scores, dans l'ordre des colonnes renvoyées par macro_columns
+SCORE_NUTRIENTS = ("208", "203", "205", "204", "291")  # énergie, protéines, glucides, lipides, fibres
+
+# Proportions idéales d'un repas (compute_meal_macro_sub_score)
+MEAL_IDEAL = {"vegetables": 0.5, "proteins": 0.2, "carbs": 0.45, "lipids": 0.35}
+# Repas du midi et du soir : part des besoins journaliers et répartition (compute_daily_macro_sub_score)
+DAILY_SHARE = 0.8
+DAILY_IDEAL = {"proteins": 0.15, "lipids": 0.38, "carbs": 0.47, "fibers_g": 12, "vegetables": 0.4}
+# Sigmoïde du score général
+SIGMOID = {"k1": 5, "k2": 7.5, "x0": 0.5}
+
+Triple = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def calory_needs(weight, size, age, activity_level) -> np.ndarray:
+    """Besoins caloriques journaliers (formule de Black & al), pour des tableaux de profils"""
+    weight, size, age, activity_level = (np.asarray(v, dtype=np.float64) for v in (weight, size, age, activity_level))
+    return 1.083 * weight ** 0.48 * (size / 100) ** 0.50 * age ** (-0.13) * (1000 / 4.1855) * activity_level
+
+
+def profile_needs(profiles: Sequence[Dict]) -> np.ndarray:
+    """Besoins caloriques de chaque profil ({"age", "weight", "size", "activityLevel"})"""
+    return calory_needs(*(np.array([p[key] for p in profiles], dtype=np.float64)
+                          for key in ("weight", "size", "age", "activityLevel")))
+
+
+def macro_columns(table: NutrientTable) -> np.ndarray:
+    """Indices des colonnes SCORE_NUTRIENTS dans les vecteurs d'apports de la table"""
+    columns = {nutrient_id: i for i, nutrient_id in enumerate(table.nutrient_ids)}
+    return np.array([columns[nutrient_id] for nutrient_id in SCORE_NUTRIENTS], dtype=np.intp)
+
+
+def sigmoid_piecewise(x, k1=5, k2=10, x0=0.4) -> np.ndarray:
+    """Sigmoïde à deux pentes (nutrition.sigmoid_piecewise) avec une seule exponentielle par élément"""
+    x = np.asarray(x, dtype=np.float64)
+    return 1 / (1 + np.exp(-np.where(x < x0, k1, k2) * (x - x0)))
+
+
+def band_score(value, ideal, full_width, zero_width) -> np.ndarray:
+    """1 à moins de `full_width` de l'idéal, 0 au-delà de `zero_width`, linéaire entre les deux"""
+    gap = np.abs(value - ideal)
+    return np.clip(1 - (gap - full_width) / (zero_width - full_width), 0, 1)
+
+
+def ratio_score(value, ideal) -> np.ndarray:
+    """1 - écart relatif à l'idéal, limité à 0"""
+    return np.maximum(0, 1 - np.abs(value - ideal) / ideal)
+
+
+def meal_energy_sub_scores(energy, needs) -> np.ndarray:
+    """compute_meal_energy_sub_score : un repas doit apporter un tiers des besoins journaliers"""
+    target = np.asarray(needs, dtype=np.float64) / 3
+    return band_score(np.asarray(energy, dtype=np.float64), target, target * 0.2, target)
+
+
+def meal_macro_sub_scores(proteins, carbs, lipids, vegetables) -> np.ndarray:
+    """compute_meal_macro_sub_score : proportions de légumes et d'énergie de chaque macro-nutriment"""
+    proteins, carbs, lipids = (np.asarray(v, dtype=np.float64) for v in (proteins, carbs, lipids))
+    energy = proteins * 4 + carbs * 4 + lipids * 9
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (ratio_score(np.asarray(vegetables, dtype=np.float64), MEAL_IDEAL["vegetables"])
+                + ratio_score(proteins * 4 / energy, MEAL_IDEAL["proteins"])
+                + ratio_score(carbs * 4 / energy, MEAL_IDEAL["carbs"])
+                + ratio_score(lipids * 9 / energy, MEAL_IDEAL["lipids"])) / 4
+
+
+def daily_energy_sub_scores(energy, needs) -> np.ndarray:
+    """compute_daily_energy_sub_score : les repas du midi et du soir couvrent 80% des besoins"""
+    target = np.asarray(needs, dtype=np.float64) * DAILY_SHARE
+    return band_score(np.asarray(energy, dtype=np.float64), target, target * 0.2, target / 2)
+
+
+def daily_macro_sub_scores(proteins, carbs, lipids, fibers, vegetables, needs) -> np.ndarray:
+    """compute_daily_macro_sub_score : apports comparés aux recommandations journalières"""
+    target = np.asarray(needs, dtype=np.float64) * DAILY_SHARE
+    return (ratio_score(np.asarray(vegetables, dtype=np.float64), DAILY_IDEAL["vegetables"])
+            + ratio_score(np.asarray(fibers, dtype=np.float64), DAILY_IDEAL["fibers_g"])
+            + ratio_score(np.asarray(proteins, dtype=np.float64), DAILY_IDEAL["proteins"] * target / 4)
+            + ratio_score(np.asarray(carbs, dtype=np.float64), DAILY_IDEAL["carbs"] * target / 4)
+            + ratio_score(np.asarray(lipids, dtype=np.float64), DAILY_IDEAL["lipids"] * target / 9)) / 5
+
+
+def _general_score(energy_sub_score, macro_sub_score) -> np.ndarray:
+    return sigmoid_piecewise((1/3) * energy_sub_score + (2/3) * macro_sub_score, **SIGMOID)
+
+
+def meal_scores(totals: np.ndarray, vegetables, needs) -> Triple:
+    """(score, sous-score énergie, sous-score macro) de repas ; `totals` (..., 5) dans l'ordre SCORE_NUTRIENTS.
+
+    Les dimensions de `totals[..., 0]`, `vegetables` et `needs` sont diffusées entre elles.
+    """
+    totals = np.asarray(totals, dtype=np.float64)
+    energy_sub_score = meal_energy_sub_scores(totals[..., 0], needs)
+    macro_sub_score = meal_macro_sub_scores(totals[..., 1], totals[..., 2], totals[..., 3], vegetables)
+    macro_sub_score = np.broadcast_to(macro_sub_score, energy_sub_score.shape)
+    return _general_score(energy_sub_score, macro_sub_score), energy_sub_score, macro_sub_score
+
+
+def daily_scores(totals: np.ndarray, vegetables, needs) -> Triple:
+    """(score, sous-score énergie, sous-score macro) de journées (repas du midi et du soir cumulés)"""
+    totals = np.asarray(totals, dtype=np.float64)
+    energy_sub_score = daily_energy_sub_scores(totals[..., 0], needs)
+    macro_sub_score = daily_macro_sub_scores(totals[..., 1], totals[..., 2], totals[..., 3], totals[..., 4],
+                                             vegetables, needs)
+    return _general_score(energy_sub_score, macro_sub_score), energy_sub_score, macro_sub_score
+
+
+# Tous les utilisateurs contre tous les repas
+def _meal_scores_loop(totals, vegetables, needs, score, energy_out, macro_out):
+    """Boucle utilisateurs x repas, compilée par numba ; mêmes formules et constantes (MEAL_IDEAL,
+    SIGMOID) que meal_scores, écrites en littéraux pour numba"""
+    for m in range(totals.shape[0]):
+        proteins, carbs, lipids = totals[m, 1], totals[m, 2], totals[m, 3]
+        macro_energy = proteins * 4 + carbs * 4 + lipids * 9
+        macro = (max(0.0, 1 - abs(vegetables[m] - 0.5) / 0.5)
+                 + max(0.0, 1 - abs(proteins * 4 / macro_energy - 0.2) / 0.2)
+                 + max(0.0, 1 - abs(carbs * 4 / macro_energy - 0.45) / 0.45)
+                 + max(0.0, 1 - abs(lipids * 9 / macro_energy - 0.35) / 0.35)) / 4
+        for u in range(needs.shape[0]):
+            target = needs[u] / 3
+            full_width = target * 0.2
+            gap = abs(totals[m, 0] - target)
+            energy = min(1.0, max(0.0, 1 - (gap - full_width) / (target - full_width)))
+            x = energy / 3 + 2 * macro / 3
+            slope = 5.0 if x < 0.5 else 7.5
+            score[u, m] = 1 / (1 + np.exp(-slope * (x - 0.5)))
+            energy_out[u, m] = energy
+            macro_out[u, m] = macro
+
+
+_meal_scores_jit = numba.njit(cache=True, error_model="numpy")(_meal_scores_loop) if USE_NUMBA else None
+
+
+def population_meal_scores(totals: np.ndarray, vegetables, needs) -> Triple:
+    """Scores de chaque repas (M, 5) pour chaque utilisateur (U,) : trois tableaux (U, M)"""
+    totals = np.ascontiguousarray(totals, dtype=np.float64)
+    vegetables = np.ascontiguousarray(vegetables, dtype=np.float64)
+    needs = np.ascontiguousarray(needs, dtype=np.float64)
+    if _meal_scores_jit is None:
+        return meal_scores(totals[None, :, :], vegetables[None, :], needs[:, None])
+    shape = (len(needs), len(totals))
+    score, energy, macro = np.empty(shape), np.empty(shape), np.empty(shape)
+    _meal_scores_jit(totals, vegetables, needs, score, energy, macro)
+    return score, energy, macro
+
+
+def score_meal_log(log: MealLog, profiles: Sequence[Dict]) -> Triple:
+    """Scores de chaque repas du journal pour chaque profil : trois tableaux (profils, repas)"""
+    totals = log.nutrients()[:, macro_columns(log.table)]
+    return population_meal_scores(totals, log.vegetables_proportions(), profile_needs(profiles))
@@ -0,0 +1,113 @@
+"""
+Limeat - Coalescence des requêtes identiques en cours (single-flight)
+
+Quand plusieurs threads du même processus lancent la même analyse au même
+moment, un seul appel au modèle est effectué et les autres attendent son résultat.
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict
+
+
+def normalize_ingredients(ingredients) -> list:
+    """Normalise une liste d'ingrédients (casse, espaces, ordre) pour le calcul de clé"""
+    return sorted({str(ing).strip().lower() for ing in ingredients if str(ing).strip()})
+
+
+def make_key(*parts) -> str:
+    """Hash SHA-256 stable des entrées d'une requête (bytes, str ou objets JSON)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        # Préfixe de longueur pour éviter les collisions par concaténation
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Déduplique les appels concurrents partageant la même clé.
+
+    Le résultat est partagé entre tous les appelants : il doit être traité
+    comme immuable (renvoyer de préférence du texte brut ou une copie).
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Exécute fn une seule fois par clé en vol ; les appels concurrents attendent le même résultat"""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # La clé est retirée dès la fin de l'appel : les requêtes suivantes repartent au modèle
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """Groupe single-flight partagé par nom, au niveau du processus.
+
+    Les scripts Streamlit sont ré-exécutés à chaque interaction : l'état partagé
+    doit vivre dans un module importé, pas dans le script lui-même.
+    """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight()
+        return _groups[name]
@@ -0,0 +1,213 @@
+"""
+Limeat - Stockage persistant (SQLite) des profils utilisateurs et des repas analysés
+
+Les repas sont indexés par (utilisateur, jour) pour les requêtes par période
+("apports des 7 derniers jours") et par empreinte de la photo pour réutiliser
+une analyse sans rappeler le modèle de vision. Les écritures de repas sont
+regroupées et validées par lots, dans une seule transaction.
+"""
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+DB_PATH = os.getenv("LIMEAT_DB", "var/limeat.sqlite3")
+# Repas en attente avant écriture, et délai maximal avant validation du lot
+BATCH_SIZE = int(os.getenv("LIMEAT_DB_BATCH_SIZE", 32))
+FLUSH_INTERVAL_S = float(os.getenv("LIMEAT_DB_FLUSH_INTERVAL", 2.0))
+
+MACROS = ("calories", "proteines", "glucides", "lipides", "fibres")
+
+DEFAULT_PROFILE = {"age": 35, "weight": 70, "size": 170, "activityLevel": 1.4, "allergies": [], "breakfast": None}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY,
+    age INTEGER,
+    weight REAL,
+    size REAL,
+    activity_level REAL,
+    allergies TEXT NOT NULL DEFAULT '[]',
+    breakfast TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meals (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    eaten_at TEXT NOT NULL,
+    calories REAL, proteines REAL, glucides REAL, lipides REAL, fibres REAL,
+    score REAL,
+    image_sha256 TEXT,
+    ingredients TEXT,
+    analysis TEXT,
+    -- Index (user_id, day, slot) : sert aussi aux requêtes par utilisateur et période
+    UNIQUE (user_id, day, slot)
+);
+CREATE INDEX IF NOT EXISTS meals_user_image ON meals (user_id, image_sha256);
+"""
+
+_UPSERT_MEAL = f"""
+INSERT INTO meals (user_id, day, slot, eaten_at, {", ".join(MACROS)}, score, image_sha256, ingredients, analysis)
+VALUES (?, ?, ?, ?, {", ".join("?" for _ in MACROS)}, ?, ?, ?, ?)
+ON CONFLICT (user_id, day, slot) DO UPDATE SET
+    eaten_at = excluded.eaten_at, {", ".join(f"{m} = excluded.{m}" for m in MACROS)},
+    score = excluded.score, image_sha256 = excluded.image_sha256,
+    ingredients = excluded.ingredients, analysis = excluded.analysis
+"""
+
+
+def image_sha256(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+
+class LimeatStore:
+    """Profils et historique des repas ; une connexion partagée par les sessions, protégée par un verrou"""
+
+    def __init__(self, path: str = DB_PATH, batch_size: int = BATCH_SIZE, flush_interval_s: float = FLUSH_INTERVAL_S):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._pending: List[tuple] = []
+        self._oldest_pending = 0.0
+
+    # Profils
+    def save_profile(self, user_id: str, profile: Dict):
+        profile = dict(DEFAULT_PROFILE, **profile)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO profiles (user_id, age, weight, size, activity_level, allergies, breakfast, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET age = excluded.age, weight = excluded.weight, "
+                "size = excluded.size, activity_level = excluded.activity_level, allergies = excluded.allergies, "
+                "breakfast = excluded.breakfast, updated_at = excluded.updated_at",
+                (user_id, profile["age"], profile["weight"], profile["size"], profile["activityLevel"],
+                 json.dumps(list(profile["allergies"])), profile["breakfast"], datetime.now().isoformat()))
+
+    def get_profile(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return {"age": row["age"], "weight": row["weight"], "size": row["size"],
+                "activityLevel": row["activity_level"], "allergies": json.loads(row["allergies"]),
+                "breakfast": row["breakfast"]}
+
+    # Repas (écritures par lots)
+    def add_meal(self, user_id: str, slot: str, values: Dict, day: Optional[date] = None,
+                 score: Optional[float] = None, image_hash: Optional[str] = None,
+                 ingredients: Optional[List[Dict]] = None, analysis: Optional[Dict] = None):
+        """Ajoute (ou remplace) le repas `slot` du jour ; validé avec le lot suivant"""
+        eaten_at = datetime.now()
+        day = day or eaten_at.date()
+        row = (user_id, day.isoformat(), slot, eaten_at.isoformat(),
+               *(_number(values.get(m)) for m in MACROS), score, image_hash,
+               json.dumps(ingredients) if ingredients is not None else None,
+               json.dumps(analysis, ensure_ascii=False, default=str) if analysis is not None else None)
+        with self._lock:
+            if not self._pending:
+                self._oldest_pending = time.monotonic()
+            self._pending.append(row)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._oldest_pending >= self.flush_interval_s):
+                self.flush()
+
+    def flush(self):
+        """Écrit les repas en attente dans une seule transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._conn:
+                self._conn.executemany(_UPSERT_MEAL, self._pending)
+            self._pending.clear()
+
+    # Requêtes (les repas en attente sont écrits d'abord)
+    def meals_between(self, user_id: str, start: date, end: date) -> List[Dict]:
+        """Repas de `start` à `end` inclus, dans l'ordre chronologique"""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                "SELECT * FROM meals WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day, eaten_at",
+                (user_id, start.isoformat(), end.isoformat())).fetchall()
+        return [_meal_row(row) for row in rows]
+
+    def recent_meals(self, user_id: str, days: int = 7, today: Optional[date] = None) -> List[Dict]:
+        """Repas des `days` derniers jours, aujourd'hui compris"""
+        today = today or date.today()
+        return self.meals_between(user_id, today - timedelta(days=days - 1), today)
+
+    def daily_intake(self, user_id: str, start: date, end: date) -> List[Dict]:
+        """Apports totaux par jour, de `start` à `end` inclus"""
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute(
+                f"SELECT day, COUNT(*) AS meals, {', '.join(f'SUM({m}) AS {m}' for m in MACROS)} "
+                "FROM meals WHERE user_id = ? AND day BETWEEN ? AND ? GROUP BY day ORDER BY day",
+                (user_id, start.isoformat(), end.isoformat())).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_analysis(self, user_id: str, image_hash: str) -> Optional[Dict]:
+        """Dernière analyse enregistrée pour cette photo, ou None"""
+        with self._lock:
+            self.flush()
+            row = self._conn.execute(
+                "SELECT analysis FROM meals WHERE user_id = ? AND image_sha256 = ? AND analysis IS NOT NULL "
+                "ORDER BY eaten_at DESC LIMIT 1", (user_id, image_hash)).fetchone()
+        return json.loads(row["analysis"]) if row else None
+
+    def fill_tracker(self, tracker, user_id: str, start: date, end: date):
+        """Recharge dans un daily_tracker.IntakeTracker les repas de la période"""
+        from meal import Meal
+
+        for meal in self.meals_between(user_id, start, end):
+            ledger = tracker.day(date.fromisoformat(meal["day"]))
+            if meal["ingredients"]:
+                try:
+                    ledger.set_meal(meal["slot"], Meal.from_records(meal["ingredients"], tracker.table))
+                    continue
+                except KeyError:  # ingrédient absent de la base actuelle
+                    pass
+            ledger.set_nutrients(meal["slot"], {m: meal[m] for m in MACROS})
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _meal_row(row: sqlite3.Row) -> Dict:
+    meal = dict(row)
+    meal["ingredients"] = json.loads(meal["ingredients"]) if meal["ingredients"] else None
+    meal["analysis"] = json.loads(meal["analysis"]) if meal["analysis"] else None
+    return meal
+
+
+@lru_cache(maxsize=None)
+def get_store(path: str = DB_PATH) -> LimeatStore:
+    """Store partagé du processus ; les repas en attente sont écrits à l'arrêt"""
+    store = LimeatStore(path)
+    atexit.register(store.flush)
+    return store
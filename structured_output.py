@@ -0,0 +1,339 @@
+"""
+Limeat - Sorties structurées des modèles : schémas JSON, validation,
+réparation locale du JSON presque valide et suivi du taux d'échec de parsing
+"""
+import ast
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# "tool" : réponse contrainte par un outil au schéma JSON ; "text" : JSON libre réparé localement
+STRUCTURED_OUTPUT_MODE = os.getenv("LIMEAT_STRUCTURED_OUTPUT", "tool")
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}, "default": []}
+
+SUGGESTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "dish_name": {"type": "string"},
+        "add_calories": _STRING_LIST,
+        "remove_calories": _STRING_LIST,
+        "add_health": _STRING_LIST,
+        "remove_health": _STRING_LIST,
+    },
+    "required": ["dish_name"],
+}
+
+DISH_NAME_SCHEMA = {
+    "type": "object",
+    "properties": {"dish_name": {"type": "string"}},
+    "required": ["dish_name"],
+}
+
+MEAL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ingredients": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"nom": {"type": "string"}, "quantite": {"type": "number"}},
+                "required": ["nom", "quantite"],
+            },
+        },
+        "valeurs_nutritionnelles": {
+            "type": "object",
+            "properties": {
+                "calories": {"type": "number", "default": 0},
+                "proteines": {"type": "number", "default": 0},
+                "glucides": {"type": "number", "default": 0},
+                "lipides": {"type": "number", "default": 0},
+                "fibres": {"type": "number", "default": 0},
+            },
+            "required": ["calories"],
+        },
+        "analyse": {
+            "type": "object",
+            "properties": {
+                "points_forts": _STRING_LIST,
+                "points_faibles": _STRING_LIST,
+                "description": {"type": "string", "default": ""},
+            },
+            "default": {},
+        },
+        "suggestions": {
+            "type": "object",
+            "properties": {
+                "ajouts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"ingredient": {"type": "string"}, "raison": {"type": "string", "default": ""}},
+                        "required": ["ingredient"],
+                    },
+                    "default": [],
+                },
+                "remplacements": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "remplacer": {"type": "string"},
+                            "par": {"type": "string"},
+                            "raison": {"type": "string", "default": ""},
+                        },
+                        "required": ["remplacer", "par"],
+                    },
+                    "default": [],
+                },
+            },
+            "default": {},
+        },
+        "repas_soir": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "nom": {"type": "string"},
+                    "description": {"type": "string", "default": ""},
+                    "raison": {"type": "string", "default": ""},
+                },
+                "required": ["nom"],
+            },
+            "default": [],
+        },
+    },
+    "required": ["ingredients", "valeurs_nutritionnelles"],
+}
+
+
+class StructuredOutputError(ValueError):
+    """Réponse du modèle impossible à parser ou non conforme au schéma"""
+
+    def __init__(self, message: str, errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+# Schémas au format attendu par les API d'outils
+
+def _strip_defaults(schema):
+    """Retire les clés "default" (usage local) avant envoi au fournisseur"""
+    if isinstance(schema, dict):
+        return {k: _strip_defaults(v) for k, v in schema.items() if k != "default"}
+    return schema
+
+
+def anthropic_tool(name: str, schema: Dict, description: str = "") -> Dict:
+    """Paramètres tools/tool_choice forçant Claude à répondre selon le schéma"""
+    return {
+        "tools": [{"name": name, "description": description or name, "input_schema": _strip_defaults(schema)}],
+        "tool_choice": {"type": "tool", "name": name},
+    }
+
+
+def openai_tool(name: str, schema: Dict, description: str = "") -> Dict:
+    """Paramètres tools/tool_choice forçant un appel de fonction selon le schéma"""
+    return {
+        "tools": [{"type": "function",
+                   "function": {"name": name, "description": description or name,
+                                "parameters": _strip_defaults(schema)}}],
+        "tool_choice": {"type": "function", "function": {"name": name}},
+    }
+
+
+# Réparation locale
+
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.I)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+# Lettres Unicode (str.isalpha), pas seulement ASCII : "é" nu hors chaîne doit former un mot
+_WORD_RE = re.compile(r"[^\W\d_]+")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PYTHON_LITERALS = {json_word: word for word, json_word in _LITERALS.items()}
+
+
+def _normalize_tokens(text: str, literals: Dict[str, str] = _LITERALS, quotes: str = '"') -> str:
+    """Remplace les littéraux (`literals`) hors des chaînes délimitées par `quotes`
+    et ferme les structures tronquées"""
+    out = []
+    stack = []
+    quote = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if quote:
+            out.append(c)
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == quote:
+                quote = None
+            i += 1
+            continue
+        if c in quotes:
+            quote = c
+        elif c in "{[":
+            stack.append("}" if c == "{" else "]")
+        elif c in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                out.append(c)
+                return "".join(out)
+        elif c.isalpha():
+            word = _WORD_RE.match(text, i).group(0)
+            out.append(literals.get(word, word))
+            i += len(word)
+            continue
+        out.append(c)
+        i += 1
+
+    # Réponse tronquée (max_tokens atteint) : on referme chaîne et structures ouvertes
+    if quote:
+        out.append(quote)
+    repaired = "".join(out).rstrip()
+    if stack and stack[-1] == "}":
+        # Clé sans valeur en fin de texte : {"a": 1, "b"  ou  {"a": 1, "b":
+        repaired = re.sub(r'([{,])\s*"[^"]*"\s*:?\s*$', r"\1", repaired)
+    repaired = re.sub(r"[,:]\s*$", "", repaired)
+    return repaired + "".join(reversed(stack))
+
+
+def _strip_wrapping(text: str) -> str:
+    """Retire fences et texte avant le premier objet, normalise les guillemets typographiques"""
+    text = _FENCE_RE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        raise StructuredOutputError("No JSON object found in response")
+    return text[start:].replace("“", '"').replace("”", '"')
+
+
+def repair_json(text: str) -> str:
+    """Réparation peu coûteuse d'un JSON presque valide (fences, texte parasite,
+    virgules finales, guillemets typographiques, littéraux Python, troncature)"""
+    text = _normalize_tokens(_strip_wrapping(text))
+    return _TRAILING_COMMA_RE.sub(r"\1", text)
+
+
+def loads_lenient(text: str):
+    """json.loads, puis réparation locale, puis littéral Python en dernier recours"""
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+    repaired = repair_json(text)
+    try:
+        return json.loads(repaired), True
+    except json.JSONDecodeError as e:
+        try:
+            # Dict Python (guillemets simples) : seuls les mots nus deviennent True/False/None
+            return ast.literal_eval(_normalize_tokens(_strip_wrapping(text), _PYTHON_LITERALS, "\"'")), True
+        except (ValueError, SyntaxError):
+            raise StructuredOutputError(f"Unrepairable JSON: {e}") from e
+
+
+# Validation
+
+_TYPES = {
+    "object": dict, "array": list, "string": str,
+    "number": (int, float), "integer": int, "boolean": bool,
+}
+
+
+def _coerce(value, expected: str):
+    """Conversions sûres des écarts fréquents (ex. "150 g" pour un nombre)"""
+    if expected in ("number", "integer") and isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        if match:
+            number = float(match.group(0).replace(",", "."))
+            return int(number) if expected == "integer" else number
+    if expected == "string" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if expected == "array" and isinstance(value, (str, dict)):
+        return [value]
+    return value
+
+
+def validate(data, schema: Dict, path: str = "$") -> List[str]:
+    """Valide (et corrige en place : valeurs par défaut, coercitions) selon un sous-ensemble de JSON Schema.
+
+    Returns:
+        errors (list): Liste des écarts restants ; vide si la donnée est conforme
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected and not (isinstance(data, _TYPES[expected]) and not (
+            expected in ("number", "integer") and isinstance(data, bool))):
+        return [f"{path}: expected {expected}, got {type(data).__name__}"]
+
+    if expected == "object":
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key not in data and "default" in sub_schema:
+                data[key] = json.loads(json.dumps(sub_schema["default"]))
+            if key in data:
+                data[key] = _coerce(data[key], sub_schema.get("type"))
+                errors += validate(data[key], sub_schema, f"{path}.{key}")
+        errors += [f"{path}: missing '{key}'" for key in schema.get("required", []) if key not in data]
+    elif expected == "array" and "items" in schema:
+        for i, item in enumerate(data):
+            data[i] = _coerce(item, schema["items"].get("type"))
+            errors += validate(data[i], schema["items"], f"{path}[{i}]")
+    return errors
+
+
+# Suivi des échecs de parsing
+
+class ParseStats:
+    """Compteurs par schéma : réponses valides directement, réparées, en échec"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, name: str, outcome: str):
+        with self._lock:
+            counts = self._counts.setdefault(name, {"total": 0, "ok": 0, "repaired": 0, "failed": 0})
+            counts["total"] += 1
+            counts[outcome] += 1
+
+    def report(self) -> Dict[str, Dict]:
+        """Compteurs et taux d'échec par schéma"""
+        with self._lock:
+            return {
+                name: dict(counts, failure_rate=counts["failed"] / counts["total"])
+                for name, counts in self._counts.items()
+            }
+
+
+parse_stats = ParseStats()
+
+
+def parse_structured(text: str, schema: Dict, name: str) -> Dict:
+    """Parse et valide une réponse de modèle ; lève StructuredOutputError si irrécupérable"""
+    try:
+        with span("parse_structured", schema=name, chars=len(text)):
+            data, repaired = loads_lenient(text)
+            errors = validate(data, schema)
+    except StructuredOutputError:
+        parse_stats.record(name, "failed")
+        logger.warning("Structured output '%s': unparseable response", name)
+        raise
+
+    if errors:
+        parse_stats.record(name, "failed")
+        logger.warning("Structured output '%s' does not match schema: %s", name, errors)
+        raise StructuredOutputError(f"Response does not match '{name}' schema", errors)
+
+    parse_stats.record(name, "repaired" if repaired else "ok")
+    return data
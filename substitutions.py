@@ -0,0 +1,85 @@
+"""
+Limeat - Substitutions d'ingrédients par proximité nutritionnelle
+
+La table est longue à calculer (une ligne de la base à la fois) : python
+build_pipeline.py l'enregistre en JSON, rechargé par get_substitutions tant que
+ingredients_db.csv et SUBSTITUTIONS_VERSION ne changent pas.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from allergens import ARTIFACTS_DIR
+from nutrition import DATA_DIR, frame_cache, load_ingredients_db
+from tracing import traced
+
+SUBSTITUTIONS_PATH = ARTIFACTS_DIR / "substitutions.json"
+# À incrémenter à chaque modification de load_substitutions : invalide la table enregistrée
+SUBSTITUTIONS_VERSION = 1
+
+
+@traced()
+def load_substitutions(ingredients_db: pd.DataFrame):
+    """Crée un dictionnaire de substitutions basé sur la base de données"""
+    substitutions = {}
+    groups = ingredients_db.groupby('FoodGroupID')
+    
+    for _, row in ingredients_db.iterrows():
+        group_id = row['FoodGroupID']
+        current_food = row['FoodName']
+        
+        alternatives = groups.get_group(group_id)
+        alternatives = alternatives[alternatives['FoodName'] != current_food]
+        alternatives['nutritional_similarity'] = (
+            (alternatives['203'] - row['203']).abs() +  # Protéines
+            (alternatives['204'] - row['204']).abs() +  # Lipides
+            (alternatives['205'] - row['205']).abs()    # Glucides
+        )
+        alternatives = alternatives.sort_values('nutritional_similarity')
+        alternatives = alternatives['FoodName'].head(3).tolist()
+        
+        if alternatives:
+            substitutions[current_food.lower()] = alternatives
+            
+    return substitutions
+
+
+def _artifact_key(csv_path: Path) -> str:
+    digest = hashlib.sha256(csv_path.read_bytes())
+    digest.update(f"substitutions-v{SUBSTITUTIONS_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def save_substitutions(data_dir: Path = DATA_DIR, path: Path = SUBSTITUTIONS_PATH) -> Path:
+    """Calcule la table de la base lue depuis le CSV et l'enregistre (avec les FoodID des lignes)"""
+    ingredients_db = load_ingredients_db(data_dir)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    saved = {"key": _artifact_key(Path(data_dir) / "ingredients_db.csv"),
+             "food_ids": ingredients_db["FoodID"].astype(int).tolist(),
+             "substitutions": load_substitutions(ingredients_db)}
+    path.write_text(json.dumps(saved, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _load_saved(path: Path = SUBSTITUTIONS_PATH, data_dir: Path = DATA_DIR) -> Dict:
+    path = Path(path)
+    if not path.exists():
+        return {}
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    if saved.get("key") != _artifact_key(Path(data_dir) / "ingredients_db.csv"):
+        return {}
+    return saved
+
+
+@frame_cache
+def get_substitutions(ingredients_db: pd.DataFrame) -> Dict[str, List[str]]:
+    """Table d'une base chargée : table enregistrée si elle est à jour, sinon calculée au premier appel"""
+    saved = _load_saved()
+    # Table enregistrée utilisable seulement pour une base lue telle quelle depuis le CSV
+    if saved and saved["food_ids"] == ingredients_db["FoodID"].astype(int).tolist():
+        return saved["substitutions"]
+    return load_substitutions(ingredients_db)
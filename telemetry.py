@@ -0,0 +1,135 @@
+"""
+Limeat - Télémétrie des appels LLM : tokens, time-to-first-token, latence
+et coût estimé par version de prompt, journalisés en JSONL
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+TELEMETRY_LOG = os.getenv("LIMEAT_TELEMETRY_LOG", "logs/llm_calls.jsonl")
+TELEMETRY_ENABLED = os.getenv("LIMEAT_TELEMETRY", "1") == "1"
+# Conserver les photos analysées permet de rejouer aussi les appels de vision
+CAPTURE_IMAGES = os.getenv("LIMEAT_TELEMETRY_CAPTURE_IMAGES", "0") == "1"
+# Les ingrédients saisis ne sont journalisés en clair que sur demande (rejeu) ; sinon empreinte et nombre
+CAPTURE_INPUTS = os.getenv("LIMEAT_TELEMETRY_CAPTURE_INPUTS", "0") == "1"
+IMAGES_DIR = Path(TELEMETRY_LOG).parent / "images"
+
+# Prix publics indicatifs en USD par million de tokens (entrée, sortie)
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "claude-3-opus-20240229": (15.0, 75.0),
+}
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Coût estimé d'un appel en USD (0 pour un modèle inconnu)"""
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1e6
+
+
+class PromptTelemetry:
+    """Journal JSONL des appels, une ligne par appel"""
+
+    def __init__(self, path: str = TELEMETRY_LOG, enabled: bool = TELEMETRY_ENABLED):
+        self.path = Path(path)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def log(self, record: Dict):
+        if not self.enabled:
+            return
+        record = dict(record, cost_usd=estimate_cost(record.get("model", ""),
+                                                     record.get("input_tokens", 0),
+                                                     record.get("output_tokens", 0)))
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def summary(self) -> Dict[str, Dict]:
+        return summarize(load_records(self.path))
+
+
+def capture_image(image_data: bytes) -> str:
+    """Renvoie le SHA-256 de l'image et la conserve pour le rejeu si la capture est activée"""
+    digest = hashlib.sha256(image_data).hexdigest()
+    if CAPTURE_IMAGES:
+        IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+        image_path = IMAGES_DIR / f"{digest}.jpg"
+        if not image_path.exists():
+            image_path.write_bytes(image_data)
+    return digest
+
+
+def capture_ingredients(ingredients: Iterable[str]) -> Dict:
+    """Entrées d'un appel de suggestions pour le journal : la liste en clair si la capture est activée,
+    sinon son SHA-256 et sa taille seulement"""
+    ingredients = list(ingredients)
+    if CAPTURE_INPUTS:
+        return {"ingredients": ingredients}
+    digest = hashlib.sha256(json.dumps(ingredients, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return {"ingredients_sha256": digest, "ingredients_count": len(ingredients)}
+
+
+def load_records(path) -> List[Dict]:
+    """Relit un journal JSONL (lignes invalides ignorées)"""
+    path = Path(path)
+    if not path.exists():
+        return []
+    records = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def summarize(records: Iterable[Dict]) -> Dict[str, Dict]:
+    """Agrège les appels par label de prompt (ex. "suggestions/v2-compact")"""
+    groups: Dict[str, List[Dict]] = {}
+    for record in records:
+        groups.setdefault(record.get("label") or "unlabelled", []).append(record)
+
+    summary = {}
+    for label, group in sorted(groups.items()):
+        ok = [r for r in group if r.get("ok", True)]
+        latencies = [r["latency_s"] for r in ok]
+        ttfts = [r["ttft_s"] for r in ok if r.get("ttft_s") is not None]
+        n = max(len(ok), 1)
+        summary[label] = {
+            "calls": len(group),
+            "errors": len(group) - len(ok),
+            "mean_input_tokens": sum(r.get("input_tokens", 0) for r in ok) / n,
+            "mean_output_tokens": sum(r.get("output_tokens", 0) for r in ok) / n,
+            "latency_p50_s": _percentile(latencies, 0.50),
+            "latency_p95_s": _percentile(latencies, 0.95),
+            "ttft_p50_s": _percentile(ttfts, 0.50),
+            "mean_cost_usd": sum(r.get("cost_usd", 0.0) for r in ok) / n,
+        }
+    return summary
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> PromptTelemetry:
+    """Journal partagé du processus"""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = PromptTelemetry()
+        return _telemetry
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from structured_output import (
+    MEAL_ANALYSIS_SCHEMA, SUGGESTIONS_SCHEMA, StructuredOutputError, loads_lenient, repair_json, validate,
+)
+
+
+# repair_json
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Voici le résultat : {"a": 1} merci', {"a": 1}),
+    ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+    ('{“a”: “b”}', {"a": "b"}),
+    ('{"a": True, "b": False, "c": None}', {"a": True, "b": False, "c": None}),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_keeps_literals_inside_strings():
+    text = '{"a": "True story", "b": "None of these", "c": Nonesuch}'
+    assert repair_json(text) == '{"a": "True story", "b": "None of these", "c": Nonesuch}'
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"a": "tom', {"a": "tom"}),
+    ('{"a": 1, "b"', {"a": 1}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": {"b": 1}, ', {"a": {"b": 1}}),
+])
+def test_repair_json_closes_truncated_response(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_without_object():
+    with pytest.raises(StructuredOutputError):
+        repair_json("Je ne peux pas analyser cette image.")
+
+
+# loads_lenient
+
+def test_loads_lenient_reports_repair():
+    assert loads_lenient('{"a": 1}') == ({"a": 1}, False)
+    assert loads_lenient('{"a": 1,}') == ({"a": 1}, True)
+
+
+def test_loads_lenient_python_dict_keeps_strings():
+    text = "{'a': 'nullified true story', 'b': 'trueffle', 'c': true, 'd': null, 'e': 'None of these'}"
+    data, repaired = loads_lenient(text)
+    assert repaired
+    assert data == {"a": "nullified true story", "b": "trueffle", "c": True, "d": None, "e": "None of these"}
+
+
+@pytest.mark.parametrize("text", ['{"a": 1 "b": 2}', '{"a": é}', '{"a": Œuf, "b": True}'])
+def test_loads_lenient_unrepairable(text):
+    with pytest.raises(StructuredOutputError):
+        loads_lenient(text)
+
+
+# validate
+
+def test_validate_fills_defaults():
+    data = {"dish_name": "Salade"}
+    assert validate(data, SUGGESTIONS_SCHEMA) == []
+    assert data["add_health"] == [] and data["remove_calories"] == []
+    data["add_health"].append("tomate")
+    assert SUGGESTIONS_SCHEMA["properties"]["add_health"]["default"] == []
+
+
+def test_validate_coerces_common_mistakes():
+    data = {"dish_name": 42, "add_health": "tomate"}
+    assert validate(data, SUGGESTIONS_SCHEMA) == []
+    assert data["dish_name"] == "42"
+    assert data["add_health"] == ["tomate"]
+
+    number = {"type": "object", "properties": {"grams": {"type": "number"}, "count": {"type": "integer"}}}
+    data = {"grams": "150,5 g", "count": "2 portions"}
+    assert validate(data, number) == []
+    assert data == {"grams": 150.5, "count": 2}
+
+
+def test_validate_reports_errors():
+    assert validate({}, SUGGESTIONS_SCHEMA) == ["$: missing 'dish_name'"]
+    assert validate([], SUGGESTIONS_SCHEMA) == ["$: expected object, got list"]
+    errors = validate({"dish_name": "x", "add_health": [1, {"a": 1}]}, SUGGESTIONS_SCHEMA)
+    assert errors == ["$.add_health[1]: expected string, got dict"]
+
+
+def test_validate_rejects_bool_for_number():
+    schema = {"type": "object", "properties": {"grams": {"type": "number"}}}
+    assert validate({"grams": True}, schema) == ["$.grams: expected number, got bool"]
+
+
+def test_validate_nested_schema():
+    data = {"ingredients": [{"nom": "riz", "quantite": "150 g"}, {"nom": "sel"}],
+            "valeurs_nutritionnelles": {"calories": "520 kcal"}}
+    assert validate(data, MEAL_ANALYSIS_SCHEMA) == ["$.ingredients[1]: missing 'quantite'"]
+    assert data["ingredients"][0]["quantite"] == 150.0
+    assert data["valeurs_nutritionnelles"] == {"calories": 520.0, "proteines": 0, "glucides": 0,
+                                               "lipides": 0, "fibres": 0}
+    assert data["suggestions"] == {"ajouts": [], "remplacements": []}
@@ -0,0 +1,278 @@
+"""
+Limeat - Traces des étapes du pipeline d'analyse (spans imbriqués), profilage
+échantillonné et export JSON / OTLP
+
+    with span("scoring", meal_size=len(meal)):
+        ...
+
+    @traced("vision.request")
+    def request_meal_analysis(...):
+        ...
+
+Un span ouvert hors de toute trace en démarre une nouvelle ; à la fermeture du
+span racine, la trace est conservée en mémoire (recent_traces) et exportée si
+LIMEAT_TRACE_EXPORT vaut "json" ou "otlp".
+"""
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+TRACING_ENABLED = os.getenv("LIMEAT_TRACING", "1") == "1"
+# "" (pas d'export), "json" (une trace par ligne) ou "otlp" (ExportTraceServiceRequest JSON par ligne)
+TRACE_EXPORT = os.getenv("LIMEAT_TRACE_EXPORT", "")
+TRACE_LOG = os.getenv("LIMEAT_TRACE_LOG", "logs/traces.jsonl")
+# Part des traces profilées, et profileur utilisé ("cprofile" ou "pyinstrument")
+PROFILE_SAMPLE_RATE = float(os.getenv("LIMEAT_PROFILE_SAMPLE_RATE", 0))
+PROFILER = os.getenv("LIMEAT_PROFILER", "cprofile")
+PROFILES_DIR = Path(TRACE_LOG).parent / "profiles"
+MAX_RECENT_TRACES = 100
+SERVICE_NAME = "limeat"
+
+
+@dataclass
+class Span:
+    """Étape chronométrée d'une trace"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+    depth: int = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@dataclass
+class Trace:
+    """Spans d'une même requête, dans l'ordre d'ouverture"""
+    trace_id: str
+    spans: List[Span] = field(default_factory=list)
+    profile: Optional[str] = None
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+    def breakdown(self) -> List[Dict]:
+        """Une ligne par span : durée, part du total et temps propre (hors sous-spans)"""
+        children_ms: Dict[str, float] = {}
+        for s in self.spans:
+            if s.parent_id is not None:
+                children_ms[s.parent_id] = children_ms.get(s.parent_id, 0.0) + s.duration_ms
+        total = self.duration_ms or 1.0
+        return [{
+            "span": "  " * s.depth + s.name,
+            "ms": round(s.duration_ms, 2),
+            "self_ms": round(s.duration_ms - children_ms.get(s.span_id, 0.0), 2),
+            "share": round(s.duration_ms / total, 3),
+            "error": s.error,
+        } for s in self.spans]
+
+    def to_json(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "duration_ms": self.duration_ms,
+            "profile": self.profile,
+            "spans": [{
+                "name": s.name, "span_id": s.span_id, "parent_id": s.parent_id,
+                "start_unix_ns": s.start_ns, "duration_ms": s.duration_ms,
+                "attributes": s.attributes, "error": s.error,
+            } for s in self.spans],
+        }
+
+    def to_otlp(self) -> Dict:
+        """Format OTLP/JSON (ExportTraceServiceRequest), lisible par un collecteur OpenTelemetry"""
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "limeat.tracing"},
+                "spans": [{
+                    "traceId": self.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": _otlp_attributes(s.attributes),
+                    "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                } for s in self.spans],
+            }],
+        }]}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    values = []
+    for key, value in attributes.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        values.append({"key": key, "value": typed})
+    return values
+
+
+class TraceExporter:
+    """Ajoute les traces terminées à un fichier JSONL"""
+
+    def __init__(self, path: str = TRACE_LOG, fmt: str = TRACE_EXPORT):
+        self.path = Path(path)
+        self.fmt = fmt
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        if self.fmt not in ("json", "otlp"):
+            return
+        payload = trace.to_otlp() if self.fmt == "otlp" else trace.to_json()
+        line = json.dumps(payload, ensure_ascii=False, default=str)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("limeat_span", default=None)
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("limeat_trace", default=None)
+_recent: deque = deque(maxlen=MAX_RECENT_TRACES)
+_exporter = TraceExporter()
+_rng = random.Random()
+# Un seul profileur actif à la fois dans le processus
+_profiler_lock = threading.Lock()
+
+
+def set_exporter(exporter: TraceExporter):
+    global _exporter
+    _exporter = exporter
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Chronomètre un bloc ; démarre une nouvelle trace s'il n'y a pas de span parent"""
+    if not TRACING_ENABLED:
+        yield Span(name, "", "")
+        return
+
+    parent = _current_span.get()
+    trace = _current_trace.get() if parent is not None else None
+    is_root = trace is None
+    if is_root:
+        trace = Trace(trace_id=secrets.token_hex(16))
+    current = Span(name, trace.trace_id, secrets.token_hex(8), parent.span_id if parent else None,
+                   attributes=dict(attributes), depth=parent.depth + 1 if parent else 0)
+    trace.spans.append(current)
+
+    span_token = _current_span.set(current)
+    trace_token = _current_trace.set(trace) if is_root else None
+    profiler = _start_profiler() if is_root else None
+    current.start_ns = time.time_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(span_token)
+        if is_root:
+            _current_trace.reset(trace_token)
+            if profiler is not None:
+                trace.profile = _stop_profiler(profiler, trace.trace_id)
+            _recent.append(trace)
+            _exporter.export(trace)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Décorateur : chaque appel de la fonction devient un span"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def recent_traces(limit: int = 10) -> List[Trace]:
+    """Dernières traces terminées du processus, la plus récente en premier"""
+    return list(_recent)[::-1][:limit]
+
+
+def _start_profiler():
+    if PROFILE_SAMPLE_RATE <= 0 or _rng.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    if PROFILER == "pyinstrument" and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+    else:
+        profiler = cProfile.Profile()
+    try:
+        profiler.start() if hasattr(profiler, "start") else profiler.enable()
+    except ValueError:  # un autre outil de profilage est déjà actif
+        _profiler_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler, trace_id: str) -> str:
+    """Arrête le profileur et enregistre son rapport ; renvoie le chemin du fichier"""
+    try:
+        PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path = PROFILES_DIR / f"{trace_id}.prof"
+            profiler.dump_stats(path)
+            # Résumé texte à côté du fichier binaire, lisible sans snakeviz
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            path.with_suffix(".txt").write_text(summary.getvalue(), encoding="utf-8")
+        else:
+            profiler.stop()
+            path = PROFILES_DIR / f"{trace_id}.html"
+            path.write_text(profiler.output_html(), encoding="utf-8")
+        return str(path)
+    finally:
+        _profiler_lock.release()